@@ -0,0 +1,71 @@
+import argparse
+import asyncio
+import os
+import resource
+import tempfile
+import time
+import numpy as np
+
+# Streams synthetic CSV files of increasing size through the /analyze_sleep/bulk pipeline
+# (chunked read, per-row validation, vectorized scoring, encoding) and reports throughput
+# and peak RSS growth. Peak RSS should stay roughly flat as the row count grows, since only
+# one chunk is held at a time. The generator is driven directly on the file on disk, as the
+# endpoint does with a spooled upload: httpx's ASGI transport buffers whole request and
+# response bodies, which would hide the server's own memory profile.
+
+HEADER = "age,gender,sleep_duration_hr,heart_rate,stress_level,rem_percent,deep_percent,awakenings\n"
+
+def write_csv(path, rows, seed=42):
+    rng = np.random.default_rng(seed)
+    genders = np.array(['Male', 'Female', 'Other'])
+    with open(path, "w") as f:
+        f.write(HEADER)
+        for start in range(0, rows, 10000):
+            n = min(10000, rows - start)
+            cols = (rng.integers(18, 80, n), genders[rng.integers(0, 3, n)], rng.uniform(4, 10, n),
+                    rng.uniform(48, 90, n), rng.uniform(0, 10, n), rng.uniform(10, 35, n),
+                    rng.uniform(5, 30, n), rng.integers(0, 6, n))
+            f.writelines(f"{a},{g},{d:.2f},{h:.0f},{s:.1f},{r:.1f},{dp:.1f},{w}\n" for a, g, d, h, s, r, dp, w in zip(*cols))
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+async def run_bulk(sizes, chunk_rows, output):
+    from src.main import app, model_registry, stream_bulk_scores, wait_until_ready
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        await wait_until_ready()
+        with tempfile.TemporaryDirectory() as tmp:
+            for rows in sizes:
+                path = os.path.join(tmp, f"bulk_{rows}.csv")
+                write_csv(path, rows)
+                rss_before = peak_rss_mb()
+                t0 = time.perf_counter()
+                lines = 0
+                with open(path, "rb") as f:
+                    # The output is consumed incrementally and discarded
+                    async for chunk in stream_bulk_scores(f, "csv", output, chunk_rows, model_registry.active):
+                        lines += chunk.count(b"\n")
+                elapsed = time.perf_counter() - t0
+                results[f"rows_{rows}"] = {
+                    "seconds": round(elapsed, 3),
+                    "rows_per_s": round(rows / elapsed, 1),
+                    "file_mb": round(os.path.getsize(path) / 1024 / 1024, 2),
+                    "result_lines": lines,
+                    "peak_rss_growth_mb": round(peak_rss_mb() - rss_before, 1),
+                }
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and memory of streaming bulk scoring")
+    parser.add_argument('--sizes', default='10000,100000,500000', help="Comma-separated row counts")
+    parser.add_argument('--chunk-rows', type=int, default=2000)
+    parser.add_argument('--output', choices=['ndjson', 'csv'], default='ndjson')
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',')]
+    results = asyncio.run(run_bulk(sizes, args.chunk_rows, args.output))
+    print(f"{'rows':>9} {'file MB':>8} {'seconds':>8} {'rows/s':>9} {'RSS growth MB':>14}")
+    for name, r in results.items():
+        print(f"{name[5:]:>9} {r['file_mb']:8.2f} {r['seconds']:8.2f} {r['rows_per_s']:9.0f} {r['peak_rss_growth_mb']:14.1f}")
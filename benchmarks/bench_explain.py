@@ -0,0 +1,104 @@
+import argparse
+import asyncio
+import sys
+import time
+import numpy as np
+from benchmarks.bench_response import make_payloads
+from benchmarks.harness import summarize
+
+# Added latency of ?explain=true on /analyze_sleep (uncached) and on a batch, through the full
+# ASGI stack, plus the cached case. The p50 difference against the same request without
+# explain is checked against the documented budget; exits with status 1 when it's exceeded.
+# Also checks that every explanation adds up to its score.
+
+API_KEY = "dev-key-12345"
+# Documented in the README (API section 1): added p50 latency, in ms
+SINGLE_BUDGET_MS = 2.0
+BATCH_BUDGET_MS = 10.0
+
+async def timed(send, count):
+    latencies = []
+    for i in range(count):
+        t0 = time.perf_counter()
+        r = await send(i)
+        latencies.append(time.perf_counter() - t0)
+        r.raise_for_status()
+    return summarize(latencies), r
+
+def sum_error(analyses):
+    # |base + contributions - score| for unclipped scores
+    errors = [abs(a["explanation"]["base_score"] + sum(a["explanation"]["contributions"].values()) - a["sleep_score"])
+              for a in analyses if 0 < a["sleep_score"] < 100]
+    return max(errors) if errors else 0.0
+
+async def bench_explain(requests, batch_size):
+    import httpx
+    import src.main as main
+
+    payloads = make_payloads(max(requests, batch_size) + 10, seed=3)
+    headers = {"X-API-KEY": API_KEY}
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        await main.wait_until_ready()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            def single(explain):
+                # Distinct payloads, so neither the response nor the explanation cache answers
+                return lambda i: client.post(f"/analyze_sleep?use_cache=false&explain={explain}", json=payloads[i], headers=headers)
+
+            def batch(explain):
+                return lambda i: client.post(f"/analyze_sleep/batch?explain={explain}", json=payloads[:batch_size], headers=headers)
+
+            batch_count = max(5, requests // 20)
+            for name, send, count in (("single", single, requests), (f"batch_{batch_size}", batch, batch_count)):
+                for explain in ("false", "true"):
+                    main.explanation_cache.clear()
+                    await send(explain)(0)  # warmup
+                    main.explanation_cache.clear()
+                    if name == "single":
+                        stats, _ = await timed(lambda i: send(explain)(i + 1), count)
+                    else:
+                        # Cleared before every call, so each batch is explained from scratch
+                        async def uncached(i, send=send(explain)):
+                            main.explanation_cache.clear()
+                            return await send(i)
+                        stats, r = await timed(uncached, count)
+                        if explain == "true":
+                            stats["max_sum_error"] = sum_error([item["result"] for item in r.json()["results"]])
+                    results[f"{name}_{'explain' if explain == 'true' else 'plain'}"] = stats
+                # Repeated inputs: every explanation comes from the cache
+                stats, _ = await timed(lambda i: send("true")(0), count)
+                results[f"{name}_explain_cached"] = stats
+    return results
+
+def check_budget(results, batch_size, single_budget, batch_budget):
+    failures = []
+    for name, budget in (("single", single_budget), (f"batch_{batch_size}", batch_budget)):
+        added = results[f"{name}_explain"]["p50_ms"] - results[f"{name}_plain"]["p50_ms"]
+        results[f"{name}_explain"]["added_p50_ms"] = round(added, 4)
+        results[f"{name}_explain"]["budget_ms"] = budget
+        if added > budget:
+            failures.append(f"{name}: explain adds {added:.2f} ms at p50, budget is {budget:.2f} ms")
+    return failures
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Added latency of ?explain=true against its budget")
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--budget-ms', type=float, default=SINGLE_BUDGET_MS, help="Allowed added p50 for one record")
+    parser.add_argument('--batch-budget-ms', type=float, default=BATCH_BUDGET_MS, help="Allowed added p50 for a batch")
+    args = parser.parse_args()
+
+    results = asyncio.run(bench_explain(args.requests, args.batch_size))
+    failures = check_budget(results, args.batch_size, args.budget_ms, args.batch_budget_ms)
+    print(f"{'case':>26} {'p50 ms':>9} {'p95 ms':>9} {'added ms':>9} {'budget':>7}")
+    for name, r in results.items():
+        added = r.get("added_p50_ms")
+        print(f"{name:>26} {r['p50_ms']:9.4f} {r['p95_ms']:9.4f} {'' if added is None else f'{added:9.4f}':>9} {r.get('budget_ms', ''):>7}")
+    max_error = max(r.get("max_sum_error", 0.0) for r in results.values())
+    print(f"max |base + contributions - score|: {max_error:.2e}")
+    if max_error > 1e-6:
+        failures.append("explanations don't add up to the score")
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
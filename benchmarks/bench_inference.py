@@ -0,0 +1,60 @@
+import argparse
+import time
+from types import SimpleNamespace
+import joblib
+import numpy as np
+import pandas as pd
+from src.serving_model import compile_pipeline
+
+FEATURES = ['age', 'gender', 'sleep_duration_hr', 'heart_rate', 'stress_level', 'rem_percent', 'deep_percent', 'awakenings']
+
+def make_records(n, seed=42):
+    # Validated SleepInput-like objects, as the API hands them to the model
+    rng = np.random.default_rng(seed)
+    records = []
+    for _ in range(n):
+        records.append(SimpleNamespace(
+            age=int(rng.integers(18, 80)),
+            gender=str(rng.choice(['Male', 'Female', 'Other'])),
+            sleep_duration_hr=float(rng.uniform(4, 10)),
+            heart_rate=float(rng.uniform(48, 90)) if rng.random() > 0.1 else None,
+            stress_level=float(rng.uniform(0, 10)),
+            rem_percent=float(rng.uniform(10, 35)) if rng.random() > 0.1 else None,
+            deep_percent=float(rng.uniform(5, 30)) if rng.random() > 0.1 else None,
+            awakenings=float(rng.integers(0, 6)),
+        ))
+    return records
+
+def sklearn_predict(pipeline, records):
+    # The pre-compiled path in src/main.py: DataFrame construction + Pipeline.predict
+    frame = pd.DataFrame([{f: getattr(r, f) for f in FEATURES} for r in records], columns=FEATURES)
+    return pipeline.predict(frame)
+
+def time_call(fn, repeat):
+    fn()  # warm-up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return float(np.median(times))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-request latency of the sklearn pipeline vs the compiled NumPy predictor")
+    parser.add_argument('--model', default='models/sleep_model_pipeline.pkl')
+    parser.add_argument('--batch-sizes', default='1,100,10000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    pipeline = joblib.load(args.model)
+    compiled = compile_pipeline(pipeline)
+
+    print(f"{'batch':>7} {'sklearn ms':>11} {'numpy ms':>9} {'speedup':>8} {'max |diff|':>11}")
+    for size in (int(s) for s in args.batch_sizes.split(',')):
+        records = make_records(size)
+        # Fewer repeats for large batches keep the run short
+        repeat = max(3, args.repeat if size <= 1000 else args.repeat // 4)
+        t_sklearn = time_call(lambda: sklearn_predict(pipeline, records), repeat)
+        t_numpy = time_call(lambda: compiled.predict_records(records), repeat)
+        diff = np.abs(sklearn_predict(pipeline, records) - compiled.predict_records(records)).max()
+        print(f"{size:>7} {t_sklearn * 1000:11.3f} {t_numpy * 1000:9.3f} {t_sklearn / t_numpy:7.1f}x {diff:11.2e}")
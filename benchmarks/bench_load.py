@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import tempfile
+import time
+import zipfile
+from benchmarks.harness import summarize
+from benchmarks.synthetic_export import write_synthetic_export
+
+# In-process ASGI load test: requests go through the full FastAPI stack (routing,
+# validation, middleware, worker pools) via httpx's ASGI transport, with no server or network.
+# The upload cache is disabled by default so every upload is actually parsed.
+
+API_KEY = os.getenv("API_KEY", "dev-key-12345")
+PAYLOAD_PATH = "tests/example_payload.json"
+
+def build_export_zip(nights, hr_per_night, other_per_night):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.xml")
+        write_synthetic_export(path, nights=nights, hr_per_night=hr_per_night, other_per_night=other_per_night)
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.write(path, "apple_health_export/export.xml")
+    return buf.getvalue()
+
+async def run_level(send, concurrency, total):
+    # `concurrency` clients issue requests back to back until `total` have been sent.
+    # Percentiles cover successful responses; rejections (e.g. 503 backpressure) count as errors.
+    latencies = []
+    statuses = {}
+    remaining = total
+
+    async def client():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            t0 = time.perf_counter()
+            status = await send()
+            if status < 400:
+                latencies.append(time.perf_counter() - t0)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    wall = time.perf_counter() - t0
+    result = summarize(latencies)
+    result["requests_per_s"] = round(total / wall, 2)
+    result["error_rate"] = round(sum(n for s, n in statuses.items() if s >= 400) / total, 4)
+    return result, statuses
+
+async def run_load(concurrencies=(1, 8, 32), requests=200, upload_concurrencies=(1, 2, 4), upload_requests=40,
+                   nights=30, hr_per_night=120, other_per_night=500):
+    import httpx
+    import src.main as main
+    from src.main import app, wait_until_ready
+    from src.upload_cache import UploadResultCache
+
+    # Installed here rather than through the environment at import, since src.main may
+    # already be imported (run_suite runs the microbenchmarks first)
+    main.upload_cache = UploadResultCache(int(os.getenv("SLEEPINSIGHT_UPLOAD_CACHE_MAX_BYTES", "0")))
+
+    headers = {"X-API-KEY": API_KEY}
+    with open(PAYLOAD_PATH) as f:
+        payload = json.load(f)
+    export_zip = build_export_zip(nights, hr_per_night, other_per_night)
+
+    async with app.router.lifespan_context(app):
+        await wait_until_ready()
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            async def analyze():
+                r = await client.post("/analyze_sleep?use_cache=false", json=payload, headers=headers)
+                return r.status_code
+
+            async def analyze_cached():
+                r = await client.post("/analyze_sleep", json=payload, headers=headers)
+                return r.status_code
+
+            async def upload():
+                r = await client.post("/upload_health", files={"file": ("export.zip", export_zip)}, headers=headers)
+                return r.status_code
+
+            # Uploads get their own levels: beyond the parse pool's workers + queue they are shed with 503
+            scenarios = [("analyze_sleep", analyze, concurrencies, requests),
+                         ("analyze_sleep_cached", analyze_cached, concurrencies, requests),
+                         ("upload_health", upload, upload_concurrencies, upload_requests)]
+            results = {}
+            for name, send, levels, total in scenarios:
+                # Warm-up: pools spawn their workers and the model pages in before measuring
+                for _ in range(3):
+                    await send()
+                for concurrency in levels:
+                    result, statuses = await run_level(send, concurrency, total)
+                    results[f"{name}_c{concurrency}"] = result
+                    if set(statuses) != {200}:
+                        print(f"{name} c={concurrency}: status counts {statuses}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="In-process load test of /analyze_sleep and /upload_health")
+    parser.add_argument('--concurrency', default='1,8,32', help="Comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=200, help="Requests per level for /analyze_sleep")
+    parser.add_argument('--upload-concurrency', default='1,2,4', help="Comma-separated concurrency levels for /upload_health")
+    parser.add_argument('--upload-requests', type=int, default=40, help="Requests per level for /upload_health")
+    parser.add_argument('--nights', type=int, default=30, help="Nights in the uploaded synthetic export")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(',')]
+    upload_levels = [int(c) for c in args.upload_concurrency.split(',')]
+    results = asyncio.run(run_load(levels, args.requests, upload_levels, args.upload_requests, args.nights))
+    print(f"{'scenario':<28} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'req/s':>9} {'errors':>7}")
+    for name, r in results.items():
+        print(f"{name:<28} {r['p50_ms']:9.2f} {r['p95_ms']:9.2f} {r['p99_ms']:9.2f} {r['requests_per_s']:9.1f} {r['error_rate']:7.2%}")
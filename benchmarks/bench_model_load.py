@@ -0,0 +1,69 @@
+import argparse
+import json
+import subprocess
+import sys
+
+# Each measurement runs in a fresh interpreter so import and page-cache effects are
+# attributed to one artifact format, the way a new uvicorn worker would see them.
+PROBE = r"""
+import json, time
+t0 = time.perf_counter()
+import numpy as np
+import pandas as pd
+t_base = time.perf_counter()
+if FORMAT == 'serving':
+    from src.serving_model import load_serving_model
+    model = load_serving_model(PATH)
+else:
+    import joblib
+    model = joblib.load(PATH)
+t_load = time.perf_counter()
+frame = pd.DataFrame([{'age': 30, 'gender': 'Male', 'sleep_duration_hr': 7.5, 'heart_rate': 65.0,
+                       'stress_level': 3.0, 'rem_percent': 22.0, 'deep_percent': 18.0, 'awakenings': 1.0}])
+model.predict(frame)
+t_first = time.perf_counter()
+
+def proc_kb(path, key):
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith(key + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+print(json.dumps({
+    'base_import_s': t_base - t0,
+    'load_s': t_load - t_base,
+    'first_predict_s': t_first - t_load,
+    'rss_mb': (proc_kb('/proc/self/status', 'VmRSS') or 0) / 1024,
+    'pss_mb': (proc_kb('/proc/self/smaps_rollup', 'Pss') or 0) / 1024,
+}))
+"""
+
+def measure(fmt, path):
+    code = f"FORMAT = {fmt!r}\nPATH = {path!r}\n" + PROBE
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare cold-start time and memory of the pickle and serving model artifacts")
+    parser.add_argument('--pickle', default='models/sleep_model_pipeline.pkl')
+    parser.add_argument('--serving', default='models/sleep_model_serving')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = {}
+    for fmt, path in (('pickle', args.pickle), ('serving', args.serving)):
+        runs = [measure(fmt, path) for _ in range(args.repeat)]
+        # Median run by load time; memory is stable across runs
+        runs.sort(key=lambda r: r['load_s'])
+        results[fmt] = runs[len(runs) // 2]
+
+    print(f"{'format':>8} {'load ms':>9} {'1st pred ms':>12} {'RSS MB':>8} {'PSS MB':>8}")
+    for fmt, r in results.items():
+        print(f"{fmt:>8} {r['load_s'] * 1000:9.1f} {r['first_predict_s'] * 1000:12.1f} {r['rss_mb']:8.1f} {r['pss_mb']:8.1f}")
+    speedup = (results['pickle']['load_s'] + results['pickle']['first_predict_s']) / (results['serving']['load_s'] + results['serving']['first_predict_s'])
+    print(f"serving artifact reaches first prediction {speedup:.1f}x faster "
+          f"and uses {results['pickle']['rss_mb'] - results['serving']['rss_mb']:.1f} MB less RSS")
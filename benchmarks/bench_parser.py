@@ -0,0 +1,89 @@
+import argparse
+import os
+import resource
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.synthetic_export import write_synthetic_export
+from src.parse_apple_health import parse_health_data, iter_nightly_metrics
+
+def _run_engine(path, engine, mode, workers=1):
+    # Runs in a fresh process so peak RSS is attributable to one engine. With shard workers,
+    # the largest shard process is reported alongside the merging process.
+    t0 = time.perf_counter()
+    if mode == 'nightly':
+        result = list(iter_nightly_metrics(path, engine=engine, workers=workers))
+    else:
+        result = parse_health_data(path, engine=engine, workers=workers)
+    elapsed = time.perf_counter() - t0
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    shard_rss_mb = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return elapsed, max(peak_rss_mb, shard_rss_mb), result
+
+def bench(path, engines, mode, repeat):
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    results = {}
+    for engine in engines:
+        timings = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                elapsed, peak_rss_mb, result = pool.submit(_run_engine, path, engine, mode).result()
+            timings.append(elapsed)
+        best = min(timings)
+        results[engine] = {'seconds': best, 'mb_per_s': size_mb / best, 'peak_rss_mb': peak_rss_mb, 'result': result}
+        print(f"{engine:>6}: {best:8.2f}s  {size_mb / best:8.1f} MB/s  peak RSS {peak_rss_mb:8.1f} MB")
+
+    baseline = results[engines[0]]['result']
+    for engine in engines[1:]:
+        same = results[engine]['result'] == baseline
+        print(f"{engine} output identical to {engines[0]}: {same}")
+        speedup = results[engines[0]]['seconds'] / results[engine]['seconds']
+        print(f"{engine} speedup vs {engines[0]}: {speedup:.2f}x")
+    return results
+
+def bench_scaling(path, workers_list, mode, repeat):
+    # Sharded fast-engine parse at each worker count; output must match the first count's
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"{os.cpu_count()} CPUs available")
+    results = {}
+    for workers in workers_list:
+        timings = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                elapsed, peak_rss_mb, result = pool.submit(_run_engine, path, 'fast', mode, workers).result()
+            timings.append(elapsed)
+        best = min(timings)
+        results[workers] = {'seconds': best, 'mb_per_s': size_mb / best, 'peak_rss_mb': peak_rss_mb, 'result': result}
+
+    base = results[workers_list[0]]
+    for workers, r in results.items():
+        same = r['result'] == base['result']
+        print(f"{workers:>2} workers: {r['seconds']:8.2f}s  {r['mb_per_s']:8.1f} MB/s  "
+              f"speedup {base['seconds'] / r['seconds']:5.2f}x  peak RSS {r['peak_rss_mb']:8.1f} MB  identical: {same}")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare Apple Health parser engines on a synthetic export")
+    parser.add_argument('--export', help="Existing export.xml to benchmark instead of generating one")
+    parser.add_argument('--size-mb', type=float, default=200, help="Size of the generated export (use 2048 for a 2 GB run)")
+    parser.add_argument('--engines', default='etree,fast')
+    parser.add_argument('--mode', choices=['latest', 'nightly'], default='latest')
+    parser.add_argument('--repeat', type=int, default=1)
+    parser.add_argument('--workers', help="Comma-separated shard worker counts (e.g. 1,2,4,8) to measure "
+                                          "sharded-parse scaling instead of comparing engines")
+    args = parser.parse_args()
+
+    engines = args.engines.split(',')
+    if args.workers:
+        run = lambda path: bench_scaling(path, [int(w) for w in args.workers.split(',')], args.mode, args.repeat)
+    else:
+        run = lambda path: bench(path, engines, args.mode, args.repeat)
+    if args.export:
+        run(args.export)
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'export.xml')
+            info = write_synthetic_export(path, target_bytes=int(args.size_mb * 1024 * 1024))
+            print(f"Generated {info['nights']} nights, {info['bytes'] / 1024 / 1024:.1f} MB")
+            run(path)
@@ -0,0 +1,116 @@
+import argparse
+import asyncio
+import json
+import time
+import numpy as np
+from benchmarks.harness import summarize, time_calls
+
+# Compares the default response path (FastAPI re-validates the response model and serializes
+# it) with SLEEPINSIGHT_FAST_RESPONSES=1, which returns pre-encoded bytes. Serialization alone
+# is timed against FastAPI's serialize_response steps for each route's response model, then
+# whole requests go through the ASGI stack both ways. Every case also checks that both paths
+# produce byte-identical bodies.
+
+API_KEY = "dev-key-12345"
+PAYLOAD_PATH = "tests/example_payload.json"
+
+def make_payloads(count, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(PAYLOAD_PATH) as f:
+        base = json.load(f)
+    return [{**base, "sleep_duration_hr": round(float(d), 2), "heart_rate": round(float(h)), "deep_percent": round(float(p), 1)}
+            for d, h, p in zip(rng.uniform(4, 10, count), rng.uniform(48, 90, count), rng.uniform(5, 30, count))]
+
+def route_field(app, path):
+    for route in app.routes:
+        if getattr(route, "path", None) == path and "POST" in route.methods:
+            return route.response_field
+    raise KeyError(path)
+
+async def bench_serialization(repeat, batch_size, nights):
+    from fastapi.routing import serialize_response
+    from src.main import (app, encode_response, SleepInput, BatchAnalysisItem, BatchAnalysisResponse, NightAnalysis,
+                          SleepTimelineResponse, build_analyses, UPLOAD_DISCLAIMER)
+
+    payloads = make_payloads(max(batch_size, nights))
+    records = [SleepInput(**p) for p in payloads]
+    scores = np.random.default_rng(1).uniform(30, 95, len(records))
+    analyses = build_analyses(records[:batch_size], scores[:batch_size])
+    timeline = build_analyses(records[:nights], scores[:nights], UPLOAD_DISCLAIMER)
+    cases = {
+        "analysis": ("/analyze_sleep", analyses[0]),
+        f"batch_{batch_size}": ("/analyze_sleep/batch", BatchAnalysisResponse(
+            results=[BatchAnalysisItem(index=i, result=a) for i, a in enumerate(analyses)], succeeded=batch_size, failed=0)),
+        f"timeline_{nights}": ("/upload_health", SleepTimelineResponse(nights=[
+            NightAnalysis(night_start=f"2024-01-{i % 28 + 1:02d}T23:00:00+00:00", night_end=f"2024-01-{i % 28 + 2:02d}T07:00:00+00:00", analysis=a)
+            for i, a in enumerate(timeline)])),
+    }
+
+    results = {}
+    for name, (path, model) in cases.items():
+        field = route_field(app, path)
+        default_body = await serialize_response(field=field, response_content=model, dump_json=True)
+        loops = repeat * 10 if name == "analysis" else repeat
+
+        def run_default():
+            # serialize_response's steps, without the coroutine
+            return field.serialize_json(field.validate(model, {}, loc=("response",))[0])
+
+        results[f"{name}_default"] = time_calls(run_default, loops)
+        results[f"{name}_fast"] = time_calls(lambda: encode_response(model), loops)
+        results[f"{name}_fast"]["identical"] = encode_response(model) == default_body == run_default()
+        results[f"{name}_fast"]["bytes"] = len(default_body)
+    return results
+
+async def bench_requests(requests, batch_size):
+    import httpx
+    import src.main as main
+
+    payloads = make_payloads(max(requests, batch_size), seed=2)
+    headers = {"X-API-KEY": API_KEY}
+    results = {}
+    async with main.app.router.lifespan_context(main.app):
+        await main.wait_until_ready()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+            scenarios = {
+                "analyze_sleep": lambda i: client.post("/analyze_sleep?use_cache=false", json=payloads[i], headers=headers),
+                "analyze_sleep_cached": lambda i: client.post("/analyze_sleep", json=payloads[i % 10], headers=headers),
+                f"batch_{batch_size}": lambda i: client.post("/analyze_sleep/batch", json=payloads[:batch_size], headers=headers),
+            }
+            for name, send in scenarios.items():
+                bodies = {}
+                for fast in (False, True):
+                    main.FAST_RESPONSES = fast
+                    main.response_cache.clear()
+                    count = requests if name != f"batch_{batch_size}" else max(5, requests // 20)
+                    for i in range(min(count, 10)):
+                        await send(i)  # warmup (and fills the cache for the cached scenario)
+                    latencies = []
+                    for i in range(count):
+                        t0 = time.perf_counter()
+                        r = await send(i)
+                        latencies.append(time.perf_counter() - t0)
+                        r.raise_for_status()
+                    bodies[fast] = r.content
+                    results[f"{name}_{'fast' if fast else 'default'}"] = summarize(latencies)
+                results[f"{name}_fast"]["identical"] = bodies[True] == bodies[False]
+    return results
+
+def run_response(repeat=20, requests=300, batch_size=100, nights=30):
+    results = asyncio.run(bench_serialization(repeat, batch_size, nights))
+    results.update({f"request_{k}": v for k, v in asyncio.run(bench_requests(requests, batch_size)).items()})
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Latency and byte-identity of the fast response path")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--requests', type=int, default=300)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--nights', type=int, default=30)
+    args = parser.parse_args()
+
+    results = run_response(args.repeat, args.requests, args.batch_size, args.nights)
+    print(f"{'case':>36} {'p50 ms':>9} {'p95 ms':>9} {'identical':>10}")
+    for name, r in results.items():
+        print(f"{name:>36} {r['p50_ms']:9.4f} {r['p95_ms']:9.4f} {str(r.get('identical', '')):>10}")
@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from benchmarks.harness import summarize
+
+# Cold start of the API, each run in a fresh interpreter as a new instance would see it:
+#   - import time of src.main and which heavy modules it pulls in
+#   - a real uvicorn process: time until /livez answers (port bound) and until /readyz is 200
+#     (model loaded and warmed), then the first /analyze_sleep against steady-state latency
+
+API_KEY = "dev-key-12345"
+PAYLOAD_PATH = "tests/example_payload.json"
+HEAVY_MODULES = ("pandas", "sklearn", "scipy", "joblib")
+
+IMPORT_PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import src.main
+print(json.dumps({'import_s': time.perf_counter() - t0, 'heavy_modules': [m for m in HEAVY if m in sys.modules]}))
+"""
+
+def measure_import():
+    code = f"HEAVY = {HEAVY_MODULES!r}\n" + IMPORT_PROBE
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def wait_for(client, path, ok_status, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if client.get(path).status_code == ok_status:
+                return True
+        except Exception:
+            pass  # not listening yet
+        time.sleep(0.01)
+    return False
+
+def measure_server(requests, timeout=120):
+    import httpx
+
+    port = free_port()
+    with open(PAYLOAD_PATH) as f:
+        payload = json.load(f)
+    headers = {"X-API-KEY": API_KEY}
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "src.main:app", "--port", str(port), "--log-level", "warning"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env={**os.environ, "PYTHONPATH": os.getcwd()})
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            if not wait_for(client, "/livez", 200, timeout):
+                raise RuntimeError("Server never answered /livez")
+            live_s = time.perf_counter() - t0
+            if not wait_for(client, "/readyz", 200, timeout):
+                raise RuntimeError("Server never became ready")
+            ready_s = time.perf_counter() - t0
+
+            t = time.perf_counter()
+            client.post("/analyze_sleep?use_cache=false", json=payload, headers=headers).raise_for_status()
+            first_ms = (time.perf_counter() - t) * 1000
+            latencies = []
+            for _ in range(requests):
+                t = time.perf_counter()
+                client.post("/analyze_sleep?use_cache=false", json=payload, headers=headers).raise_for_status()
+                latencies.append(time.perf_counter() - t)
+    finally:
+        proc.terminate()
+        proc.wait()
+    steady = summarize(latencies)
+    return {"live_s": live_s, "ready_s": ready_s, "first_request_ms": first_ms, "steady_p50_ms": steady["p50_ms"]}
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def run_startup(repeat=3, requests=50):
+    imports = [measure_import() for _ in range(repeat)]
+    servers = [measure_server(requests) for _ in range(repeat)]
+    return {
+        "import": {"import_ms": round(median([r["import_s"] for r in imports]) * 1000, 1),
+                   "heavy_modules": imports[0]["heavy_modules"]},
+        "server": {
+            "live_ms": round(median([r["live_s"] for r in servers]) * 1000, 1),
+            "ready_ms": round(median([r["ready_s"] for r in servers]) * 1000, 1),
+            "first_request_ms": round(median([r["first_request_ms"] for r in servers]), 2),
+            "steady_p50_ms": round(median([r["steady_p50_ms"] for r in servers]), 2),
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import time, time to live/ready and first-request latency of the API")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=50, help="Requests after the first one for the steady-state p50")
+    args = parser.parse_args()
+    print(json.dumps(run_startup(args.repeat, args.requests), indent=2))
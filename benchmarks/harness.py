@@ -0,0 +1,96 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+# Shared timing, result-file and baseline-comparison helpers for the benchmark suite.
+# Results are flat {"<group>.<case>.<metric>": value} maps; metric names end in
+# '_ms' (lower is better) or '_per_s' (higher is better), which is how regressions are judged.
+
+def percentile(sorted_values, q):
+    # Linear interpolation between closest ranks, on an already sorted list
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q / 100
+    lo = int(pos)
+    hi = min(lo + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (pos - lo)
+
+def summarize(seconds):
+    values = sorted(s * 1000 for s in seconds)
+    return {
+        "p50_ms": round(percentile(values, 50), 4),
+        "p95_ms": round(percentile(values, 95), 4),
+        "p99_ms": round(percentile(values, 99), 4),
+        "mean_ms": round(sum(values) / len(values), 4) if values else 0.0,
+    }
+
+def time_calls(fn, repeat=20, warmup=2):
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return summarize(times)
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "git_commit": commit or None,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def flatten(group, results):
+    # {"case": {"p50_ms": ...}} -> {"group.case.p50_ms": ...}
+    return {f"{group}.{case}.{metric}": value for case, metrics in results.items() for metric, value in metrics.items()}
+
+def write_results(path, metrics, config):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"environment": environment(), "config": config, "metrics": metrics}, f, indent=2, sort_keys=True)
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+# Only medians and throughput gate a run; tail percentiles and means are reported but too
+# noisy on shared machines to fail on. Millisecond changes below MIN_DELTA_MS are ignored.
+GATED_SUFFIXES = ("p50_ms", "_per_s")
+MIN_DELTA_MS = 0.05
+
+def compare(metrics, baseline, tolerance=0.25):
+    # Returns one row per metric present in both runs: (name, baseline, current, change, regressed).
+    # change is the relative difference; the direction that counts as a regression depends on the unit.
+    rows = []
+    for name in sorted(set(metrics) & set(baseline)):
+        base, current = baseline[name], metrics[name]
+        if not base:
+            continue
+        change = (current - base) / base
+        regressed = False
+        if name.endswith(GATED_SUFFIXES):
+            if name.endswith("_per_s"):
+                regressed = change < -tolerance
+            else:
+                regressed = change > tolerance and current - base > MIN_DELTA_MS
+        rows.append((name, base, current, change, regressed))
+    return rows
+
+def print_comparison(rows):
+    print(f"{'metric':<58} {'baseline':>11} {'current':>11} {'change':>8}")
+    for name, base, current, change, regressed in rows:
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<58} {base:11.3f} {current:11.3f} {change * 100:+7.1f}%{flag}")
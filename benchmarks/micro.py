@@ -0,0 +1,75 @@
+import argparse
+import json
+import os
+import tempfile
+import numpy as np
+from benchmarks.harness import time_calls
+from benchmarks.synthetic_export import write_synthetic_export
+
+# Microbenchmarks of the hot functions behind the API, without HTTP in the way
+
+SAMPLE = {
+    "age": 30, "gender": "Male", "sleep_duration_hr": 7.5, "heart_rate": 65.0, "stress_level": 3.0,
+    "rem_percent": 22.0, "deep_percent": 18.0, "awakenings": 1.0, "breathing_disturbances_elevated": False,
+}
+
+def run_micro(nights=90, hr_per_night=120, other_per_night=500, repeat=20):
+    # Imported here so the parser and model load are not part of module import time
+    from src.main import SleepInput, build_analyses, build_model_frame, generate_detailed_analysis, model_registry
+    from src.parse_apple_health import parse_health_data, iter_nightly_metrics
+    from src.record_store import RecordStore
+    from src.serving_model import ServingModel, compile_pipeline
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "export.xml")
+        info = write_synthetic_export(path, nights=nights, hr_per_night=hr_per_night, other_per_night=other_per_night)
+        parse_repeat = max(3, repeat // 4)
+        results["parse_health_data"] = time_calls(lambda: parse_health_data(path), parse_repeat, warmup=1)
+        results["iter_nightly_metrics"] = time_calls(lambda: list(iter_nightly_metrics(path)), parse_repeat, warmup=1)
+        for name in ("parse_health_data", "iter_nightly_metrics"):
+            results[name]["throughput_mb_per_s"] = round(info["bytes"] / 1024 / 1024 / (results[name]["p50_ms"] / 1000), 2)
+
+        # Re-analysis from the record store instead of the export: one night, and the whole history
+        store = RecordStore(os.path.join(tmp, "records"))
+        parse_health_data(path, on_samples=lambda samples, since: store.write("bench", samples, since))
+        starts = sorted(store.query("bench").sleep_start)
+        night = (starts[len(starts) // 2], starts[len(starts) // 2] + 86400)
+        results["record_store_night"] = time_calls(lambda: store.query_nights("bench", *night), repeat * 10)
+        results["record_store_all_nights"] = time_calls(lambda: store.query_nights("bench"), repeat)
+
+    data = SleepInput(**SAMPLE)
+    results["generate_detailed_analysis"] = time_calls(lambda: generate_detailed_analysis(data, 72.0), repeat * 10)
+    # Per-response construction cost (rules, recommendations, summary) at increasing batch sizes.
+    # Repeated calls measure the steady state, with metric rows already cached.
+    rng = np.random.default_rng(0)
+    batch = [SleepInput(**{**SAMPLE, "sleep_duration_hr": round(float(d), 2), "heart_rate": round(float(h)), "deep_percent": round(float(p), 1)})
+             for d, h, p in zip(rng.uniform(4, 10, 1000), rng.uniform(48, 90, 1000), rng.uniform(5, 30, 1000))]
+    scores = rng.uniform(30, 95, 1000)
+    for size in (1, 100, 1000):
+        records, batch_scores = batch[:size], scores[:size]
+        results[f"build_analyses_b{size}"] = time_calls(lambda: build_analyses(records, batch_scores), max(3, repeat * 10 // size))
+        results[f"build_analyses_b{size}"]["per_response_ms"] = round(results[f"build_analyses_b{size}"]["p50_ms"] / size, 5)
+
+    # The app loads its model in the background at startup; load it directly here
+    if model_registry.active is None:
+        model_registry.check_for_update()
+    model = model_registry.active.model if model_registry.active else None
+    if model is not None:
+        pipeline = None if isinstance(model, ServingModel) else model
+        compiled = model if pipeline is None else compile_pipeline(pipeline)
+        for size in (1, 100):
+            records = [data] * size
+            if pipeline is not None:
+                results[f"predict_sklearn_b{size}"] = time_calls(lambda: pipeline.predict(build_model_frame(records)), repeat)
+            results[f"predict_numpy_b{size}"] = time_calls(lambda: compiled.predict_records(records), repeat)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks for parsing, analysis rules and model prediction")
+    parser.add_argument('--nights', type=int, default=90)
+    parser.add_argument('--hr-per-night', type=int, default=120)
+    parser.add_argument('--other-per-night', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run_micro(args.nights, args.hr_per_night, args.other_per_night, args.repeat), indent=2))
@@ -0,0 +1,65 @@
+import argparse
+import asyncio
+import os
+import sys
+from benchmarks.harness import compare, flatten, load_results, print_comparison, write_results
+from benchmarks.bench_load import run_load
+from benchmarks.micro import run_micro
+
+# Runs the microbenchmarks and the in-process load test, writes the results as JSON and
+# compares them with a stored baseline. Exits with status 1 when a metric regressed by
+# more than --tolerance, so it can gate CI. Baselines are machine-specific: record one
+# with --save-baseline on the machine that will run the comparison.
+#   python -m benchmarks.run_suite --save-baseline   # once, on a known-good commit
+#   python -m benchmarks.run_suite                   # later: compare against it
+
+DEFAULT_OUTPUT = "benchmarks/results/latest.json"
+DEFAULT_BASELINE = "benchmarks/results/baseline.json"
+
+PROFILES = {
+    # Short run for pre-commit checks; numbers are noisier
+    "quick": {"micro": {"nights": 30, "repeat": 10},
+              "load": {"concurrencies": [1, 8], "requests": 60, "upload_concurrencies": [1, 2], "upload_requests": 10, "nights": 14}},
+    "full": {"micro": {"nights": 90, "repeat": 30},
+             "load": {"concurrencies": [1, 8, 32], "requests": 300, "upload_concurrencies": [1, 2, 4], "upload_requests": 40, "nights": 30}},
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark suite with baseline comparison")
+    parser.add_argument('--profile', choices=sorted(PROFILES), default='full')
+    parser.add_argument('--only', choices=['micro', 'load'], help="Run a single group")
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="Store this run as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="Allowed relative slowdown before failing")
+    args = parser.parse_args()
+
+    config = PROFILES[args.profile]
+    metrics = {}
+    if args.only in (None, 'micro'):
+        print("Running microbenchmarks...")
+        metrics.update(flatten("micro", run_micro(**config["micro"])))
+    if args.only in (None, 'load'):
+        print("Running load test...")
+        metrics.update(flatten("load", asyncio.run(run_load(**config["load"]))))
+
+    write_results(args.output, metrics, {"profile": args.profile, **config})
+    print(f"Results written to {args.output}")
+    if args.save_baseline:
+        write_results(args.baseline, metrics, {"profile": args.profile, **config})
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        sys.exit(0)
+    baseline = load_results(args.baseline)
+    if baseline["config"].get("profile") != args.profile:
+        print(f"WARNING: baseline was recorded with the '{baseline['config'].get('profile')}' profile")
+    rows = compare(metrics, baseline["metrics"], args.tolerance)
+    print_comparison(rows)
+    regressions = [r for r in rows if r[4]]
+    if regressions:
+        print(f"{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}")
+        sys.exit(1)
+    print("No regressions")
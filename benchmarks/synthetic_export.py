@@ -0,0 +1,119 @@
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+# Trimmed version of the DOCTYPE Apple ships at the top of export.xml
+HEADER = """<?xml version="1.0" encoding="UTF-8"?>
+<!DOCTYPE HealthData [
+<!ELEMENT HealthData (ExportDate,Me,(Record|Correlation|Workout|ActivitySummary)*)>
+<!ATTLIST HealthData locale CDATA #REQUIRED>
+<!ELEMENT ExportDate EMPTY>
+<!ATTLIST ExportDate value CDATA #REQUIRED>
+<!ELEMENT Me EMPTY>
+<!ATTLIST Me
+  HKCharacteristicTypeIdentifierDateOfBirth CDATA #REQUIRED
+  HKCharacteristicTypeIdentifierBiologicalSex CDATA #REQUIRED
+>
+<!ELEMENT Record ((MetadataEntry|HeartRateVariabilityMetadataList)*)>
+<!ELEMENT MetadataEntry EMPTY>
+<!ATTLIST MetadataEntry key CDATA #REQUIRED value CDATA #REQUIRED>
+<!ELEMENT Correlation ((MetadataEntry|Record)*)>
+]>
+<HealthData locale="en_US">
+ <ExportDate value="{export_date}"/>
+ <Me HKCharacteristicTypeIdentifierDateOfBirth="1990-05-01" HKCharacteristicTypeIdentifierBiologicalSex="HKBiologicalSexFemale" HKCharacteristicTypeIdentifierBloodType="HKBloodTypeNotSet" HKCharacteristicTypeIdentifierFitzpatrickSkinType="HKFitzpatrickSkinTypeNotSet" HKCharacteristicTypeIdentifierCardioFitnessMedicationsUse="None"/>
+"""
+
+DEVICE = "&lt;&lt;HKDevice: 0x283a0c0a0&gt;, name:Apple Watch, manufacturer:Apple Inc., model:Watch, hardware:Watch6,1, software:9.1&gt;"
+
+HEART_RATE = (' <Record type="HKQuantityTypeIdentifierHeartRate" sourceName="Apple Watch" sourceVersion="9.1" device="' + DEVICE + '"'
+              ' unit="count/min" creationDate="{t}" startDate="{t}" endDate="{t}" value="{v}">\n'
+              '  <MetadataEntry key="HKMetadataKeyHeartRateMotionContext" value="0"/>\n'
+              ' </Record>\n')
+SLEEP = (' <Record type="HKCategoryTypeIdentifierSleepAnalysis" sourceName="Apple Watch" sourceVersion="9.1" device="' + DEVICE + '"'
+         ' creationDate="{e}" startDate="{s}" endDate="{e}" value="HKCategoryValueSleepAnalysis{stage}"/>\n')
+OTHER = ' <Record type="{type}" sourceName="iPhone" sourceVersion="16.1" unit="{unit}" creationDate="{t}" startDate="{t}" endDate="{t}" value="{v}"/>\n'
+RESPIRATORY_RATE = (' <Record type="HKQuantityTypeIdentifierRespiratoryRate" sourceName="Apple Watch" sourceVersion="9.1" device="' + DEVICE + '"'
+                    ' unit="count/min" creationDate="{t}" startDate="{t}" endDate="{t}" value="{v}"/>\n')
+HRV = (' <Record type="HKQuantityTypeIdentifierHeartRateVariabilitySDNN" sourceName="Apple Watch" sourceVersion="9.1" device="' + DEVICE + '"'
+       ' unit="ms" creationDate="{t}" startDate="{t}" endDate="{t}" value="{v}">\n'
+       '  <HeartRateVariabilityMetadataList>\n'
+       '   <InstantaneousBeatsPerMinute bpm="62" time="1:02:03.45 AM"/>\n'
+       '  </HeartRateVariabilityMetadataList>\n'
+       ' </Record>\n')
+CORRELATION = (' <Correlation type="HKCorrelationTypeIdentifierBloodPressure" sourceName="Omron" creationDate="{t}" startDate="{t}" endDate="{t}">\n'
+               '  <Record type="HKQuantityTypeIdentifierBloodPressureSystolic" sourceName="Omron" unit="mmHg" creationDate="{t}" startDate="{t}" endDate="{t}" value="{v}"/>\n'
+               ' </Correlation>\n')
+
+OTHER_TYPES = [
+    ('HKQuantityTypeIdentifierStepCount', 'count'),
+    ('HKQuantityTypeIdentifierActiveEnergyBurned', 'Cal'),
+    ('HKQuantityTypeIdentifierDistanceWalkingRunning', 'km'),
+    ('HKQuantityTypeIdentifierBasalEnergyBurned', 'Cal'),
+]
+STAGES = ['InBed', 'AsleepCore', 'AsleepDeep', 'AsleepCore', 'AsleepREM', 'Awake', 'AsleepCore', 'AsleepREM']
+
+def _fmt(t: datetime) -> str:
+    return t.strftime('%Y-%m-%d %H:%M:%S -0500')
+
+def write_synthetic_export(path, nights=30, hr_per_night=120, other_per_night=500, target_bytes=None, seed=42, vitals_per_night=6):
+    # Writes an Apple-Health-shaped export.xml. With target_bytes set, nights keep being
+    # generated until the file reaches that size, which is how multi-GB exports are produced.
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1, 23, 0, 0)
+    written = 0
+    night = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        written += f.write(HEADER.format(export_date=_fmt(start)))
+        while (night < nights) if target_bytes is None else (written < target_bytes):
+            base = start + timedelta(days=night, minutes=rng.randint(-60, 60))
+            lines = []
+
+            # Unrelated records spread over the day before the night
+            t = base - timedelta(hours=16)
+            for i in range(other_per_night):
+                rec_type, unit = OTHER_TYPES[i % len(OTHER_TYPES)]
+                t += timedelta(seconds=rng.randint(30, 110))
+                lines.append(OTHER.format(type=rec_type, unit=unit, t=_fmt(t), v=rng.randint(1, 500)))
+            if night % 7 == 0:
+                lines.append(CORRELATION.format(t=_fmt(t), v=rng.randint(100, 140)))
+
+            # Heart-rate samples from the evening through the night
+            t = base - timedelta(hours=2)
+            for _ in range(hr_per_night):
+                t += timedelta(seconds=rng.randint(60, 300))
+                lines.append(HEART_RATE.format(t=_fmt(t), v=rng.randint(48, 85)))
+
+            # A few respiratory-rate and HRV readings during the night
+            for i in range(vitals_per_night):
+                t = base + timedelta(minutes=30 + i * 40)
+                lines.append(RESPIRATORY_RATE.format(t=_fmt(t), v=round(rng.uniform(11, 19), 1)))
+                if i % 2 == 0:
+                    lines.append(HRV.format(t=_fmt(t), v=round(rng.uniform(20, 90), 3)))
+
+            # One night of sleep-stage segments
+            t = base
+            for stage in STAGES:
+                end = t + timedelta(minutes=rng.randint(15, 90))
+                lines.append(SLEEP.format(s=_fmt(t), e=_fmt(end), stage=stage))
+                t = end
+
+            written += f.write(''.join(lines))
+            night += 1
+        written += f.write('</HealthData>\n')
+    return {'path': path, 'nights': night, 'bytes': written}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic Apple Health export.xml")
+    parser.add_argument('output')
+    parser.add_argument('--nights', type=int, default=30)
+    parser.add_argument('--hr-per-night', type=int, default=120)
+    parser.add_argument('--other-per-night', type=int, default=500)
+    parser.add_argument('--size-mb', type=float, default=None, help="Generate until the file reaches this size")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    target = int(args.size_mb * 1024 * 1024) if args.size_mb else None
+    info = write_synthetic_export(args.output, args.nights, args.hr_per_night, args.other_per_night, target, args.seed)
+    print(f"Wrote {info['nights']} nights ({info['bytes'] / 1024 / 1024:.1f} MB) to {os.path.abspath(args.output)}")
@@ -0,0 +1,209 @@
+import sys
+from bisect import bisect_right
+import numpy as np
+
+# Declarative thresholds behind the detailed analysis, recommendations and summary of every
+# endpoint. Rules are evaluated over NumPy columns, so a batch is classified with a few array
+# operations instead of an if-chain per record. Interpretation strings are
+# interned once here; only templates containing {value} are formatted per row.
+
+DISCLAIMER = "SleepInsight AI is an informational tool. These findings are NOT a medical diagnosis. Consult a doctor for health concerns."
+UPLOAD_DISCLAIMER = "This analysis is based on uploaded Apple Health data. " + DISCLAIMER
+
+def _band_thresholds(edges) -> list:
+    # (">=", 7) passes values of 7 and above, (">", 9) only values above 9. Strict edges become
+    # the next float up, so every band is a count of ">=" thresholds reached.
+    return [float(edge) if op == ">=" else float(np.nextafter(edge, np.inf)) for op, edge in edges]
+
+class MetricRule:
+    def __init__(self, metric: str, field: str, unit: str, normal_range: str, edges, interpretations, always: bool = False):
+        self.metric = sys.intern(metric)
+        self.field = field
+        # user_value format, e.g. "{} hours"
+        self.unit = unit
+        self.normal_range = sys.intern(normal_range)
+        self.thresholds = _band_thresholds(edges)
+        # One interpretation per band, lowest band first
+        self.interpretations = tuple(sys.intern(i) for i in interpretations)
+        self.templated = tuple("{value}" in i for i in interpretations)
+        # Shown even when the value is missing (required fields)
+        self.always = always
+
+METRIC_RULES = (
+    MetricRule("Sleep Duration", "sleep_duration_hr", "{} hours", "7–9 hours", ((">=", 7), (">", 9)), (
+        "Duration ({value}h) is below the recommended 7-9 hours. This can lead to sleep debt.",
+        "Ideal sleep duration for cognitive function and physical health.",
+        "Oversleeping detected. Occasionally normal, but chronic oversleeping may be linked to underlying issues.",
+    ), always=True),
+    MetricRule("Deep Sleep", "deep_percent", "{}%", "13–23%", ((">=", 13), (">=", 18)), (
+        "Deep sleep is low. You may feel physically unrefreshed or have muscle soreness.",
+        "Deep sleep is within the normal range for physical restoration.",
+        "Excellent deep sleep percentage. This is crucial for physical recovery and growth hormone release.",
+    )),
+    MetricRule("REM Sleep", "rem_percent", "{}%", "20–25%", ((">=", 20),), (
+        "REM sleep is slightly below average. This might affect your mood or mental clarity.",
+        "Healthy REM sleep. Essential for memory consolidation and emotional processing.",
+    )),
+    MetricRule("Sleeping Heart Rate", "heart_rate", "{} bpm", "60–100 bpm", ((">=", 60), (">", 80)), (
+        "Heart rate is low (Athletic range). Generally a sign of good cardiovascular fitness.",
+        "Heart rate is in the healthy resting range.",
+        "Elevated sleeping heart rate. Could be due to stress, late meals, or lack of recovery.",
+    )),
+    MetricRule("Stress Level", "stress_level", "{}/10", "< 4.0", ((">", 3), (">", 6)), (
+        "Low stress levels detected. Your nervous system is well-regulated.",
+        "Moderate stress. Consider relaxation techniques before bed.",
+        "High physiological stress. This significantly impacts sleep quality and recovery.",
+    )),
+    MetricRule("Resting Heart Rate", "resting_heart_rate", "{} bpm", "40–60 bpm", ((">=", 40), (">", 60)), (
+        "Resting heart rate during sleep is very low. Normal for endurance athletes; otherwise worth mentioning to a doctor.",
+        "Resting heart rate during sleep is in the typical range, a sign of good recovery.",
+        "Resting heart rate during sleep is elevated. Alcohol, illness or overtraining can keep it high.",
+    )),
+    MetricRule("Respiratory Rate", "respiratory_rate", "{} breaths/min", "12–20 breaths/min", ((">=", 12), (">", 20)), (
+        "Breathing rate during sleep is below the typical range.",
+        "Breathing rate during sleep is in the normal range.",
+        "Breathing rate during sleep is elevated. This can accompany illness or disturbed breathing.",
+    )),
+    MetricRule("Heart Rate Variability", "hrv_sdnn", "{} ms", "> 40 ms", ((">", 40),), (
+        "HRV is low, which often reflects stress, fatigue or incomplete recovery.",
+        "HRV is healthy, indicating a well-balanced autonomic nervous system.",
+    )),
+)
+
+# (field, op, threshold, recommendation); a missing value never triggers a recommendation
+RECOMMENDATION_RULES = tuple((field, op, threshold, sys.intern(text)) for field, op, threshold, text in (
+    ("sleep_duration_hr", "<", 7, "Prioritize an earlier bedtime to meet the 7-hour minimum requirement."),
+    ("deep_percent", "<", 15, "To boost deep sleep, ensure your bedroom is cool (around 18°C) and completely dark."),
+    ("rem_percent", "<", 20, "Improve REM sleep by avoiding alcohol and heavy meals 3 hours before bed."),
+    ("heart_rate", ">", 75, "Your sleeping HR is slightly high; try magnesium or a warm bath before sleep."),
+    ("stress_level", ">", 5, "Incorporate 10 minutes of deep breathing or meditation to lower pre-sleep stress."),
+    ("awakenings", ">", 2, "Multiple awakenings detected; check for environmental noise or try white noise."),
+))
+BASE_RECOMMENDATION = sys.intern("Maintain a consistent sleep schedule")
+MEDICAL_RECOMMENDATION = sys.intern("URGENT: Based on breathing signals, we strongly recommend a formal clinical sleep study (Polysomnography).")
+MEDICAL_WARNING = " WARNING: Abnormal breathing patterns or apnea alerts detected."
+
+TIER_THRESHOLDS_LIST = _band_thresholds(((">=", 50), (">=", 70), (">=", 85)))
+TIER_THRESHOLDS = np.array(TIER_THRESHOLDS_LIST)
+TIERS = ("Poor", "Fair", "Good", "Excellent")
+OVERALL_METRIC = sys.intern("Overall Performance")
+OVERALL_RANGE = sys.intern("70–100")
+OVERALL_INTERPRETATIONS = tuple(sys.intern(f"Based on your metrics, your sleep quality is {t}.") for t in TIERS)
+
+RULE_FIELDS = ("sleep_duration_hr", "deep_percent", "rem_percent", "heart_rate", "stress_level", "awakenings",
+               "resting_heart_rate", "respiratory_rate", "hrv_sdnn")
+MEDICAL_FIELDS = ("breathing_disturbances_elevated", "apnea_notification_received")
+RECORD_FIELDS = RULE_FIELDS + MEDICAL_FIELDS
+
+# The tables above as arrays over the record matrix, so a whole batch is classified with a
+# handful of NumPy operations regardless of its size. Thresholds are padded with NaN, which
+# no value reaches.
+_METRIC_SPECS = tuple((r.metric, r.unit, r.normal_range, r.interpretations, r.templated) for r in METRIC_RULES)
+_METRIC_INDEXES = range(len(METRIC_RULES))
+_METRIC_ALWAYS = tuple(r.always for r in METRIC_RULES)
+_METRIC_COLUMN_LIST = [RECORD_FIELDS.index(rule.field) for rule in METRIC_RULES]
+_METRIC_COLUMNS = np.array(_METRIC_COLUMN_LIST)
+_METRIC_THRESHOLDS = np.full((len(METRIC_RULES), max(len(rule.thresholds) for rule in METRIC_RULES)), np.nan)
+for _i, _rule in enumerate(METRIC_RULES):
+    _METRIC_THRESHOLDS[_i, :len(_rule.thresholds)] = _rule.thresholds
+# "<" rules are compared as -value > -threshold, so every rule is one ">" comparison
+_REC_COLUMN_LIST = [RECORD_FIELDS.index(field) for field, _, _, _ in RECOMMENDATION_RULES]
+_REC_COLUMNS = np.array(_REC_COLUMN_LIST)
+_REC_SIGNS = np.array([-1.0 if op == "<" else 1.0 for _, op, _, _ in RECOMMENDATION_RULES])
+_REC_THRESHOLDS = np.array([threshold for _, _, threshold, _ in RECOMMENDATION_RULES], dtype=np.float64) * _REC_SIGNS
+_REC_BITS = 1 << np.arange(len(RECOMMENDATION_RULES))
+_MEDICAL_COLUMN_LIST = [RECORD_FIELDS.index(field) for field in MEDICAL_FIELDS]
+_MEDICAL_COLUMNS = np.array(_MEDICAL_COLUMN_LIST)
+# Each record's triggered recommendations are packed into a bit code; the top bit is the medical referral
+MEDICAL_BIT = 1 << len(RECOMMENDATION_RULES)
+# Smaller batches are classified record by record (see _classify_record)
+VECTORIZE_MIN_RECORDS = 16
+
+def quality_tier_index(scores) -> np.ndarray:
+    return TIER_THRESHOLDS.searchsorted(np.asarray(scores, dtype=np.float64), side="right")
+
+def record_matrix(records) -> np.ndarray:
+    # One row per record, one column per RECORD_FIELDS entry. Optional fields become NaN, so
+    # "is not None" checks turn into NaN-false comparisons.
+    return np.array([[getattr(r, f) for f in RECORD_FIELDS] for r in records], dtype=np.float64).reshape(-1, len(RECORD_FIELDS))
+
+def _recommendations(code: int) -> list:
+    recs = [BASE_RECOMMENDATION]
+    recs.extend(text for bit, (_, _, _, text) in enumerate(RECOMMENDATION_RULES) if code >> bit & 1)
+    if code & MEDICAL_BIT:
+        recs.append(MEDICAL_RECOMMENDATION)
+    return recs
+
+# Metric rows are shared between responses with the same value: wearables report rounded
+# values, so the same durations, percentages and heart rates recur across nights and users.
+# Rows are never mutated, and the cache is simply dropped once it outgrows ROW_CACHE_SIZE.
+ROW_CACHE_SIZE = 16384
+_ROW_CACHE = {}
+
+# Every combination of triggered recommendations, indexed by bit code
+RECOMMENDATION_LISTS = tuple(tuple(_recommendations(code)) for code in range(MEDICAL_BIT << 1))
+
+def _classify_batch(records, scores):
+    # Per-record (tier index, recommendation code, metric values, bands, present) for the batch
+    matrix = record_matrix(records)
+    values = matrix[:, _METRIC_COLUMNS]
+    bands = (values[:, :, None] >= _METRIC_THRESHOLDS).sum(axis=2)
+    present = ~np.isnan(values)
+    codes = (matrix[:, _REC_COLUMNS] * _REC_SIGNS > _REC_THRESHOLDS) @ _REC_BITS
+    codes |= (matrix[:, _MEDICAL_COLUMNS] > 0).any(axis=1) * MEDICAL_BIT
+    tier_idx = quality_tier_index(scores)
+    return zip(tier_idx.tolist(), codes.tolist(), values.tolist(), bands.tolist(), present.tolist())
+
+def _classify_record(record, score):
+    # The same classification with bisect over the same thresholds, for batches too small to
+    # amortize NumPy's per-call overhead (e.g. a single /analyze_sleep request)
+    fields = [getattr(record, f) for f in RECORD_FIELDS]
+    values = [fields[i] for i in _METRIC_COLUMN_LIST]
+    present = [value is not None for value in values]
+    bands = [bisect_right(rule.thresholds, value) if value is not None else 0 for rule, value in zip(METRIC_RULES, values)]
+    code = 0
+    for bit, (field, op, threshold, _) in enumerate(RECOMMENDATION_RULES):
+        value = fields[_REC_COLUMN_LIST[bit]]
+        if value is not None and (value < threshold if op == "<" else value > threshold):
+            code |= 1 << bit
+    if any(fields[i] for i in _MEDICAL_COLUMN_LIST):
+        code |= MEDICAL_BIT
+    return bisect_right(TIER_THRESHOLDS_LIST, score), code, values, bands, present
+
+def evaluate_rules(records, scores, make_row=dict):
+    # Yields one (tier, metrics, summary, recommendations) tuple per record, where metrics lists
+    # make_row(metric=, user_value=, normal_range=, interpretation=) rows in display order
+    scores = [float(score) for score in scores]
+    if len(records) >= VECTORIZE_MIN_RECORDS:
+        classified = _classify_batch(records, scores)
+    else:
+        classified = map(_classify_record, records, scores)
+    if len(_ROW_CACHE) > ROW_CACHE_SIZE:
+        _ROW_CACHE.clear()
+
+    for score, (tier_i, code, row_values, row_bands, row_present) in zip(scores, classified):
+        metrics = []
+        for i, value, band, shown in zip(_METRIC_INDEXES, row_values, row_bands, row_present):
+            if shown or _METRIC_ALWAYS[i]:
+                key = (make_row, i, value)
+                row = _ROW_CACHE.get(key)
+                if row is None:
+                    metric, unit, normal_range, interpretations, templated = _METRIC_SPECS[i]
+                    row = _ROW_CACHE[key] = make_row(
+                        metric=metric,
+                        user_value=unit.format(value),
+                        normal_range=normal_range,
+                        interpretation=interpretations[band].format(value=value) if templated[band] else interpretations[band],
+                    )
+                metrics.append(row)
+        tier = TIERS[tier_i]
+        metrics.append(make_row(
+            metric=OVERALL_METRIC,
+            user_value=f"Score: {score:.1f}",
+            normal_range=OVERALL_RANGE,
+            interpretation=OVERALL_INTERPRETATIONS[tier_i],
+        ))
+        summary = f"Your SleepInsight Score is {score:.1f} ({tier})."
+        if code & MEDICAL_BIT:
+            summary += MEDICAL_WARNING
+        yield tier, metrics, summary, list(RECOMMENDATION_LISTS[code])
@@ -0,0 +1,362 @@
+import argparse
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+import numpy as np
+from src.analysis_rules import TIERS, quality_tier_index
+from src.bulk_scoring import RowError, iter_csv_chunks
+from src.health_upload import UploadRejected, parse_upload
+from src.model_registry import load_model_artifact
+from src.serving_model import artifact_version
+from src.upload_cache import hash_file
+
+# Offline rescoring of a directory of archived exports (export.zip, export.xml or CSV), e.g.
+# after a model update:
+#   python -m src.batch_rescore archive/ --output scores.npz --workers 8
+# Files are hashed and parsed in a process pool; every night of every export (every row
+# of a CSV) is gathered and scored in large vectorized batches with the NumPy predictor,
+# and the results end up in one .npz file of columns (np.load, or pandas.DataFrame(dict(...))).
+# Progress is checkpointed next to the output: each scored batch is saved as a part and the
+# files it covers are appended to a manifest by content hash, so re-running the same command
+# after an interruption only parses the files that are missing.
+
+INPUT_SUFFIXES = (".zip", ".xml", ".csv")
+# Nights held before a scoring batch is run and saved as a part
+BATCH_ROWS = 50000
+PROGRESS_SECONDS = 5.0
+# Rows per pandas chunk when reading a CSV archive
+CSV_CHUNK_ROWS = 20000
+
+STRING_COLUMNS = ("path", "file_sha256", "night_start", "night_end", "gender", "quality_tier")
+FEATURE_COLUMNS = ("age", "sleep_duration_hr", "heart_rate", "stress_level", "rem_percent", "deep_percent", "awakenings",
+                   "heart_rate_min", "heart_rate_p50", "heart_rate_p90", "resting_heart_rate", "respiratory_rate", "hrv_sdnn")
+
+def find_inputs(input_dir: str) -> list:
+    # Sorted relative paths, so runs over the same directory see files in the same order
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in INPUT_SUFFIXES:
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return found
+
+def _file_signature(path: str) -> list:
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def _csv_rows(path: str):
+    # Every row, with the same column mapping as CSV uploads; undecodable rows are counted
+    rows, errors = [], 0
+    with open(path, "rb") as f:
+        for chunk in iter_csv_chunks(f, CSV_CHUNK_ROWS):
+            for row in chunk:
+                if isinstance(row, RowError):
+                    errors += 1
+                else:
+                    rows.append(row)
+    return rows, errors
+
+def _to_columns(rows: list) -> dict:
+    columns = {name: np.array([r.get(name, "") or "" for r in rows], dtype=str)
+               for name in ("night_start", "night_end", "gender")}
+    for name in FEATURE_COLUMNS:
+        columns[name] = np.array([np.nan if r.get(name) is None else r[name] for r in rows], dtype=np.float64)
+    columns["row"] = np.arange(len(rows), dtype=np.int64)
+    return columns
+
+def parse_file(path: str):
+    # Worker entry point: (columns, stats) for one file, or (None, stats) with an error message.
+    # Errors are returned rather than raised, so one corrupt export doesn't stop the run.
+    t0 = time.perf_counter()
+    suffix = os.path.splitext(path)[1].lower()
+    stats = {"bytes": os.path.getsize(path), "records_seen": 0, "row_errors": 0, "error": None}
+    try:
+        if suffix == ".csv":
+            rows, stats["row_errors"] = _csv_rows(path)
+        else:
+            rows, parse_stats = parse_upload(path, suffix, all_nights=True)
+            rows = rows or []
+            stats["records_seen"] = parse_stats["records_seen"]
+    except UploadRejected as e:
+        stats["error"] = e.detail
+        return None, stats
+    except Exception as e:
+        stats["error"] = f"{type(e).__name__}: {str(e)}"
+        return None, stats
+    stats["parse_seconds"] = time.perf_counter() - t0
+    return _to_columns(rows), stats
+
+class RescoreState:
+    # <output>.state/: manifest.jsonl (one line per finished file, by content hash) and the
+    # part-*.npz batches it points to. Only parts named in the manifest count, so a part
+    # written just before a crash is dropped and its files are parsed again.
+    def __init__(self, output: str, model_version: str):
+        self.dir = output + ".state"
+        self.manifest_path = os.path.join(self.dir, "manifest.jsonl")
+        self.model_version = model_version
+        self.done = {}
+        self.hashes = {}
+        self.parts = []
+
+    def load(self, restart: bool = False):
+        if restart:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        os.makedirs(self.dir, exist_ok=True)
+        entries, damaged = [], False
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                for line in f:
+                    try:
+                        entries.append(json.loads(line))
+                    except ValueError:
+                        damaged = True
+        if damaged:
+            # A line cut off by a crash: its file is processed again, and the manifest is
+            # rewritten so the next append doesn't continue the broken line
+            tmp = self.manifest_path + ".tmp"
+            with open(tmp, "w") as f:
+                f.writelines(json.dumps(e) + "\n" for e in entries)
+            os.replace(tmp, self.manifest_path)
+        versions = {e["model_version"] for e in entries}
+        if versions and versions != {self.model_version}:
+            raise SystemExit(f"{self.dir} holds results of model {', '.join(sorted(versions))}, not {self.model_version}; "
+                             "use another --output or --restart")
+        for entry in entries:
+            self.done[entry["sha256"]] = entry
+            # Unchanged files (same size and mtime) aren't hashed again on resume
+            self.hashes[entry["file"]] = (entry["signature"], entry["sha256"])
+            if entry["part"] and entry["part"] not in self.parts:
+                self.parts.append(entry["part"])
+        for name in os.listdir(self.dir):
+            if name.startswith("part-") and name not in self.parts:
+                os.remove(os.path.join(self.dir, name))
+        return self
+
+    def known_hash(self, file: str, signature: list):
+        signature_and_hash = self.hashes.get(file)
+        if signature_and_hash and signature_and_hash[0] == signature:
+            return signature_and_hash[1]
+        return None
+
+    def save_part(self, columns: dict) -> str:
+        name = f"part-{len(self.parts):06d}.npz"
+        tmp = os.path.join(self.dir, name + ".tmp")
+        with open(tmp, "wb") as f:
+            np.savez(f, **columns)
+        os.replace(tmp, os.path.join(self.dir, name))
+        self.parts.append(name)
+        return name
+
+    def record(self, entries: list):
+        with open(self.manifest_path, "a") as f:
+            for entry in entries:
+                f.write(json.dumps({**entry, "model_version": self.model_version}) + "\n")
+                self.done[entry["sha256"]] = entry
+            f.flush()
+            os.fsync(f.fileno())
+
+class Rescorer:
+    # Gathers parsed files until BATCH_ROWS nights are pending, then scores them all with
+    # one predict call and checkpoints the batch
+    def __init__(self, model, state: RescoreState, batch_rows: int = BATCH_ROWS):
+        self.model = model
+        self.state = state
+        self.batch_rows = batch_rows
+        self.pending = []
+        self.pending_entries = []
+        self.pending_rows = 0
+        self.rows_scored = 0
+        self.score_seconds = 0.0
+
+    def add(self, entry: dict, columns: dict):
+        if columns is None or not len(columns["row"]):
+            self.pending_entries.append({**entry, "rows": 0, "part": None})
+        else:
+            n = len(columns["row"])
+            columns["path"] = np.full(n, entry["file"])
+            columns["file_sha256"] = np.full(n, entry["sha256"])
+            self.pending.append(columns)
+            self.pending_entries.append({**entry, "rows": n})
+            self.pending_rows += n
+        if self.pending_rows >= self.batch_rows:
+            self.flush()
+
+    def score(self, columns: dict) -> np.ndarray:
+        numeric = np.column_stack([columns[f] for f in self.model.numeric_features])
+        return np.clip(self.model.predict_arrays(numeric, columns[self.model.categorical_feature].tolist()), 0, 100)
+
+    def flush(self):
+        if not self.pending_entries:
+            return
+        part = None
+        if self.pending:
+            columns = {name: np.concatenate([c[name] for c in self.pending]) for name in self.pending[0]}
+            t0 = time.perf_counter()
+            columns["sleep_score"] = self.score(columns)
+            columns["quality_tier"] = np.array(TIERS, dtype=str)[quality_tier_index(columns["sleep_score"])]
+            self.score_seconds += time.perf_counter() - t0
+            self.rows_scored += len(columns["sleep_score"])
+            part = self.state.save_part(columns)
+        for entry in self.pending_entries:
+            entry.setdefault("part", part)
+        self.state.record(self.pending_entries)
+        self.pending, self.pending_entries, self.pending_rows = [], [], 0
+
+def write_output(state: RescoreState, output: str) -> int:
+    # Every part of the run (and of earlier interrupted runs) in one file, sorted by file
+    # and row so the output doesn't depend on worker timing
+    parts = []
+    for name in state.parts:
+        with np.load(os.path.join(state.dir, name)) as part:
+            parts.append({k: part[k] for k in part.files})
+    names = ("path", "file_sha256", "row", "night_start", "night_end", "gender") + FEATURE_COLUMNS + ("sleep_score", "quality_tier")
+    columns = {}
+    for name in names:
+        arrays = [p[name] for p in parts]
+        if arrays:
+            columns[name] = np.concatenate(arrays)
+        else:
+            columns[name] = np.empty(0, dtype=str if name in STRING_COLUMNS else np.int64 if name == "row" else np.float64)
+    order = np.lexsort((columns["row"], columns["path"]))
+    columns = {name: values[order] for name, values in columns.items()}
+    columns["model_version"] = np.array(state.model_version)
+    tmp = output + ".tmp"
+    with open(tmp, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp, output)
+    return len(order)
+
+class Progress:
+    def __init__(self, total_files: int, total_bytes: int):
+        self.total_files = total_files
+        self.total_bytes = total_bytes
+        self.files = 0
+        self.bytes = 0
+        self.rows = 0
+        self.failed = 0
+        self.started = time.perf_counter()
+        self.last_report = self.started
+
+    def update(self, stats: dict, rows: int):
+        self.files += 1
+        self.bytes += stats["bytes"]
+        self.rows += rows
+        self.failed += stats["error"] is not None
+        now = time.perf_counter()
+        if now - self.last_report >= PROGRESS_SECONDS or self.files == self.total_files:
+            self.last_report = now
+            print(self.line(now))
+
+    def line(self, now=None) -> str:
+        elapsed = max((now or time.perf_counter()) - self.started, 1e-9)
+        mb_s = self.bytes / 1024 ** 2 / elapsed
+        remaining = (self.total_bytes - self.bytes) / (self.bytes / elapsed) if self.bytes else float("nan")
+        return (f"[{self.files}/{self.total_files} files] {self.rows} nights, {self.failed} failed, "
+                f"{mb_s:.1f} MB/s, {self.files / elapsed:.1f} files/s, ETA {remaining:.0f}s")
+
+def _hash_with_signature(path: str):
+    return _file_signature(path), hash_file(path)
+
+def rescore(input_dir: str, output: str, model_path: str, workers: int = None, batch_rows: int = BATCH_ROWS,
+            restart: bool = False) -> dict:
+    t0 = time.perf_counter()
+    model_format = "serving" if os.path.isdir(model_path) else "pickle"
+    # Always the NumPy predictor: scores match the pipeline and no DataFrame is built
+    model = load_model_artifact(model_path, model_format, "numpy")
+    model_version = artifact_version(model_path)
+    state = RescoreState(output, model_version).load(restart)
+    files = find_inputs(input_dir)
+    print(f"Model {model_version}; {len(files)} input files in {input_dir}")
+
+    workers = workers or os.cpu_count() or 1
+    summary = {"files": len(files), "skipped": 0, "duplicates": 0, "parsed": 0, "failed": 0, "rows": 0}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # Content hashes (reusing the manifest's for files whose size and mtime are unchanged)
+        t_hash = time.perf_counter()
+        hashes = {}
+        to_hash = []
+        for file in files:
+            known = state.known_hash(file, _file_signature(os.path.join(input_dir, file)))
+            if known:
+                hashes[file] = known
+            else:
+                to_hash.append(file)
+        paths = [os.path.join(input_dir, f) for f in to_hash]
+        for file, (signature, digest) in zip(to_hash, pool.map(_hash_with_signature, paths, chunksize=16)):
+            hashes[file] = digest
+            state.hashes[file] = (signature, digest)
+        t_hashed = time.perf_counter()
+
+        todo, seen = [], set()
+        for file in files:
+            digest = hashes[file]
+            if digest in state.done:
+                summary["skipped"] += 1
+            elif digest in seen:
+                # The same content under another name is only parsed and reported once
+                summary["duplicates"] += 1
+            else:
+                seen.add(digest)
+                todo.append(file)
+        print(f"Hashed {len(to_hash)} files in {t_hashed - t_hash:.1f}s; {summary['skipped']} already done, "
+              f"{summary['duplicates']} duplicates, {len(todo)} to parse")
+
+        rescorer = Rescorer(model, state, batch_rows)
+        progress = Progress(len(todo), sum(os.path.getsize(os.path.join(input_dir, f)) for f in todo))
+        # A bounded number of files in flight keeps parsed results from piling up in memory
+        queue = iter(todo)
+        running = {}
+        while True:
+            while len(running) < workers * 2:
+                file = next(queue, None)
+                if file is None:
+                    break
+                running[pool.submit(parse_file, os.path.join(input_dir, file))] = file
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                file = running.pop(future)
+                columns, stats = future.result()
+                entry = {"file": file, "sha256": hashes[file], "signature": state.hashes[file][0],
+                         "records_seen": stats["records_seen"], "row_errors": stats["row_errors"], "error": stats["error"]}
+                if stats["error"]:
+                    print(f"WARNING: {file}: {stats['error']}")
+                    summary["failed"] += 1
+                else:
+                    summary["parsed"] += 1
+                rescorer.add(entry, columns)
+                progress.update(stats, 0 if columns is None else len(columns["row"]))
+        rescorer.flush()
+
+    summary["rows"] = write_output(state, output)
+    elapsed = time.perf_counter() - t0
+    summary.update({
+        "model_version": model_version,
+        "output": output,
+        "seconds": round(elapsed, 2),
+        "parsed_mb_per_s": round(progress.bytes / 1024 ** 2 / elapsed, 2),
+        "files_per_s": round(summary["parsed"] / elapsed, 2),
+        "score_seconds": round(rescorer.score_seconds, 3),
+        "rows_scored": rescorer.rows_scored,
+    })
+    return summary
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore a directory of Apple Health exports and CSVs into one .npz file")
+    parser.add_argument('input_dir')
+    parser.add_argument('--output', default="rescored.npz")
+    parser.add_argument('--model', default="models/sleep_model_pipeline.pkl", help="Pipeline pickle or serving model directory")
+    parser.add_argument('--workers', type=int, default=None, help="Parse processes (default: all cores)")
+    parser.add_argument('--batch-rows', type=int, default=BATCH_ROWS, help="Nights scored per model call and checkpoint")
+    parser.add_argument('--restart', action='store_true', help="Discard the checkpoint instead of resuming")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.input_dir):
+        parser.error(f"{args.input_dir} is not a directory")
+    summary = rescore(args.input_dir, args.output, args.model, args.workers, args.batch_rows, args.restart)
+    print(json.dumps(summary, indent=2))
@@ -0,0 +1,82 @@
+import csv
+import io
+import json
+import os
+from src.health_upload import csv_row_metrics
+
+# Bulk scoring reads CSV or NDJSON input in fixed-size chunks and streams one result line
+# per input row, so memory depends on the chunk size rather than on the file size.
+BULK_CHUNK_ROWS = int(os.getenv("SLEEPINSIGHT_BULK_CHUNK_ROWS", "2000"))
+MAX_BULK_CHUNK_ROWS = 50000
+
+INPUT_FORMATS = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+OUTPUT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+CSV_COLUMNS = ["index", "sleep_score", "quality_tier", "error"]
+
+class RowError:
+    # An input row that could not even be decoded; reported inline like a validation error
+    def __init__(self, message: str):
+        self.message = message
+
+def iter_csv_chunks(fileobj, chunk_rows: int):
+    # pandas keeps only one chunk of parsed rows in memory at a time; columns are mapped to
+    # SleepInput fields with the same defaults as single-row CSV uploads
+    import pandas as pd
+    fileobj.seek(0)
+    for frame in pd.read_csv(fileobj, chunksize=chunk_rows):
+        chunk = []
+        for row in frame.to_dict("records"):
+            try:
+                chunk.append(csv_row_metrics(row))
+            except (TypeError, ValueError) as e:
+                chunk.append(RowError(f"Invalid CSV row: {str(e)}"))
+        yield chunk
+
+def iter_ndjson_chunks(fileobj, chunk_rows: int):
+    # One JSON object per line; blank lines are skipped and don't count as rows
+    fileobj.seek(0)
+    chunk = []
+    for line in fileobj:
+        if not line.strip():
+            continue
+        try:
+            chunk.append(json.loads(line))
+        except ValueError as e:
+            chunk.append(RowError(f"Invalid JSON: {str(e)}"))
+        if len(chunk) >= chunk_rows:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def iter_bulk_chunks(fileobj, input_format: str, chunk_rows: int):
+    if input_format == "csv":
+        return iter_csv_chunks(fileobj, chunk_rows)
+    return iter_ndjson_chunks(fileobj, chunk_rows)
+
+def csv_columns(explain_features=None):
+    # Explained rows add the base score and one contribution column per model feature
+    if not explain_features:
+        return CSV_COLUMNS
+    return CSV_COLUMNS + ["base_score"] + [f"contribution_{f}" for f in explain_features]
+
+def _csv_row(result: dict) -> dict:
+    explanation = result.get("explanation")
+    if explanation is None:
+        return result
+    row = {k: v for k, v in result.items() if k != "explanation"}
+    row["base_score"] = explanation["base_score"]
+    row.update((f"contribution_{f}", c) for f, c in explanation["contributions"].items())
+    return row
+
+def encode_results(results, output: str, columns=CSV_COLUMNS) -> bytes:
+    # results: dicts with index and either sleep_score/quality_tier (and explanation) or error
+    if output == "csv":
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=columns, lineterminator="\n")
+        writer.writerows(_csv_row(r) for r in results)
+        return buf.getvalue().encode()
+    return "".join(json.dumps(r) + "\n" for r in results).encode()
+
+def encode_header(output: str, columns=CSV_COLUMNS) -> bytes:
+    return (",".join(columns) + "\n").encode() if output == "csv" else b""
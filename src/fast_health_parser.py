@@ -0,0 +1,254 @@
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+import multiprocessing
+import os
+import re
+from src.night_signals import SignalBuckets
+
+SLEEP_TYPE = 'HKCategoryTypeIdentifierSleepAnalysis'
+HEART_RATE_TYPE = 'HKQuantityTypeIdentifierHeartRate'
+RESPIRATORY_RATE_TYPE = 'HKQuantityTypeIdentifierRespiratoryRate'
+HRV_TYPE = 'HKQuantityTypeIdentifierHeartRateVariabilitySDNN'
+# Sparse per-night vitals, aggregated per minute like heart rate
+VITAL_KINDS = {RESPIRATORY_RATE_TYPE: 'resp', HRV_TYPE: 'hrv'}
+
+# Bytes read per scan step; keeps memory flat regardless of export size
+READ_CHUNK_SIZE = 4 << 20
+# Sharded scans never cut the export into pieces smaller than this; a worker costs a
+# process start, which a few MB of scanning doesn't pay back
+MIN_SHARD_BYTES = 32 << 20
+
+# Signal kinds in night_features' argument order
+SIGNAL_KINDS = ('hr', *VITAL_KINDS.values())
+
+_SLEEP_BYTES = SLEEP_TYPE.encode()
+_HEART_RATE_BYTES = HEART_RATE_TYPE.encode()
+_VITAL_KINDS = {record_type.encode(): kind for record_type, kind in VITAL_KINDS.items()}
+_RECORD_RE = re.compile(rb'<Record type="(' + rb'|'.join([_SLEEP_BYTES, _HEART_RATE_BYTES, *_VITAL_KINDS]) + rb')"([^>]*)>')
+_ME_RE = re.compile(rb'<Me\s([^>]*)>')
+_ATTR_RE = re.compile(rb'(\w+)="([^"]*)"')
+_START_DATE_RE = re.compile(rb'startDate="([^"]*)"')
+_RECORD_TAG = b'<Record '
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+class HealthSamples:
+    # Compact, array-backed columns of the records we actually use.
+    # Times are UTC epoch seconds; offsets are the record's UTC offset in minutes.
+    # Heart-rate and vital samples are not kept in memory: they are folded into per-minute
+    # aggregates (`signals`, one SignalBuckets per kind) as they are scanned, and the raw
+    # samples are spilled to a temporary file for the partial minutes at night edges.
+    def __init__(self):
+        self.user_info = {'age': 30, 'gender': 'Male'} # Defaults
+        self.sleep_start = array('d')
+        self.sleep_end = array('d')
+        self.sleep_start_offset = array('h')
+        self.sleep_end_offset = array('h')
+        self.sleep_stage = array('B')
+        self.stage_names = []
+        self._stage_codes = {}
+        self.signals = {kind: SignalBuckets() for kind in SIGNAL_KINDS}
+
+    def add_sleep(self, stage, start, start_offset, end, end_offset):
+        code = self._stage_codes.get(stage)
+        if code is None:
+            code = self._stage_codes[stage] = len(self.stage_names)
+            self.stage_names.append(stage)
+        self.sleep_start.append(start)
+        self.sleep_end.append(end)
+        self.sleep_start_offset.append(start_offset)
+        self.sleep_end_offset.append(end_offset)
+        self.sleep_stage.append(code)
+
+    def add_heart_rate(self, time, value):
+        self.signals['hr'].add(time, value)
+
+    def add_vital(self, kind, time, value):
+        self.signals[kind].add(time, value)
+
+    def extend(self, other):
+        # Appends another scan's columns as if its records had followed ours in the file.
+        # Stage codes are renumbered in order of first appearance, as a single scan assigns them.
+        codes = []
+        for stage in other.stage_names:
+            code = self._stage_codes.get(stage)
+            if code is None:
+                code = self._stage_codes[stage] = len(self.stage_names)
+                self.stage_names.append(stage)
+            codes.append(code)
+        self.sleep_start.extend(other.sleep_start)
+        self.sleep_end.extend(other.sleep_end)
+        self.sleep_start_offset.extend(other.sleep_start_offset)
+        self.sleep_end_offset.extend(other.sleep_end_offset)
+        self.sleep_stage.extend(codes[code] for code in other.sleep_stage)
+        for kind, buckets in self.signals.items():
+            buckets.extend(other.signals[kind])
+
+    def set_user(self, dob, gender):
+        if dob:
+            birth_year = int(dob[:4])
+            self.user_info['age'] = datetime.now().year - birth_year
+        if gender == 'HKBiologicalSexMale': self.user_info['gender'] = 'Male'
+        elif gender == 'HKBiologicalSexFemale': self.user_info['gender'] = 'Female'
+
+@lru_cache(maxsize=8192)
+def _local_midnight(date_part: str, tz_part: str):
+    # Epoch seconds of local midnight for 'YYYY-MM-DD' in a '+HHMM' offset, plus the offset in minutes
+    days = datetime(int(date_part[0:4]), int(date_part[5:7]), int(date_part[8:10])).toordinal() - _EPOCH_ORDINAL
+    offset = int(tz_part[1:3]) * 60 + int(tz_part[3:5])
+    if tz_part[0] == '-':
+        offset = -offset
+    return days * 86400 - offset * 60, offset
+
+def parse_timestamp(value: str):
+    # Hand-rolled parser for Apple's fixed '%Y-%m-%d %H:%M:%S %z' format.
+    # Returns (epoch_seconds, utc_offset_minutes).
+    if len(value) != 25 or value[10] != ' ' or value[19] != ' ':
+        dt = datetime.strptime(value, '%Y-%m-%d %H:%M:%S %z')
+        return dt.timestamp(), int(dt.utcoffset().total_seconds() // 60)
+    midnight, offset = _local_midnight(value[:10], value[20:])
+    return midnight + int(value[11:13]) * 3600 + int(value[14:16]) * 60 + int(value[17:19]), offset
+
+def format_timestamp(epoch: float, offset: int) -> str:
+    return datetime.fromtimestamp(epoch, timezone(timedelta(minutes=offset))).isoformat()
+
+def parse_export_fast(source, samples=None, progress=None, since=None):
+    # Scans the raw bytes of export.xml for the record types we use. Every other
+    # Record (steps, energy, distance, ...) is skipped inside the regex engine and never
+    # becomes a Python object. Apple always writes 'type' as the first attribute and
+    # escapes '>' inside attribute values, which is what the patterns rely on.
+    # Records starting before `since` (epoch seconds) are skipped after reading only their startDate.
+    samples = samples or HealthSamples()
+
+    if hasattr(source, 'read'):
+        _scan(source, samples, progress, since)
+    else:
+        with open(source, 'rb') as f:
+            _scan(f, samples, progress, since)
+    return samples
+
+def _scan(f, samples, progress=None, since=None, need_me=True):
+    # Records dated two or more days before `since` can be rejected by comparing the
+    # 'YYYY-MM-DD' prefix alone (UTC offsets are at most 14 hours), without parsing the time
+    since_day = None
+    if since is not None:
+        since_day = datetime.fromtimestamp(since - 2 * 86400, timezone.utc).strftime('%Y-%m-%d').encode()
+    rest = b''
+    records_seen = 0
+    while True:
+        chunk = f.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buf = rest + chunk
+        # Only scan up to the last complete tag; the tail is carried into the next chunk
+        cut = buf.rfind(b'>') + 1
+        if need_me:
+            m = _ME_RE.search(buf, 0, cut)
+            if m:
+                a = dict(_ATTR_RE.findall(m.group(1)))
+                dob = a.get(b'HKCharacteristicTypeIdentifierDateOfBirth')
+                sex = a.get(b'HKCharacteristicTypeIdentifierBiologicalSex')
+                samples.set_user(dob.decode() if dob else None, sex.decode() if sex else None)
+                need_me = False
+        for m in _RECORD_RE.finditer(buf, 0, cut):
+            if since is not None:
+                start_date = _START_DATE_RE.search(m.group(2))
+                if start_date:
+                    value = start_date.group(1)
+                    if value[:10] < since_day or parse_timestamp(value.decode())[0] < since:
+                        continue
+            a = dict(_ATTR_RE.findall(m.group(2)))
+            record_type = m.group(1)
+            if record_type == _HEART_RATE_BYTES:
+                samples.add_heart_rate(parse_timestamp(a[b'startDate'].decode())[0], float(a[b'value']))
+            elif record_type == _SLEEP_BYTES:
+                start, start_offset = parse_timestamp(a[b'startDate'].decode())
+                end, end_offset = parse_timestamp(a[b'endDate'].decode())
+                value = a.get(b'value')
+                samples.add_sleep(value.decode() if value is not None else None, start, start_offset, end, end_offset)
+            else:
+                samples.add_vital(_VITAL_KINDS[record_type], parse_timestamp(a[b'startDate'].decode())[0], float(a[b'value']))
+        if progress is not None:
+            # Counting tags is a C-level scan, so reporting every Record stays cheap
+            records_seen += buf.count(b'<Record ', 0, cut)
+            progress(records_seen)
+        rest = buf[cut:]
+
+class _ByteRange:
+    # Read-only view of bytes [start, end) of an open file, for scanning one shard
+    def __init__(self, f, start, end):
+        f.seek(start)
+        self.f = f
+        self.remaining = end - start
+
+    def read(self, size):
+        data = self.f.read(min(size, self.remaining))
+        self.remaining -= len(data)
+        return data
+
+def _next_record(f, offset):
+    # File offset of the first '<Record ' tag at or after `offset` (end of file if none)
+    f.seek(offset)
+    pos, tail = offset, b''
+    while True:
+        chunk = f.read(1 << 16)
+        if not chunk:
+            return pos + len(tail)
+        buf = tail + chunk
+        i = buf.find(_RECORD_TAG)
+        if i >= 0:
+            return pos + i
+        # Keep enough of the end to catch a tag split across reads
+        keep = len(_RECORD_TAG) - 1
+        pos += len(buf) - keep
+        tail = buf[-keep:]
+
+def shard_ranges(path, shards, min_bytes=None):
+    # Splits the export into up to `shards` (start, end) byte ranges. Every range after the
+    # first starts exactly at a '<Record ' tag, so no tag is cut and the header (with <Me>)
+    # is always in the first range.
+    size = os.path.getsize(path)
+    min_bytes = min_bytes or MIN_SHARD_BYTES
+    shards = max(1, min(shards, size // min_bytes))
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, shards):
+            pos = _next_record(f, size * i // shards)
+            if bounds[-1] < pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+def _scan_shard(path, start, end, since, count):
+    # Runs in a shard worker; returns the shard's columns and the Records it scanned
+    samples = HealthSamples()
+    seen = []
+    with open(path, 'rb') as f:
+        _scan(_ByteRange(f, start, end), samples, seen.append if count else None, since, need_me=start == 0)
+    return samples, seen[-1] if seen else 0
+
+def parse_export_sharded(path, workers, progress=None, since=None):
+    # Scans byte-range shards of an export on disk in a process pool. Nights can straddle
+    # shard boundaries and heart-rate windows depend on the whole sleep timeline, so shards
+    # return compact columns and per-minute signal aggregates rather than nights; concatenating
+    # the columns in file order and merging the aggregates gives those of a sequential scan.
+    ranges = shard_ranges(path, workers)
+    if len(ranges) == 1:
+        return parse_export_fast(path, progress=progress, since=since)
+    parts = [None] * len(ranges)
+    records_seen = 0
+    with ProcessPoolExecutor(max_workers=min(workers, len(ranges)), mp_context=multiprocessing.get_context("spawn")) as pool:
+        futures = {pool.submit(_scan_shard, path, start, end, since, progress is not None): i
+                   for i, (start, end) in enumerate(ranges)}
+        for future in as_completed(futures):
+            parts[futures[future]], seen = future.result()
+            if progress is not None:
+                # Reported per finished shard, so the count still only grows
+                records_seen += seen
+                progress(records_seen)
+    samples = parts[0]
+    for part in parts[1:]:
+        samples.extend(part)
+    return samples
@@ -0,0 +1,240 @@
+import io
+import os
+import resource
+import shutil
+import tempfile
+import time
+import zipfile
+from contextlib import contextmanager
+from src.parse_apple_health import parse_health_data, iter_nightly_metrics
+from src.ingest_store import IngestStore
+from src.record_store import RecordStore, RECORD_STORE_DIR
+
+# Upload limits: the raw upload and the decompressed export.xml inside it
+MAX_UPLOAD_BYTES = int(os.getenv("SLEEPINSIGHT_MAX_UPLOAD_BYTES", str(4 * 1024 ** 3)))
+MAX_EXPORT_BYTES = int(os.getenv("SLEEPINSIGHT_MAX_EXPORT_BYTES", str(8 * 1024 ** 3)))
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        # Both values go to Exception.__init__ so the error survives pickling out of a worker process
+        super().__init__(status_code, detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class ParseCancelled(Exception):
+    pass
+
+class ParseProgress:
+    # Shared between a parse and whoever is watching it; setting `cancelled`
+    # stops the parse at its next read or progress report
+    def __init__(self, total_bytes=None):
+        self.total_bytes = total_bytes
+        self.bytes_parsed = 0
+        self.records_seen = 0
+        self.cancelled = False
+
+    def __call__(self, records_seen: int):
+        self.records_seen = records_seen
+        self.check()
+
+    def check(self):
+        if self.cancelled:
+            raise ParseCancelled()
+
+    def done(self, records_seen=None):
+        # For parses that couldn't report as they went (cache hits, worker processes)
+        if self.total_bytes is not None:
+            self.bytes_parsed = self.total_bytes
+        if records_seen is not None:
+            self.records_seen = records_seen
+
+class CountingReader:
+    # Wraps a binary stream, counting bytes handed to the parser and enforcing a size cap
+    # (the declared size in a zip header can't be trusted against zip bombs)
+    def __init__(self, raw, limit=None, progress=None):
+        self.raw = raw
+        self.limit = limit
+        self.progress = progress
+        self.bytes_read = 0
+        # Time spent producing bytes (decompression for ZIPs), as opposed to parsing them
+        self.read_seconds = 0.0
+
+    def read(self, size=-1):
+        t0 = time.perf_counter()
+        data = self.raw.read(size)
+        self.read_seconds += time.perf_counter() - t0
+        self.bytes_read += len(data)
+        if self.limit is not None and self.bytes_read > self.limit:
+            raise UploadRejected(413, f"Decompressed export exceeds the limit of {self.limit} bytes")
+        if self.progress is not None:
+            self.progress.bytes_parsed = self.bytes_read
+            self.progress.check()
+        return data
+
+def find_export_member(zf: zipfile.ZipFile):
+    # Looks up export.xml in the central directory; nothing is extracted.
+    # The shallowest match wins (usually apple_health_export/export.xml).
+    candidates = [
+        info for info in zf.infolist()
+        if not info.is_dir() and os.path.basename(info.filename).lower() == "export.xml"
+    ]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda info: info.filename.count('/'))
+
+@contextmanager
+def open_export(fileobj, suffix: str, progress=None):
+    # Yields a stream of the export XML. For a ZIP only the export.xml member is
+    # decompressed, incrementally, as the parser reads from it.
+    if suffix == ".zip":
+        try:
+            zf = zipfile.ZipFile(fileobj)
+        except zipfile.BadZipFile:
+            raise UploadRejected(400, "Uploaded file is not a valid ZIP archive")
+        with zf:
+            info = find_export_member(zf)
+            if info is None:
+                raise UploadRejected(400, "No export.xml found in the uploaded ZIP file")
+            if info.file_size > MAX_EXPORT_BYTES:
+                raise UploadRejected(413, f"export.xml is {info.file_size} bytes, above the limit of {MAX_EXPORT_BYTES}")
+            if progress is not None:
+                progress.total_bytes = info.file_size
+            with zf.open(info) as stream:
+                yield CountingReader(stream, MAX_EXPORT_BYTES, progress)
+    else:
+        yield CountingReader(fileobj, MAX_EXPORT_BYTES, progress)
+
+def upload_size(fileobj) -> int:
+    pos = fileobj.tell()
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(pos)
+    return size
+
+def spooled_file_path(fileobj):
+    # Path another process can open to read an upload Starlette already rolled over to a
+    # temp file. The file is unlinked, but on Linux it stays reachable through /proc while
+    # this process holds it open. None when that isn't available.
+    try:
+        fileobj.flush()
+        path = f"/proc/{os.getpid()}/fd/{fileobj.fileno()}"
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return None
+    return path if os.path.exists(path) else None
+
+def spool_to_named_file(fileobj, suffix: str) -> str:
+    # Only needed when parsing happens in another process, which can't share the request's file object
+    fileobj.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(fileobj, tmp, 1 << 20)
+        return tmp.name
+
+def is_spooled_to_disk(fileobj) -> bool:
+    # Starlette keeps small uploads in memory and only rolls large ones over to a temp file
+    return bool(getattr(fileobj, "_rolled", False))
+
+def peak_rss_mb() -> float:
+    # Peak resident memory of the calling process so far
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+def upload_stats(upload_bytes: int, disk_bytes: int, export_bytes: int, parse_peak_rss_mb: float) -> dict:
+    return {
+        "upload_bytes": upload_bytes,
+        "disk_bytes": disk_bytes,
+        "export_bytes": export_bytes,
+        "peak_rss_mb": parse_peak_rss_mb,
+    }
+
+def _present(value) -> bool:
+    # pandas reads empty CSV cells as NaN (the only value not equal to itself)
+    return value is not None and value == value
+
+def csv_row_metrics(row: dict) -> dict:
+    # Map CSV columns to SleepInput fields
+    return {
+        "age": int(row.get("age", 30)),
+        "gender": str(row.get("gender", "Other")),
+        "sleep_duration_hr": float(row.get("sleep_duration_hr", 7.0)),
+        "heart_rate": float(row.get("heart_rate")) if _present(row.get("heart_rate")) else None,
+        "stress_level": float(row.get("stress_level", 3.0)),
+        "rem_percent": float(row.get("rem_percent")) if _present(row.get("rem_percent")) else None,
+        "deep_percent": float(row.get("deep_percent")) if _present(row.get("deep_percent")) else None,
+        "awakenings": float(row.get("awakenings", 0)),
+        "breathing_disturbances_elevated": bool(row.get("breathing_disturbances_elevated", False)),
+        "apnea_notification_received": bool(row.get("apnea_notification_received", False))
+    }
+
+def read_csv_metrics(source) -> dict:
+    # pandas is imported on first use, so the API starts without it
+    import pandas as pd
+    try:
+        # Only the first row is analyzed, so only the first row is read
+        # (use /analyze_sleep/bulk to score every row)
+        df_upload = pd.read_csv(source, nrows=1)
+        if df_upload.empty:
+            raise UploadRejected(400, "Uploaded CSV is empty")
+        
+        return csv_row_metrics(df_upload.iloc[0].to_dict())
+    except UploadRejected:
+        raise
+    except Exception as e:
+        raise UploadRejected(400, f"Error parsing CSV data: {str(e)}")
+
+@contextmanager
+def _open_source(source):
+    # Parse workers receive a path (process pools), raw bytes (small in-memory uploads)
+    # or the upload's own file object (thread pools)
+    if isinstance(source, (bytes, bytearray)):
+        yield io.BytesIO(source)
+    elif isinstance(source, str):
+        with open(source, 'rb') as f:
+            yield f
+    else:
+        yield source
+
+def parse_upload(source, suffix: str, all_nights: bool = False, progress=None, user_key=None):
+    # Entry point for parse workers. Returns (metrics or list of nightly metrics, parse stats),
+    # where the stats hold the decompressed export size, Records scanned, stage timings and
+    # the peak RSS of the process the parse ran in.
+    # With a user_key the user's ingestion checkpoint is loaded, only records it hasn't
+    # covered are processed, and the advanced checkpoint is saved back. When the record
+    # store is enabled, the user's raw samples are also written to it.
+    progress = progress or ParseProgress()
+    stages = {}
+    stats = {"export_bytes": 0, "records_seen": 0, "stages": stages}
+    t0 = time.perf_counter()
+    with _open_source(source) as f:
+        if suffix == ".csv":
+            result = read_csv_metrics(f)
+            stages["csv_parse"] = time.perf_counter() - t0
+            stats["peak_rss_mb"] = peak_rss_mb()
+            return result, stats
+        store = IngestStore() if user_key else None
+        checkpoint = store.load(user_key) if store else None
+        on_samples = None
+        if user_key and RECORD_STORE_DIR:
+            records = RecordStore()
+
+            def on_samples(samples, since):
+                t = time.perf_counter()
+                records.write(user_key, samples, since)
+                stages["record_store"] = time.perf_counter() - t
+        t_open = time.perf_counter()
+        with open_export(f, suffix, progress) as reader:
+            t_parse = time.perf_counter()
+            if all_nights:
+                result = list(iter_nightly_metrics(reader, progress=progress, checkpoint=checkpoint, on_samples=on_samples))
+            else:
+                result = parse_health_data(reader, progress=progress, checkpoint=checkpoint, on_samples=on_samples)
+            t_done = time.perf_counter()
+        if store and result:
+            store.save(user_key, checkpoint)
+        stages["export_open"] = t_parse - t_open
+        stages["zip_decompress" if suffix == ".zip" else "export_read"] = reader.read_seconds
+        stages["xml_parse"] = max(0.0, t_done - t_parse - reader.read_seconds - stages.get("record_store", 0.0))
+        if store:
+            stages["checkpoint_io"] = (t_open - t0) + (time.perf_counter() - t_done)
+        stats["export_bytes"] = reader.bytes_read
+        stats["records_seen"] = progress.records_seen
+        stats["peak_rss_mb"] = peak_rss_mb()
+        return result, stats
@@ -0,0 +1,81 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from src.parse_apple_health import ParseCheckpoint
+
+# Per-user incremental ingestion state: one checkpoint row plus one row per aggregated night
+INGEST_DB_PATH = os.getenv("SLEEPINSIGHT_INGEST_DB", "data/ingest_state.sqlite3")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS checkpoints (
+    user_key TEXT PRIMARY KEY,
+    latest_end REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS nights (
+    user_key TEXT NOT NULL,
+    night_start REAL NOT NULL,
+    metrics TEXT NOT NULL,
+    PRIMARY KEY (user_key, night_start)
+);
+"""
+
+def make_user_key(api_key: str, user_id: str) -> str:
+    # State is scoped to the API key and the caller-supplied user id; the key itself is never stored
+    return hashlib.sha256(f"{api_key}:{user_id}".encode()).hexdigest()[:32]
+
+class IngestStore:
+    # Connections are opened per call, so the store is safe to use from parse worker processes
+    def __init__(self, path: str = INGEST_DB_PATH):
+        self.path = path
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.executescript(SCHEMA)
+        return conn
+
+    def load(self, user_key: str) -> ParseCheckpoint:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT latest_end FROM checkpoints WHERE user_key = ?", (user_key,)).fetchone()
+            if row is None:
+                return ParseCheckpoint()
+            nights = [
+                (night_start, json.loads(metrics))
+                for night_start, metrics in conn.execute(
+                    "SELECT night_start, metrics FROM nights WHERE user_key = ? ORDER BY night_start", (user_key,))
+            ]
+            return ParseCheckpoint(latest_end=row[0], nights=nights)
+        finally:
+            conn.close()
+
+    def save(self, user_key: str, checkpoint: ParseCheckpoint):
+        # Only nights from checkpoint.updated_from on changed; older rows are left alone
+        if checkpoint.latest_end is None:
+            return
+        since = checkpoint.updated_from if checkpoint.updated_from is not None else float("-inf")
+        changed = [(user_key, start, json.dumps(metrics)) for start, metrics in checkpoint.nights if start >= since]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM nights WHERE user_key = ? AND night_start >= ?", (user_key, since))
+                conn.executemany("INSERT INTO nights (user_key, night_start, metrics) VALUES (?, ?, ?)", changed)
+                conn.execute(
+                    "INSERT OR REPLACE INTO checkpoints (user_key, latest_end, updated_at) VALUES (?, ?, ?)",
+                    (user_key, checkpoint.latest_end, time.time()))
+        finally:
+            conn.close()
+
+    def delete(self, user_key: str):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM nights WHERE user_key = ?", (user_key,))
+                conn.execute("DELETE FROM checkpoints WHERE user_key = ?", (user_key,))
+        finally:
+            conn.close()
@@ -0,0 +1,172 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from src.health_upload import ParseProgress, ParseCancelled, UploadRejected
+
+JOB_WORKERS = int(os.getenv("SLEEPINSIGHT_JOB_WORKERS", "1"))
+JOB_MAX_PENDING = int(os.getenv("SLEEPINSIGHT_JOB_MAX_PENDING", "16"))
+# Finished jobs (and their results) are dropped after this many seconds
+JOB_TTL_SECONDS = float(os.getenv("SLEEPINSIGHT_JOB_TTL_SECONDS", "3600"))
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+class JobQueueFull(Exception):
+    pass
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts, timezone.utc).isoformat() if ts else None
+
+class Job:
+    def __init__(self, path: str, suffix: str, all_nights: bool, total_bytes: int, user_key=None):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.suffix = suffix
+        self.all_nights = all_nights
+        self.user_key = user_key
+        self.status = QUEUED
+        self.progress = ParseProgress(total_bytes)
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": _iso(self.created_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+            "progress": {
+                "bytes_parsed": self.progress.bytes_parsed,
+                "total_bytes": self.progress.total_bytes,
+                "records_seen": self.progress.records_seen,
+            },
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobManager:
+    # In-process job queue: a bounded set of worker threads pulls jobs from a local queue.
+    # run_job(job) does the actual parse + scoring and returns the result to store.
+    def __init__(self, run_job, workers: int = JOB_WORKERS, max_pending: int = JOB_MAX_PENDING, ttl_seconds: float = JOB_TTL_SECONDS):
+        self.run_job = run_job
+        self.workers = max(1, workers)
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._threads = []
+        # The app's event loop (set at startup), so jobs can await its worker pools
+        self.loop = None
+
+    def run_async(self, coro):
+        # Runs a coroutine on the app's event loop from a job thread and waits for its result
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    def _ensure_workers(self):
+        if not self._threads:
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f"upload-job-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, path: str, suffix: str, all_nights: bool, total_bytes: int, user_key=None) -> Job:
+        self.evict_expired()
+        with self._lock:
+            pending = sum(1 for j in self._jobs.values() if j.status == QUEUED)
+            if pending >= self.max_pending:
+                raise JobQueueFull()
+            job = Job(path, suffix, all_nights, total_bytes, user_key)
+            self._jobs[job.id] = job
+            self._ensure_workers()
+        self._queue.put(job)
+        return job
+
+    def get(self, job_id: str):
+        self.evict_expired()
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status in FINISHED:
+                return job
+            job.progress.cancelled = True
+            if job.status == QUEUED:
+                # Never started: finish it here; the worker will skip it
+                self._finish(job, CANCELLED, error="Cancelled before start")
+            return job
+
+    def _finish(self, job: Job, status: str, result=None, error=None):
+        job.status = status
+        job.result = result
+        job.error = error
+        job.finished_at = time.time()
+        _remove(job.path)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            with self._lock:
+                if job.status != QUEUED:
+                    continue
+                job.status = RUNNING
+                job.started_at = time.time()
+            try:
+                result = self.run_job(job)
+            except ParseCancelled:
+                outcome = (CANCELLED, None, "Cancelled while running")
+            except UploadRejected as e:
+                outcome = (FAILED, None, e.detail)
+            except Exception as e:
+                outcome = (FAILED, None, getattr(e, "detail", None) or str(e) or type(e).__name__)
+            else:
+                outcome = (SUCCEEDED, result, None)
+            with self._lock:
+                # A cancel that arrived after the parse finished still wins
+                if job.progress.cancelled and outcome[0] == SUCCEEDED:
+                    outcome = (CANCELLED, None, "Cancelled while running")
+                self._finish(job, *outcome)
+
+    def evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [j.id for j in self._jobs.values() if j.status in FINISHED and j.finished_at < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.workers, "max_pending": self.max_pending, "ttl_seconds": self.ttl_seconds, "jobs": counts}
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put(None)
+        with self._lock:
+            for job in self._jobs.values():
+                job.progress.cancelled = True
+                if job.status == QUEUED:
+                    self._finish(job, CANCELLED, error="Server shutting down")
+        self._threads = []
+
+def _remove(path):
+    if path and os.path.exists(path):
+        os.remove(path)
@@ -1,33 +1,151 @@
-from fastapi import FastAPI, Header, HTTPException, Depends, UploadFile, File
-from pydantic import BaseModel
-from typing import Optional, List
-import joblib
-import pandas as pd
+from fastapi import FastAPI, Header, HTTPException, Depends, UploadFile, File, Body, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, ValidationError
+from typing import Optional, List, Any, Union
+from datetime import datetime
+from typing import TYPE_CHECKING
+import asyncio
 import numpy as np
 import os
-import shutil
 import tempfile
-from src.parse_apple_health import parse_health_data
+import time
+from src.analysis_rules import DISCLAIMER, UPLOAD_DISCLAIMER, TIERS, evaluate_rules, quality_tier_index
+from src.bulk_scoring import (
+    BULK_CHUNK_ROWS, MAX_BULK_CHUNK_ROWS, INPUT_FORMATS, OUTPUT_MEDIA_TYPES, RowError,
+    csv_columns, encode_header, encode_results, iter_bulk_chunks
+)
+from src.health_upload import (
+    MAX_UPLOAD_BYTES, UploadRejected, parse_upload, peak_rss_mb, upload_size, upload_stats,
+    is_spooled_to_disk, spool_to_named_file, spooled_file_path
+)
+from src.ingest_store import make_user_key
+from src.record_store import RecordStore, RECORD_STORE_DIR, to_epoch
+from src.jobs import Job, JobManager, JobQueueFull
+from src.metrics import (
+    REGISTRY, CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, BULK_ROWS, MODEL_REQUESTS, PARSED_RECORDS,
+    SHADOW_SCORE_DELTA, SLOW_REQUEST_MS, UPLOAD_BYTES,
+    record_since_request_start, record_stage, span
+)
+from src.response_cache import ResponseCache, cache_key
+from src.upload_cache import UploadResultCache, hash_file, hash_upload, upload_cache_key
+from src.model_registry import ModelRegistry, ModelVersion, MODEL_WARM_VERSIONS, MODEL_WATCH_SECONDS
+from src.serving_model import ServingModel, explain_model_records
+from src.workers import (
+    WorkerPool, PoolSaturated, load_worker_model, predict_with_worker_model, predict_records_with_worker_model,
+    explain_records_with_worker_model,
+    PARSE_EXECUTOR, PARSE_WORKERS, PARSE_MAX_QUEUE,
+    INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_MAX_QUEUE
+)
 
-app = FastAPI(title="SleepInsight AI API")
+if TYPE_CHECKING:
+    # pandas is only imported when a pipeline model first needs a DataFrame
+    import pandas as pd
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nothing slow happens before the yield, so uvicorn binds the port immediately; the
+    # model is loaded and warmed in the background and /readyz reports when it can serve
+    upload_jobs.loop = asyncio.get_running_loop()
+    loader = asyncio.create_task(warm_start())
+    watcher = asyncio.create_task(model_registry.watch(MODEL_WATCH_SECONDS)) if MODEL_WATCH_SECONDS > 0 else None
+    yield
+    loader.cancel()
+    if watcher:
+        watcher.cancel()
+    parse_pool.shutdown()
+    inference_pool.shutdown()
+    upload_jobs.shutdown()
+
+app = FastAPI(title="SleepInsight AI API", lifespan=lifespan)
+# Request counts, latencies and per-stage timings for /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Load model pipeline
-MODEL_PATH = "models/sleep_model_pipeline.pkl"
-model = None
-try:
-    if os.path.exists(MODEL_PATH):
-        model = joblib.load(MODEL_PATH)
-        print(f"Model loaded successfully from {MODEL_PATH}")
-    else:
-        print(f"WARNING: Model file not found at {MODEL_PATH}")
-except Exception as e:
-    print(f"ERROR: Failed to load model: {str(e)}")
-    # We don't raise an exception here to let the app start and listen on the port,
-    # which avoids a Cloud Run 'container failed to start' error.
+MODEL_PATH = os.getenv("SLEEPINSIGHT_MODEL_PATH", "models/sleep_model_pipeline.pkl")
+# 'pickle' loads the sklearn pipeline; 'serving' memory-maps the compact NumPy artifact
+# exported by train_model.py, which skips the sklearn import and shares pages across workers
+MODEL_FORMAT = os.getenv("SLEEPINSIGHT_MODEL_FORMAT", "pickle")
+SERVING_MODEL_DIR = os.getenv("SLEEPINSIGHT_SERVING_MODEL_DIR", "models/sleep_model_serving")
+# 'sklearn' runs the pickled pipeline on a DataFrame; 'numpy' compiles it into the NumPy
+# predictor, which scores SleepInput records directly without pandas or ColumnTransformer
+# dispatch. The serving format is always evaluated with NumPy.
+INFERENCE_ENGINE = "numpy" if MODEL_FORMAT == "serving" else os.getenv("SLEEPINSIGHT_INFERENCE_ENGINE", "sklearn")
+# Process inference workers load each version by path, so every version is snapshotted
+# first: the artifact itself is overwritten in place by the next deploy
+MODEL_SNAPSHOT_DIR = os.getenv("SLEEPINSIGHT_MODEL_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "sleepinsight-models"))
+
+# The artifact is watched for new versions; see src/model_registry.py
+model_registry = ModelRegistry(
+    SERVING_MODEL_DIR if MODEL_FORMAT == "serving" else MODEL_PATH, MODEL_FORMAT, INFERENCE_ENGINE,
+    snapshot_dir=MODEL_SNAPSHOT_DIR if INFERENCE_EXECUTOR == "process" else None
+)
+# Seconds between load attempts while no model could be loaded at startup
+STARTUP_RETRY_SECONDS = float(os.getenv("SLEEPINSIGHT_STARTUP_RETRY_SECONDS", "10"))
+
+class StartupState:
+    # Progress of the background load and warmup: starting -> loading -> warming -> ready,
+    # or failed (load attempts keep being retried). Timings are seconds since import.
+    def __init__(self):
+        self.phase = "starting"
+        self.error = None
+        self.started = time.perf_counter()
+        self.timings = {}
+
+    def mark(self, phase: str):
+        self.phase = phase
+        self.timings[phase] = round(time.perf_counter() - self.started, 3)
+
+    @property
+    def ready(self) -> bool:
+        return self.phase == "ready" and model_registry.active is not None
+
+    def to_dict(self) -> dict:
+        return {"phase": self.phase, "ready": self.ready, "error": self.error, "timings": self.timings}
+
+startup = StartupState()
+
+# Worker pools keep CPU-bound parsing and inference off the event loop. The inference pool's
+# initializer gets the active version's path once warm_start has loaded it.
+parse_pool = WorkerPool("parse", PARSE_EXECUTOR, PARSE_WORKERS, PARSE_MAX_QUEUE)
+inference_pool = WorkerPool(
+    "inference", INFERENCE_EXECUTOR, INFERENCE_WORKERS, INFERENCE_MAX_QUEUE,
+    initializer=load_worker_model if INFERENCE_EXECUTOR == "process" else None,
+    initargs=(model_registry.active.path if model_registry.active else None, MODEL_FORMAT, INFERENCE_ENGINE, MODEL_WARM_VERSIONS)
+)
+
+# Repeated identical /analyze_sleep payloads are answered from memory
+response_cache = ResponseCache()
+# Re-uploads of the same export reuse the parsed metrics (scored again with the current model)
+upload_cache = UploadResultCache()
+# Explanations (?explain=true) of model inputs seen before, keyed on the model features and
+# version only, so every endpoint shares them. A size of 0 disables the cache.
+EXPLAIN_CACHE_SIZE = int(os.getenv("SLEEPINSIGHT_EXPLAIN_CACHE_SIZE", "4096"))
+explanation_cache = ResponseCache(EXPLAIN_CACHE_SIZE)
+
+@app.exception_handler(PoolSaturated)
+async def pool_saturated_handler(request: Request, exc: PoolSaturated):
+    # Shed load instead of queueing without bound; clients should retry with backoff
+    return JSONResponse(
+        status_code=503,
+        content={"detail": f"Server busy: {exc.pool} pool is saturated, retry later"},
+        headers={"Retry-After": "5"}
+    )
 
 # Simple API Key Authentication
 API_KEY = os.getenv("SLEEPINSIGHT_API_KEY", "dev-key-12345")
 
+# Upper bound on the number of records accepted by /analyze_sleep/batch
+MAX_BATCH_SIZE = int(os.getenv("SLEEPINSIGHT_MAX_BATCH_SIZE", "1000"))
+
+# Pause before retrying a bulk chunk (or an upload job's parse) when its pool is saturated
+BULK_RETRY_SECONDS = 0.05
+
+# Opt-in: analysis responses are returned as pre-encoded JSON instead of response models, so
+# FastAPI skips re-validating and re-serializing them. The bytes are identical either way.
+FAST_RESPONSES = os.getenv("SLEEPINSIGHT_FAST_RESPONSES", "0") == "1"
+
 def verify_api_key(x_api_key: str = Header(...)):
     if x_api_key != API_KEY:
         raise HTTPException(status_code=403, detail="Invalid API Key")
@@ -42,6 +160,13 @@ class SleepInput(BaseModel):
     rem_percent: Optional[float] = None
     deep_percent: Optional[float] = None
     awakenings: Optional[float] = None
+    # Per-night aggregates from Apple Health exports; analyzed, but not model features
+    heart_rate_min: Optional[float] = None
+    heart_rate_p50: Optional[float] = None
+    heart_rate_p90: Optional[float] = None
+    resting_heart_rate: Optional[float] = None
+    respiratory_rate: Optional[float] = None
+    hrv_sdnn: Optional[float] = None
     # Medical flags
     breathing_disturbances_elevated: bool = False
     apnea_notification_received: bool = False
@@ -52,6 +177,12 @@ class MetricAnalysis(BaseModel):
     normal_range: str
     interpretation: str
 
+class ScoreExplanation(BaseModel):
+    # Per-feature contributions to the model's score, largest first. base_score plus the
+    # contributions equals the score before it is clipped to 0-100.
+    base_score: float
+    contributions: dict
+
 class SleepAnalysisResponse(BaseModel):
     sleep_score: float
     quality_tier: str
@@ -60,296 +191,671 @@ class SleepAnalysisResponse(BaseModel):
     summary_opinion: str
     recommendations: List[str]
     disclaimer: str
+    # Only with ?explain=true
+    explanation: Optional[ScoreExplanation] = None
+
+class NightAnalysis(BaseModel):
+    night_start: str
+    night_end: str
+    analysis: SleepAnalysisResponse
+
+class SleepTimelineResponse(BaseModel):
+    nights: List[NightAnalysis]
+
+class JobProgress(BaseModel):
+    bytes_parsed: int
+    total_bytes: Optional[int] = None
+    records_seen: int
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str # queued, running, succeeded, failed, cancelled
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    progress: JobProgress
+    result: Optional[Union[SleepAnalysisResponse, SleepTimelineResponse]] = None
+    error: Optional[str] = None
 
-def get_quality_tier(score: float) -> str:
-    if score >= 85: return "Excellent"
-    if score >= 70: return "Good"
-    if score >= 50: return "Fair"
-    return "Poor"
+class BatchAnalysisItem(BaseModel):
+    index: int
+    result: Optional[SleepAnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    results: List[BatchAnalysisItem]
+    succeeded: int
+    failed: int
+
+def build_analyses(records: List[SleepInput], scores, disclaimer: str = DISCLAIMER,
+                   explanations: Optional[List[ScoreExplanation]] = None) -> List[SleepAnalysisResponse]:
+    # Every endpoint builds its analyses here, from the shared rule table in src/analysis_rules.py.
+    # The rules are evaluated for the whole batch at once. Rows come back as MetricAnalysis
+    # instances, validated once and shared by every response in the batch with the same value.
+    analyses = []
+    explanations = explanations or [None] * len(records)
+    for data, score, explanation, (tier, metrics, summary, recs) in zip(
+            records, scores, explanations, evaluate_rules(records, scores, MetricAnalysis)):
+        analyses.append(SleepAnalysisResponse(
+            sleep_score=float(score),
+            quality_tier=tier,
+            key_insights={
+                "duration_hr": data.sleep_duration_hr,
+                "deep_pct": data.deep_percent,
+                "rem_pct": data.rem_percent,
+                "hr_bpm": data.heart_rate
+            },
+            detailed_analysis=metrics,
+            summary_opinion=summary,
+            recommendations=recs,
+            disclaimer=disclaimer,
+            explanation=explanation
+        ))
+    return analyses
 
 def generate_detailed_analysis(data: SleepInput, score: float) -> List[MetricAnalysis]:
-    analysis = []
-    
-    # 1. Sleep Duration
-    dur = data.sleep_duration_hr
-    if dur >= 7 and dur <= 9:
-        interp = "Ideal sleep duration for cognitive function and physical health."
-    elif dur < 7:
-        interp = f"Duration ({dur}h) is below the recommended 7-9 hours. This can lead to sleep debt."
+    return build_analyses([data], [score])[0].detailed_analysis
+
+# Column order expected by the trained pipeline
+MODEL_FEATURES = ['age', 'gender', 'sleep_duration_hr', 'heart_rate', 'stress_level', 'rem_percent', 'deep_percent', 'awakenings']
+
+def build_model_frame(records: List[SleepInput]) -> "pd.DataFrame":
+    # One row per record so the whole batch goes through the pipeline in a single call
+    import pandas as pd
+    return pd.DataFrame([{f: getattr(r, f) for f in MODEL_FEATURES} for r in records], columns=MODEL_FEATURES)
+
+def predict_scores(records: List[SleepInput], mv: ModelVersion) -> np.ndarray:
+    model = mv.model
+    if isinstance(model, ServingModel):
+        with span("predict"):
+            scores = model.predict_records(records)
     else:
-        interp = "Oversleeping detected. Occasionally normal, but chronic oversleeping may be linked to underlying issues."
-    
-    analysis.append(MetricAnalysis(
-        metric="Sleep Duration",
-        user_value=f"{dur} hours",
-        normal_range="7–9 hours",
-        interpretation=interp
-    ))
-    
-    # 2. Deep Sleep
-    if data.deep_percent is not None:
-        val = data.deep_percent
-        if val >= 18:
-            interp = "Excellent deep sleep percentage. This is crucial for physical recovery and growth hormone release."
-        elif val >= 13:
-            interp = "Deep sleep is within the normal range for physical restoration."
-        else:
-            interp = "Deep sleep is low. You may feel physically unrefreshed or have muscle soreness."
-        
-        analysis.append(MetricAnalysis(
-            metric="Deep Sleep",
-            user_value=f"{val}%",
-            normal_range="13–23%",
-            interpretation=interp
-        ))
+        with span("build_frame"):
+            frame = build_model_frame(records)
+        with span("predict"):
+            scores = model.predict(frame)
+    return np.clip(scores, 0, 100) # Clip to 0-100
 
-    # 3. REM Sleep
-    if data.rem_percent is not None:
-        val = data.rem_percent
-        if val >= 20:
-            interp = "Healthy REM sleep. Essential for memory consolidation and emotional processing."
+async def run_model_async(records: List[SleepInput], mv: ModelVersion) -> np.ndarray:
+    # Process workers can't share the loaded model, so they get the version's artifact path
+    model = mv.model
+    if isinstance(model, ServingModel):
+        if inference_pool.kind == "process":
+            scores = await inference_pool.run("predict", predict_records_with_worker_model, mv.path, records)
         else:
-            interp = "REM sleep is slightly below average. This might affect your mood or mental clarity."
-        
-        analysis.append(MetricAnalysis(
-            metric="REM Sleep",
-            user_value=f"{val}%",
-            normal_range="20–25%",
-            interpretation=interp
-        ))
-
-    # 4. Heart Rate (Resting/Avg during sleep)
-    if data.heart_rate is not None:
-        hr = data.heart_rate
-        if hr < 60:
-            interp = "Heart rate is low (Athletic range). Generally a sign of good cardiovascular fitness."
-        elif hr <= 80:
-            interp = "Heart rate is in the healthy resting range."
+            scores = await inference_pool.run("predict", model.predict_records, records)
+    else:
+        with span("build_frame"):
+            frame = build_model_frame(records)
+        if inference_pool.kind == "process":
+            scores = await inference_pool.run("predict", predict_with_worker_model, mv.path, frame)
         else:
-            interp = "Elevated sleeping heart rate. Could be due to stress, late meals, or lack of recovery."
-        
-        analysis.append(MetricAnalysis(
-            metric="Sleeping Heart Rate",
-            user_value=f"{hr} bpm",
-            normal_range="60–100 bpm",
-            interpretation=interp
-        ))
+            scores = await inference_pool.run("predict", model.predict, frame)
+    return np.clip(scores, 0, 100) # Clip to 0-100
 
-    # 5. Stress Level
-    if data.stress_level is not None:
-        sl = data.stress_level
-        if sl <= 3:
-            interp = "Low stress levels detected. Your nervous system is well-regulated."
-        elif sl <= 6:
-            interp = "Moderate stress. Consider relaxation techniques before bed."
-        else:
-            interp = "High physiological stress. This significantly impacts sleep quality and recovery."
-        
-        analysis.append(MetricAnalysis(
-            metric="Stress Level",
-            user_value=f"{sl}/10",
-            normal_range="< 4.0",
-            interpretation=interp
-        ))
+async def predict_scores_async(records: List[SleepInput], mv: ModelVersion) -> np.ndarray:
+    # Same as predict_scores, but the model call runs on the inference pool instead of the event loop
+    scores = await run_model_async(records, mv)
+    shadow = model_registry.shadow_for(mv)
+    if shadow is not None:
+        task = asyncio.create_task(shadow_score(records, shadow, scores))
+        shadow_tasks.add(task)
+        task.add_done_callback(shadow_tasks.discard)
+    return scores
 
-    # 6. Overall Performance
-    analysis.append(MetricAnalysis(
-        metric="Overall Performance",
-        user_value=f"Score: {score:.1f}",
-        normal_range="70–100",
-        interpretation=f"Based on your metrics, your sleep quality is {get_quality_tier(score)}."
-    ))
-        
-    return analysis
+# References to in-flight shadow scoring tasks, so they aren't garbage collected
+shadow_tasks = set()
+
+async def shadow_score(records: List[SleepInput], shadow: ModelVersion, served: np.ndarray):
+    # Scores the same records with the shadow candidate after the response is produced and
+    # records how far it is from what was served; never affects the response
+    try:
+        scores = await run_model_async(records, shadow)
+    except Exception as e:
+        print(f"Shadow scoring with model {shadow.version} failed: {str(e)}")
+        return
+    for delta in np.abs(scores - served):
+        SHADOW_SCORE_DELTA.observe(float(delta), version=shadow.version)
+
+async def explain_scores(records: List[SleepInput], mv: ModelVersion, use_cache: bool = True) -> List[ScoreExplanation]:
+    # Splits each score into per-feature contributions by following every tree's decision
+    # path (see ServingModel.node_contributions): one vectorized pass over the records that
+    # aren't cached, no extra predictions
+    keys = [cache_key({f: getattr(r, f) for f in MODEL_FEATURES}, mv.version) for r in records] if use_cache else None
+    explanations = [explanation_cache.get(k) for k in keys] if use_cache else [None] * len(records)
+    missing = [j for j, e in enumerate(explanations) if e is None]
+    if not missing:
+        return explanations
+    todo = [records[j] for j in missing]
+    if inference_pool.kind == "process":
+        base, features, contributions = await inference_pool.run("explain", explain_records_with_worker_model, mv.path, todo)
+    else:
+        base, features, contributions = await inference_pool.run("explain", explain_model_records, mv.model, todo)
+    order = np.argsort(-np.abs(contributions), axis=1, kind="stable")
+    for j, row, idx in zip(missing, contributions.tolist(), order.tolist()):
+        explanations[j] = ScoreExplanation(base_score=base, contributions={features[i]: row[i] for i in idx})
+        if use_cache:
+            explanation_cache.put(keys[j], explanations[j])
+    return explanations
+
+def resolve_model(requested: Optional[str] = None, response: Optional[Response] = None) -> ModelVersion:
+    # The version serving this request: ?model_version=, the canary's share, or the active one
+    try:
+        mv = model_registry.resolve(requested)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model version {requested} is not loaded")
+    if mv is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet, retry later", headers={"Retry-After": "5"})
+    MODEL_REQUESTS.inc(version=mv.version)
+    if response is not None:
+        response.headers["X-Model-Version"] = mv.version
+    return mv
+
+def build_sleep_analysis(data: SleepInput, score: float) -> SleepAnalysisResponse:
+    return build_analyses([data], [score])[0]
+
+def encode_response(model: BaseModel) -> bytes:
+    # The model's own pydantic-core serializer, which is what FastAPI ends up calling for a
+    # response_model; the models were already validated when they were built
+    return model.__pydantic_serializer__.to_json(model)
+
+def fast_response(response: Response, content: Union[BaseModel, bytes]) -> Response:
+    # The body is encoded here (or was already, for cached analyses) and returned as-is.
+    # Headers set on the injected response are carried over, as FastAPI does for models.
+    if not isinstance(content, bytes):
+        with span("serialize"):
+            content = encode_response(content)
+    fast = Response(content=content, media_type="application/json")
+    fast.headers.raw.extend(response.headers.raw)
+    return fast
+
+def format_validation_error(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in err['loc']) or 'item'}: {err['msg']}" for err in e.errors())
+
+async def analyze_one(data: SleepInput, mv: ModelVersion, explain: bool) -> SleepAnalysisResponse:
+    score = float((await predict_scores_async([data], mv))[0])
+    explanations = await explain_scores([data], mv) if explain else None
+    with span("analysis"):
+        return build_analyses([data], [score], explanations=explanations)[0]
 
 @app.post("/analyze_sleep", response_model=SleepAnalysisResponse)
-async def analyze_sleep(data: SleepInput, api_key: str = Depends(verify_api_key)):
-    if model is None:
-        raise HTTPException(status_code=500, detail="Model not loaded")
-    
-    # Prepare input for model
-    input_df = pd.DataFrame([{
-        'age': data.age,
-        'gender': data.gender,
-        'sleep_duration_hr': data.sleep_duration_hr,
-        'heart_rate': data.heart_rate,
-        'stress_level': data.stress_level,
-        'rem_percent': data.rem_percent,
-        'deep_percent': data.deep_percent,
-        'awakenings': data.awakenings
-    }])
-    
-    # Prediction
-    score = model.predict(input_df)[0]
-    score = max(0, min(100, score)) # Clip to 0-100
-    
-    tier = get_quality_tier(score)
-    analysis = generate_detailed_analysis(data, score)
-    
-    # Dynamic Recommendations
-    recs = ["Maintain a consistent sleep schedule"]
-    
-    if data.sleep_duration_hr < 7:
-        recs.append("Prioritize an earlier bedtime to meet the 7-hour minimum requirement.")
-    
-    if data.deep_percent is not None and data.deep_percent < 15:
-        recs.append("To boost deep sleep, ensure your bedroom is cool (around 18°C) and completely dark.")
-        
-    if data.rem_percent is not None and data.rem_percent < 20:
-        recs.append("Improve REM sleep by avoiding alcohol and heavy meals 3 hours before bed.")
-        
-    if data.heart_rate is not None and data.heart_rate > 75:
-        recs.append("Your sleeping HR is slightly high; try magnesium or a warm bath before sleep.")
-        
-    if data.stress_level is not None and data.stress_level > 5:
-        recs.append("Incorporate 10 minutes of deep breathing or meditation to lower pre-sleep stress.")
-
-    if data.awakenings is not None and data.awakenings > 2:
-        recs.append("Multiple awakenings detected; check for environmental noise or try white noise.")
-
-    # Medical Triggers
-    summary = f"Your SleepInsight Score is {score:.1f} ({tier})."
-    if data.breathing_disturbances_elevated or data.apnea_notification_received:
-        summary += " WARNING: Abnormal breathing patterns or apnea alerts detected."
-        recs.append("URGENT: Based on breathing signals, we strongly recommend a formal clinical sleep study (Polysomnography).")
-    
-    return SleepAnalysisResponse(
-        sleep_score=score,
-        quality_tier=tier,
-        key_insights={
-            "duration_hr": data.sleep_duration_hr,
-            "deep_pct": data.deep_percent,
-            "rem_pct": data.rem_percent,
-            "hr_bpm": data.heart_rate
-        },
-        detailed_analysis=analysis,
-        summary_opinion=summary,
-        recommendations=recs,
-        disclaimer="SleepInsight AI is an informational tool. These findings are NOT a medical diagnosis. Consult a doctor for health concerns."
-    )
+async def analyze_sleep(data: SleepInput, response: Response, use_cache: bool = True, explain: bool = False, model_version: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    record_since_request_start("validate")
+    mv = resolve_model(model_version, response)
 
-@app.post("/upload_health", response_model=SleepAnalysisResponse)
-async def upload_health(file: UploadFile = File(...), api_key: str = Depends(verify_api_key)):
-    if model is None:
-        raise HTTPException(status_code=500, detail="Model not loaded")
+    # ?use_cache=false forces a fresh prediction (and doesn't store it)
+    if not (use_cache and response_cache.enabled):
+        response_cache.record_bypass()
+        response.headers["X-Cache"] = "BYPASS"
+        analysis = await analyze_one(data, mv, explain)
+        return fast_response(response, analysis) if FAST_RESPONSES else analysis
 
-    import zipfile
-    
-    # Create a temporary file to store the upload
-    suffix = os.path.splitext(file.filename)[1].lower()
-    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        file_path = tmp.name
+    with span("cache_lookup"):
+        payload = data.model_dump()
+        if explain:
+            payload["explain"] = True
+        key = cache_key(payload, mv.version)
+        cached = response_cache.get(key)
+    if cached is not None:
+        response.headers["X-Cache"] = "HIT"
+        return fast_response(response, cached) if FAST_RESPONSES else cached
+    response.headers["X-Cache"] = "MISS"
+    analysis = await analyze_one(data, mv, explain)
+    if FAST_RESPONSES:
+        # Cache the encoded body, so hits skip serialization entirely
+        with span("serialize"):
+            analysis = encode_response(analysis)
+    response_cache.put(key, analysis)
+    return fast_response(response, analysis) if FAST_RESPONSES else analysis
 
+async def predict_scores_isolated(records: List[SleepInput], mv: ModelVersion):
+    # Returns (scores, {position: error}). A single unscorable row (e.g. infinite values) fails
+    # the vectorized call; fall back to per-row scoring so the error is attributed to that row only
     try:
-        final_path = file_path
-        tmp_dir = None
-        
-        # If it's a zip, extract it
-        if suffix == ".zip":
-            tmp_dir = tempfile.mkdtemp()
-            with zipfile.ZipFile(file_path, 'r') as zip_ref:
-                zip_ref.extractall(tmp_dir)
-            
-            # Find the export.xml (usually in apple_health_export/export.xml)
-            # We look for any .xml file recursively
-            xml_found = False
-            for root, dirs, files in os.walk(tmp_dir):
-                for f in files:
-                    if f.lower() == "export.xml":
-                        final_path = os.path.join(root, f)
-                        xml_found = True
-                        break
-                if xml_found: break
-            
-            if not xml_found:
-                raise HTTPException(status_code=400, detail="No export.xml found in the uploaded ZIP file")
-
-        # Handle CSV files
-        if suffix == ".csv":
+        return list(await predict_scores_async(records, mv)), {}
+    except PoolSaturated:
+        raise
+    except Exception:
+        scores, errors = [], {}
+        for j, data in enumerate(records):
             try:
-                df_upload = pd.read_csv(final_path)
-                if df_upload.empty:
-                    raise HTTPException(status_code=400, detail="Uploaded CSV is empty")
-                
-                # Take the first row if multiple exist
-                row = df_upload.iloc[0].to_dict()
-                
-                # Map CSV columns to SleepInput fields
-                metrics = {
-                    "age": int(row.get("age", 30)),
-                    "gender": str(row.get("gender", "Other")),
-                    "sleep_duration_hr": float(row.get("sleep_duration_hr", 7.0)),
-                    "heart_rate": float(row.get("heart_rate")) if pd.notnull(row.get("heart_rate")) else None,
-                    "stress_level": float(row.get("stress_level", 3.0)),
-                    "rem_percent": float(row.get("rem_percent")) if pd.notnull(row.get("rem_percent")) else None,
-                    "deep_percent": float(row.get("deep_percent")) if pd.notnull(row.get("deep_percent")) else None,
-                    "awakenings": float(row.get("awakenings", 0)),
-                    "breathing_disturbances_elevated": bool(row.get("breathing_disturbances_elevated", False)),
-                    "apnea_notification_received": bool(row.get("apnea_notification_received", False))
-                }
+                scores.append((await predict_scores_async([data], mv))[0])
+            except PoolSaturated:
+                raise
             except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Error parsing CSV data: {str(e)}")
-        else:
-            # Parse the health data
-            metrics = parse_health_data(final_path)
-            
-        if not metrics:
-            raise HTTPException(status_code=400, detail="Could not parse health data from file")
-        
-        # Convert parsed metrics to SleepInput model
-        sleep_data = SleepInput(**metrics)
-        
-        # Reuse analyze_sleep logic by calling the function directly or duplicating
-        # Here we duplicate for simplicity/clarity in this chunk
-        input_df = pd.DataFrame([{
-            'age': sleep_data.age,
-            'gender': sleep_data.gender,
-            'sleep_duration_hr': sleep_data.sleep_duration_hr,
-            'heart_rate': sleep_data.heart_rate,
-            'stress_level': sleep_data.stress_level,
-            'rem_percent': sleep_data.rem_percent,
-            'deep_percent': sleep_data.deep_percent,
-            'awakenings': sleep_data.awakenings
-        }])
-        
-        score = model.predict(input_df)[0]
-        score = max(0, min(100, score))
-        tier = get_quality_tier(score)
-        analysis = generate_detailed_analysis(sleep_data, score)
-        
-        recs = ["Maintain a consistent sleep schedule", "Reduce blue light exposure 1 hour before bed"]
-        if sleep_data.sleep_duration_hr < 7:
-            recs.append("Try going to bed 30 minutes earlier to increase total duration")
-        
-        summary = f"Your sleep score is {score:.1f}, categorized as {tier}."
-        if sleep_data.breathing_disturbances_elevated or sleep_data.apnea_notification_received:
-            summary += " Note: Abnormal breathing disturbance signals detected; consulting a medical professional is recommended."
-            recs.append("Strongly consider consulting a sleep specialist.")
-            
-        return SleepAnalysisResponse(
-            sleep_score=score,
-            quality_tier=tier,
-            key_insights={
-                "duration": sleep_data.sleep_duration_hr,
-                "deep": sleep_data.deep_percent,
-                "rem": sleep_data.rem_percent
-            },
-            detailed_analysis=analysis,
-            summary_opinion=summary,
-            recommendations=recs,
-            disclaimer="This analysis is based on uploaded Apple Health data."
-        )
+                errors[j] = f"Prediction failed: {str(e)}"
+                scores.append(None)
+        return scores, errors
+
+@app.post("/analyze_sleep/batch", response_model=BatchAnalysisResponse)
+async def analyze_sleep_batch(response: Response, items: List[Any] = Body(...), explain: bool = False, model_version: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    record_since_request_start("receive")
+    mv = resolve_model(model_version, response)
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size {len(items)} exceeds the maximum of {MAX_BATCH_SIZE}")
+
+    # Validate each item on its own so one bad record doesn't reject the whole batch
+    results = [BatchAnalysisItem(index=i) for i in range(len(items))]
+    valid = []
+    with span("validate"):
+        for i, item in enumerate(items):
+            try:
+                if not isinstance(item, dict):
+                    raise ValueError("Expected a JSON object")
+                valid.append((i, SleepInput(**item)))
+            except ValidationError as e:
+                results[i].error = format_validation_error(e)
+            except ValueError as e:
+                results[i].error = str(e)
+
+    if valid:
+        scores, errors = await predict_scores_isolated([data for _, data in valid], mv)
+        for j, error in errors.items():
+            results[valid[j][0]].error = error
+
+        scored = [(i, data, score) for (i, data), score in zip(valid, scores) if score is not None]
+        explanations = await explain_scores([data for _, data, _ in scored], mv) if explain and scored else None
+        with span("analysis"):
+            analyses = build_analyses([data for _, data, _ in scored], [score for _, _, score in scored], explanations=explanations)
+            for (i, _, _), analysis in zip(scored, analyses):
+                results[i].result = analysis
+
+    failed = sum(1 for r in results if r.error is not None)
+    batch = BatchAnalysisResponse(results=results, succeeded=len(results) - failed, failed=failed)
+    return fast_response(response, batch) if FAST_RESPONSES else batch
+
+def validate_bulk_chunk(chunk: list, start: int):
+    # Per-row validation, as in the batch endpoint: bad rows become inline errors
+    results = []
+    valid = []
+    for j, row in enumerate(chunk):
+        try:
+            if isinstance(row, RowError):
+                raise ValueError(row.message)
+            if not isinstance(row, dict):
+                raise ValueError("Expected a JSON object")
+            valid.append((j, SleepInput(**row)))
+            results.append({"index": start + j})
+        except ValidationError as e:
+            results.append({"index": start + j, "error": format_validation_error(e)})
+        except ValueError as e:
+            results.append({"index": start + j, "error": str(e)})
+    return results, valid
+
+async def score_bulk_chunk(records: List[SleepInput], mv: ModelVersion):
+    # Headers are already sent mid-stream, so a saturated inference pool can't be
+    # answered with a 503: wait for capacity instead of dropping the chunk
+    while True:
+        try:
+            return await predict_scores_isolated(records, mv)
+        except PoolSaturated:
+            await asyncio.sleep(BULK_RETRY_SECONDS)
 
+async def stream_bulk_scores(fileobj, input_format: str, output: str, chunk_rows: int, mv: ModelVersion, explain: bool = False):
+    # The version is resolved once, so a hot swap mid-stream doesn't mix models within a file
+    chunks = iter_bulk_chunks(fileobj, input_format, chunk_rows)
+    columns = csv_columns(MODEL_FEATURES if explain else None)
+    start = 0
+    yield encode_header(output, columns)
+    while True:
+        try:
+            with span("bulk_read"):
+                chunk = await run_in_threadpool(next, chunks, None)
+        except Exception as e:
+            # Malformed input past this point (e.g. a broken CSV line) ends the stream
+            yield encode_results([{"index": start, "error": f"Could not read input: {str(e)}"}], output, columns)
+            break
+        if chunk is None:
+            break
+        with span("validate"):
+            results, valid = await run_in_threadpool(validate_bulk_chunk, chunk, start)
+        if valid:
+            scores, errors = await score_bulk_chunk([data for _, data in valid], mv)
+            tiers = quality_tier_index([np.nan if score is None else score for score in scores])
+            # errors are keyed by position among the valid rows, not in the chunk
+            for k, ((j, _), score, tier) in enumerate(zip(valid, scores, tiers)):
+                if k in errors:
+                    results[j]["error"] = errors[k]
+                else:
+                    results[j]["sleep_score"] = float(score)
+                    results[j]["quality_tier"] = TIERS[tier]
+            scored = [(j, data) for k, (j, data) in enumerate(valid) if k not in errors]
+            if explain and scored:
+                # Bulk rows are rarely repeated and would only evict interactive entries from the cache
+                explanations = await explain_scores([data for _, data in scored], mv, use_cache=False)
+                for (j, _), explanation in zip(scored, explanations):
+                    results[j]["explanation"] = explanation.model_dump()
+        scored = sum(1 for r in results if "error" not in r)
+        BULK_ROWS.inc(scored, outcome="scored")
+        BULK_ROWS.inc(len(results) - scored, outcome="error")
+        yield encode_results(results, output, columns)
+        start += len(chunk)
+
+@app.post("/analyze_sleep/bulk")
+async def analyze_sleep_bulk(file: UploadFile = File(...), output: Optional[str] = None, chunk_rows: int = BULK_CHUNK_ROWS, explain: bool = False, model_version: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    # Streams one result per input row (NDJSON or CSV) as each chunk is scored
+    record_since_request_start("receive_upload")
+    mv = resolve_model(model_version)
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    input_format = INPUT_FORMATS.get(suffix)
+    if input_format is None:
+        raise HTTPException(status_code=400, detail="Only .csv, .ndjson and .jsonl files are supported for bulk scoring")
+    output = output or input_format
+    if output not in OUTPUT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="output must be 'ndjson' or 'csv'")
+    if not 1 <= chunk_rows <= MAX_BULK_CHUNK_ROWS:
+        raise HTTPException(status_code=400, detail=f"chunk_rows must be between 1 and {MAX_BULK_CHUNK_ROWS}")
+    size = upload_size(file.file)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload is {size} bytes, above the limit of {MAX_UPLOAD_BYTES}")
+    UPLOAD_BYTES.inc(size, kind="upload")
+    return StreamingResponse(stream_bulk_scores(file.file, input_format, output, chunk_rows, mv, explain),
+                             media_type=OUTPUT_MEDIA_TYPES[output], headers={"X-Model-Version": mv.version})
+
+def parsed_upload_records(result, all_nights: bool) -> List[SleepInput]:
+    # Convert parsed metrics (one night, or every night in timeline mode) to SleepInput models
+    if not result:
+        raise HTTPException(status_code=400, detail="Could not parse health data from file")
+    if all_nights:
+        return [SleepInput(**m) for m in result]
+    return [SleepInput(**result)]
+
+def build_upload_response(result, records: List[SleepInput], scores, all_nights: bool):
+    # Timeline mode: every night of the export, scored and analyzed in one batch
+    analyses = build_analyses(records, scores, UPLOAD_DISCLAIMER)
+    if all_nights:
+        return SleepTimelineResponse(nights=[
+            NightAnalysis(
+                night_start=m['night_start'],
+                night_end=m['night_end'],
+                analysis=analysis
+            )
+            for m, analysis in zip(result, analyses)
+        ])
+    return analyses[0]
+
+@app.post("/upload_health", response_model=Union[SleepAnalysisResponse, SleepTimelineResponse])
+async def upload_health(response: Response, file: UploadFile = File(...), all_nights: bool = False, user_id: Optional[str] = None, model_version: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    record_since_request_start("receive_upload")
+    mv = resolve_model(model_version, response)
+
+    suffix = os.path.splitext(file.filename)[1].lower()
+    size = upload_size(file.file)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload is {size} bytes, above the limit of {MAX_UPLOAD_BYTES}")
+    if all_nights and suffix == ".csv":
+        raise HTTPException(status_code=400, detail="all_nights is only supported for Apple Health exports")
+
+    # With a user_id the export is ingested incrementally against that user's checkpoint,
+    # which has to advance, so the content-hash cache is skipped
+    user_key = make_user_key(api_key, user_id) if user_id else None
+    UPLOAD_BYTES.inc(size, kind="upload")
+    key = None
+    if upload_cache.enabled and not user_key:
+        with span("hash_upload"):
+            digest = await run_in_threadpool(hash_upload, file.file)
+        key = upload_cache_key(digest, suffix, all_nights)
+    result = upload_cache.get(key) if key else None
+    if result is not None:
+        response.headers["X-Upload-Cache"] = "HIT"
+    else:
+        response.headers["X-Upload-Cache"] = "MISS" if key else "BYPASS"
+        result = await parse_upload_file(response, file, suffix, size, all_nights, user_key)
+        if key:
+            upload_cache.put(key, result)
+
+    records = parsed_upload_records(result, all_nights)
+    scores = await predict_scores_async(records, mv)
+    with span("analysis"):
+        analysis = build_upload_response(result, records, scores, all_nights)
+    return fast_response(response, analysis) if FAST_RESPONSES else analysis
+
+async def parse_upload_file(response: Response, file: UploadFile, suffix: str, size: int, all_nights: bool, user_key: Optional[str] = None):
+    # The upload is read in place: ZIPs are opened through their central directory and
+    # export.xml is decompressed straight into the parser, so nothing is extracted to disk
+    disk_bytes = size if is_spooled_to_disk(file.file) else 0
+    export_bytes = 0
+    # Measured where the parse runs; this process's own peak if it never got that far
+    parse_peak_rss_mb = None
+    tmp_path = None
+    t0 = time.perf_counter()
+    try:
+        if parse_pool.kind == "process":
+            # Worker processes can't see this request's file object: in-memory uploads are
+            # sent as bytes, uploads already spooled to disk are handed over by path (copied
+            # to a named file only where the spooled file can't be opened by path)
+            if disk_bytes:
+                source = spooled_file_path(file.file)
+                if source is None:
+                    tmp_path = await run_in_threadpool(spool_to_named_file, file.file, suffix)
+                    source = tmp_path
+                    disk_bytes += size
+            else:
+                file.file.seek(0)
+                source = file.file.read()
+        else:
+            source = file.file
+        result, parse_stats = await parse_pool.run("parse", parse_upload, source, suffix, all_nights, None, user_key)
+        export_bytes = parse_stats["export_bytes"]
+        parse_peak_rss_mb = parse_stats["peak_rss_mb"]
+        record_parse_stats(parse_stats)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
     finally:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if tmp_dir and os.path.exists(tmp_dir):
-            shutil.rmtree(tmp_dir)
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if disk_bytes:
+            UPLOAD_BYTES.inc(disk_bytes, kind="disk")
+        stats = upload_stats(size, disk_bytes, export_bytes, parse_peak_rss_mb or peak_rss_mb())
+        for key, value in stats.items():
+            response.headers[f"X-{key.replace('_', '-').title()}"] = str(value)
+        # Only logged for slow uploads, next to the slow-request stage breakdown
+        if SLOW_REQUEST_MS and (time.perf_counter() - t0) * 1000 >= SLOW_REQUEST_MS:
+            print(f"SLOW UPLOAD {file.filename}: {stats}")
+    return result
+
+def record_parse_stats(parse_stats: dict):
+    # Stage timings measured inside the parse worker, which may be another process
+    for stage, seconds in parse_stats["stages"].items():
+        record_stage(stage, seconds)
+    UPLOAD_BYTES.inc(parse_stats["export_bytes"], kind="export")
+    PARSED_RECORDS.inc(parse_stats["records_seen"])
+
+async def parse_job_upload(job: Job):
+    # Upload jobs parse on parse_pool like /upload_health, so they share its workers. A job
+    # has no request to answer with a 503, so a saturated pool is waited out instead.
+    # Thread workers report progress and see cancellation as they go; a worker process can't,
+    # so its progress is filled in when it returns and a cancel takes effect then.
+    progress = job.progress if parse_pool.kind == "thread" else None
+    while True:
+        job.progress.check()
+        try:
+            return await parse_pool.run("parse", parse_upload, job.path, job.suffix, job.all_nights, progress, job.user_key)
+        except PoolSaturated:
+            await asyncio.sleep(BULK_RETRY_SECONDS)
+
+def run_upload_job(job: Job):
+    # Executed on a job worker thread, so the synchronous predict path is fine here
+    key = None
+    if upload_cache.enabled and not job.user_key:
+        key = upload_cache_key(hash_file(job.path), job.suffix, job.all_nights)
+    result = upload_cache.get(key) if key else None
+    if result is None:
+        # parse_pool records the parse and parse_queue_wait stages
+        result, parse_stats = upload_jobs.run_async(parse_job_upload(job))
+        record_parse_stats(parse_stats)
+        job.progress.done(parse_stats["records_seen"])
+        if key:
+            upload_cache.put(key, result)
+    else:
+        job.progress.done()
+    records = parsed_upload_records(result, job.all_nights)
+    # Scored with whichever version is active when the job runs
+    mv = model_registry.resolve()
+    if mv is None:
+        raise RuntimeError("Model not loaded")
+    return build_upload_response(result, records, predict_scores(records, mv), job.all_nights)
+
+upload_jobs = JobManager(run_upload_job)
+
+@app.post("/upload_health/jobs", status_code=202, response_model=JobStatusResponse)
+async def submit_upload_job(file: UploadFile = File(...), all_nights: bool = False, user_id: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    if model_registry.active is None:
+        raise HTTPException(status_code=503, detail="Model not loaded yet, retry later", headers={"Retry-After": "5"})
+
+    suffix = os.path.splitext(file.filename)[1].lower()
+    size = upload_size(file.file)
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload is {size} bytes, above the limit of {MAX_UPLOAD_BYTES}")
+    if all_nights and suffix == ".csv":
+        raise HTTPException(status_code=400, detail="all_nights is only supported for Apple Health exports")
+
+    UPLOAD_BYTES.inc(size, kind="upload")
+    # The job outlives this request, so the upload has to be persisted for the worker
+    path = await run_in_threadpool(spool_to_named_file, file.file, suffix)
+    try:
+        job = upload_jobs.submit(path, suffix, all_nights, size, make_user_key(api_key, user_id) if user_id else None)
+    except JobQueueFull:
+        os.remove(path)
+        raise HTTPException(status_code=503, detail="Too many pending upload jobs, retry later", headers={"Retry-After": "30"})
+    return job.to_dict()
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    job = upload_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+@app.delete("/jobs/{job_id}", response_model=JobStatusResponse)
+async def cancel_job(job_id: str, api_key: str = Depends(verify_api_key)):
+    job = upload_jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job.to_dict()
+
+@app.get("/records/nights", response_model=SleepTimelineResponse)
+async def stored_nights(response: Response, user_id: str, start: Optional[datetime] = None, end: Optional[datetime] = None, model_version: Optional[str] = None, api_key: str = Depends(verify_api_key)):
+    # Re-analyzes a user's nights from the record store without touching the original export.
+    # Only sleep records starting in [start, end) are grouped into nights.
+    if not RECORD_STORE_DIR:
+        raise HTTPException(status_code=404, detail="Record store is not enabled")
+    mv = resolve_model(model_version, response)
+    with span("record_query"):
+        result = await run_in_threadpool(RecordStore().query_nights, make_user_key(api_key, user_id),
+                                         to_epoch(start) if start else None, to_epoch(end) if end else None)
+    if not result:
+        raise HTTPException(status_code=404, detail="No stored sleep records in this range")
+    records = parsed_upload_records(result, True)
+    scores = await predict_scores_async(records, mv)
+    with span("analysis"):
+        analysis = build_upload_response(result, records, scores, True)
+    return fast_response(response, analysis) if FAST_RESPONSES else analysis
+
+# Representative rows scored once at startup: both genders the encoder knows and one it
+# doesn't, and missing optional values, so every imputer/encoder branch has run before the
+# first real request. Enough rows to also take the vectorized rules path.
+WARMUP_PAYLOADS = [
+    {"age": 30, "gender": "Male", "sleep_duration_hr": 7.5, "heart_rate": 65.0, "stress_level": 3.0,
+     "rem_percent": 22.0, "deep_percent": 18.0, "awakenings": 1.0},
+    {"age": 45, "gender": "Female", "sleep_duration_hr": 5.5},
+    {"age": 62, "gender": "Other", "sleep_duration_hr": 9.5, "heart_rate": 82.0, "stress_level": 7.0,
+     "rem_percent": 15.0, "deep_percent": 10.0, "awakenings": 4.0, "breathing_disturbances_elevated": True},
+]
+
+async def warm_start():
+    # Loads the model off the event loop (retrying while none can be loaded, e.g. the
+    # artifact isn't there yet), then runs a few predictions and analyses so the first
+    # request doesn't pay for lazy imports, pool startup and first-call overheads
+    startup.mark("loading")
+    while model_registry.active is None:
+        if await asyncio.to_thread(model_registry.check_for_update) is None and model_registry.active is None:
+            startup.error = model_registry.last_error or f"No model found at {model_registry.path}"
+            startup.mark("failed")
+            print(f"WARNING: {startup.error}; retrying in {STARTUP_RETRY_SECONDS:g}s")
+            await asyncio.sleep(STARTUP_RETRY_SECONDS)
+    startup.error = None
+    mv = model_registry.active
+    if INFERENCE_ENGINE == "numpy" and MODEL_FORMAT != "serving":
+        print("Model compiled for the NumPy inference engine")
+    inference_pool.initargs = (mv.path, MODEL_FORMAT, INFERENCE_ENGINE, MODEL_WARM_VERSIONS)
+
+    startup.mark("warming")
+    try:
+        records = [SleepInput(**p) for p in WARMUP_PAYLOADS] * 6
+        scores = await predict_scores_async(records, mv)
+        encode_response(build_analyses(records, scores)[0])
+        encode_response(build_sleep_analysis(records[0], float(scores[0])))
+        # Builds the decision-path table (and compiles a sklearn pipeline) before the first ?explain=true
+        await explain_scores(records[:len(WARMUP_PAYLOADS)], mv, use_cache=False)
+        # Sync dependencies (the API key check) run on anyio's worker threads, started on first use
+        await run_in_threadpool(verify_api_key, API_KEY)
+    except Exception as e:
+        # A model that loads but can't predict still becomes ready; requests will report it
+        print(f"WARNING: Model warmup failed: {str(e)}")
+    startup.mark("ready")
+    print(f"Ready in {startup.timings['ready']:.2f}s")
+
+async def wait_until_ready(timeout: float = 120.0) -> bool:
+    # For in-process callers (benchmarks, scripts) that drive the app right after startup
+    deadline = time.perf_counter() + timeout
+    while not startup.ready and time.perf_counter() < deadline:
+        await asyncio.sleep(0.05)
+    return startup.ready
+
+@app.get("/livez")
+async def liveness():
+    # The process is up and the event loop responds; never depends on the model
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readiness():
+    # 200 once a model is loaded and warmed, 503 while loading, warming or failing to load
+    state = startup.to_dict()
+    return JSONResponse(status_code=200 if startup.ready else 503, content=state)
 
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "model_loaded": model is not None}
+    active, candidate = model_registry.active, model_registry.candidate
+    return {"status": "healthy" if startup.ready else startup.phase, "model_loaded": active is not None, "model_format": MODEL_FORMAT,
+            "model_version": active.version if active else None, "candidate_model_version": candidate.version if candidate else None,
+            "inference_engine": INFERENCE_ENGINE, "startup": startup.to_dict()}
+
+@app.get("/models")
+async def list_models(api_key: str = Depends(verify_api_key)):
+    return model_registry.stats()
+
+@app.post("/models/reload")
+async def reload_model(api_key: str = Depends(verify_api_key)):
+    # Checks the artifact now instead of waiting for the next poll (e.g. from a deploy hook)
+    await run_in_threadpool(model_registry.check_for_update)
+    return model_registry.stats()
+
+@app.post("/models/{version}/activate")
+async def activate_model(version: str, api_key: str = Depends(verify_api_key)):
+    # Promotes a canary/shadow candidate or rolls back to another warm version
+    try:
+        model_registry.activate(version)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Model version {version} is not loaded")
+    return model_registry.stats()
+
+@app.get("/stats/workers")
+async def worker_stats():
+    return {"parse": parse_pool.stats(), "inference": inference_pool.stats(), "upload_jobs": upload_jobs.stats()}
+
+@app.get("/metrics")
+async def metrics():
+    # Prometheus text exposition format
+    return Response(content=REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+@app.get("/stats/cache")
+async def cache_stats():
+    active = model_registry.active
+    return {"model_version": active.version if active else None, "analyze_sleep": response_cache.stats(), "upload_health": upload_cache.stats(),
+            "explanations": explanation_cache.stats()}
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,188 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Minimal Prometheus-style instrumentation (text exposition format 0.0.4) without extra dependencies.
+# Requests slower than this many milliseconds are logged with their stage breakdown; 0 disables it.
+SLOW_REQUEST_MS = float(os.getenv("SLEEPINSIGHT_SLOW_REQUEST_MS", "0"))
+
+# Seconds; covers a sub-millisecond cached response up to a multi-GB export parse
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, documentation: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # Per label set: [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state):
+                    cumulative += count
+                    le = ("le", "+Inf" if bound == math.inf else repr(bound))
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(state[-2])}")
+                lines.append(f"{self.name}_count{labels} {state[-1]}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    "sleepinsight_requests_total", "HTTP requests by route and status code", ("method", "route", "status")))
+REQUEST_ERRORS = REGISTRY.register(Counter(
+    "sleepinsight_request_errors_total", "HTTP requests answered with a 4xx/5xx status or an unhandled exception", ("method", "route", "status")))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "sleepinsight_request_duration_seconds", "End-to-end request latency", ("method", "route")))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "sleepinsight_stage_duration_seconds", "Latency of individual processing stages", ("stage",)))
+UPLOAD_BYTES = REGISTRY.register(Counter(
+    "sleepinsight_upload_bytes_total", "Bytes received in uploads (upload), spooled to disk (disk) and decompressed export XML parsed (export)", ("kind",)))
+PARSED_RECORDS = REGISTRY.register(Counter(
+    "sleepinsight_parsed_records_total", "Health export Records scanned by the parser"))
+MODEL_REQUESTS = REGISTRY.register(Counter(
+    "sleepinsight_model_requests_total", "Requests routed to each model version", ("version",)))
+SHADOW_SCORE_DELTA = REGISTRY.register(Histogram(
+    "sleepinsight_shadow_score_delta", "Absolute score difference between the shadow candidate and the served model, in score points",
+    ("version",), buckets=(0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)))
+BULK_ROWS = REGISTRY.register(Counter(
+    "sleepinsight_bulk_rows_total", "Rows streamed back by bulk scoring, by outcome", ("outcome",)))
+
+class RequestTimings:
+    # Stage breakdown of the request being served, for slow-request logging
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+
+_current = ContextVar("sleepinsight_request_timings", default=None)
+
+def record_stage(stage: str, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _current.get()
+    if timings is not None:
+        timings.stages[stage] = timings.stages.get(stage, 0.0) + seconds
+
+@contextmanager
+def span(stage: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - t0)
+
+def record_since_request_start(stage: str):
+    # Time between the request arriving and the endpoint running: body receive,
+    # multipart/JSON parsing, pydantic validation and auth dependencies
+    timings = _current.get()
+    if timings is not None:
+        record_stage(stage, time.perf_counter() - timings.start)
+
+class MetricsMiddleware:
+    # Plain ASGI middleware (cheaper than BaseHTTPMiddleware): counts and times every
+    # HTTP request, labelled by route template rather than raw path to bound cardinality
+    def __init__(self, app, slow_request_ms: float = SLOW_REQUEST_MS):
+        self.app = app
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - timings.start
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            REQUESTS.inc(method=method, route=route, status=status)
+            REQUEST_SECONDS.observe(elapsed, method=method, route=route)
+            if status >= 400:
+                REQUEST_ERRORS.inc(method=method, route=route, status=status)
+            if self.slow_request_ms and elapsed * 1000 >= self.slow_request_ms:
+                breakdown = ", ".join(f"{k}={v * 1000:.1f}ms" for k, v in timings.stages.items())
+                print(f"SLOW REQUEST {method} {route} {status} {elapsed * 1000:.1f}ms [{breakdown}]")
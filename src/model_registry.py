@@ -0,0 +1,221 @@
+import asyncio
+import os
+import random
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from src.serving_model import MANIFEST, artifact_version, compile_pipeline, load_serving_model
+
+# Hot model reload: the production artifact is polled for changes, new versions are loaded
+# on a background thread and swapped in atomically. Requests pick a version once and use
+# it throughout, so a swap never mixes two models within one response.
+MODEL_WATCH_SECONDS = float(os.getenv("SLEEPINSIGHT_MODEL_WATCH_SECONDS", "30"))  # 0 disables polling
+MODEL_WARM_VERSIONS = int(os.getenv("SLEEPINSIGHT_MODEL_WARM_VERSIONS", "2"))
+# immediate: a new version replaces the active one
+# canary: it serves SLEEPINSIGHT_CANARY_PERCENT of requests until activated
+# shadow: the active version answers; the new one scores that share of requests in the background
+MODEL_ROLLOUT = os.getenv("SLEEPINSIGHT_MODEL_ROLLOUT", "immediate")
+CANARY_PERCENT = float(os.getenv("SLEEPINSIGHT_CANARY_PERCENT", "10"))
+
+def load_model_artifact(path: str, model_format: str = "pickle", engine: str = "sklearn"):
+    if model_format == "serving":
+        return load_serving_model(path)
+    # Unpickling imports sklearn anyway; joblib itself is only needed here
+    import joblib
+    model = joblib.load(path)
+    if engine == "numpy":
+        model = compile_pipeline(model)
+    return model
+
+def _signature(path: str):
+    # Cheap change detection (mtime and size) so the artifact is only hashed when touched
+    try:
+        if os.path.isdir(path):
+            entries = [os.stat(os.path.join(path, n)) for n in sorted(os.listdir(path))]
+        else:
+            entries = [os.stat(path)]
+    except FileNotFoundError:
+        return None
+    return tuple((s.st_mtime_ns, s.st_size) for s in entries)
+
+class ModelVersion:
+    def __init__(self, version: str, model, path: str):
+        self.version = version
+        self.model = model
+        # Immutable copy of the artifact when snapshots are enabled; process workers load from it
+        self.path = path
+        self.loaded_at = time.time()
+        self.requests = 0
+
+    def to_dict(self) -> dict:
+        return {"version": self.version, "loaded_at": self.loaded_at, "requests": self.requests}
+
+class ModelRegistry:
+    def __init__(self, path: str, model_format: str = "pickle", engine: str = "sklearn",
+                 warm_versions: int = MODEL_WARM_VERSIONS, rollout: str = MODEL_ROLLOUT,
+                 canary_percent: float = CANARY_PERCENT, snapshot_dir: Optional[str] = None):
+        if rollout not in ("immediate", "canary", "shadow"):
+            raise ValueError(f"Unknown model rollout mode: {rollout}")
+        self.path = path
+        self.model_format = model_format
+        self.engine = engine
+        self.warm_versions = max(1, warm_versions)
+        self.rollout = rollout
+        self.canary_percent = canary_percent
+        self.snapshot_dir = snapshot_dir
+        if snapshot_dir:
+            os.makedirs(snapshot_dir, exist_ok=True)
+        self.active = None
+        # A loaded version waiting to be activated (canary/shadow rollout)
+        self.candidate = None
+        self.loads = 0
+        self.load_errors = 0
+        self.last_error = None
+        self._versions = OrderedDict()
+        self._signature = None
+        self._lock = threading.Lock()
+        # Serializes loads so the watcher and a manual reload don't load the same file twice
+        self._load_lock = threading.Lock()
+
+    def versions(self):
+        with self._lock:
+            return list(self._versions.values())
+
+    def _snapshot(self) -> str:
+        # Copy the artifact first so it can't change underneath the load (or under process
+        # workers loading the same version later); renamed to its version once hashed
+        tmp = tempfile.mkdtemp(prefix="incoming-", dir=self.snapshot_dir)
+        target = os.path.join(tmp, os.path.basename(self.path.rstrip(os.sep)))
+        if os.path.isdir(self.path):
+            shutil.copytree(self.path, target)
+        else:
+            shutil.copyfile(self.path, target)
+        return target
+
+    def check_for_update(self, force: bool = False) -> Optional[ModelVersion]:
+        # Loads the artifact if it changed since the last check; returns the new version, if any.
+        # Blocking: run it on a thread. A failed load keeps serving the current version.
+        with self._load_lock:
+            signature = _signature(self.path)
+            if signature is None or (signature == self._signature and not force):
+                return None
+            if self.model_format == "serving" and not os.path.exists(os.path.join(self.path, MANIFEST)):
+                return None
+            source = None
+            try:
+                source = self._snapshot() if self.snapshot_dir else self.path
+                version = artifact_version(source)
+                with self._lock:
+                    known = self._versions.get(version)
+                self._signature = signature
+                if known is not None:
+                    # e.g. a rollback to a version that is still warm: no load needed
+                    if known is not self.active and known is not self.candidate:
+                        self._install(known)
+                    if source != self.path:
+                        shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+                    return None
+                if source != self.path:
+                    final = os.path.join(self.snapshot_dir, version)
+                    shutil.rmtree(final, ignore_errors=True)
+                    os.replace(os.path.dirname(source), final)
+                    source = os.path.join(final, os.path.basename(source))
+                t0 = time.perf_counter()
+                entry = ModelVersion(version, load_model_artifact(source, self.model_format, self.engine), source)
+                print(f"Model version {version} loaded from {self.path} in {time.perf_counter() - t0:.2f}s")
+            except Exception as e:
+                self.load_errors += 1
+                self.last_error = str(e)
+                print(f"ERROR: Failed to load model from {self.path}: {str(e)}")
+                if source and source != self.path:
+                    shutil.rmtree(os.path.dirname(source), ignore_errors=True)
+                return None
+            self.loads += 1
+            self._install(entry)
+            return entry
+
+    async def watch(self, interval: float):
+        # Background task started with the app: polls the artifact off the event loop
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.to_thread(self.check_for_update)
+            except Exception as e:
+                print(f"ERROR: Model watcher failed: {str(e)}")
+
+    def _install(self, entry: ModelVersion):
+        with self._lock:
+            self._versions[entry.version] = entry
+            self._versions.move_to_end(entry.version)
+            if self.active is None or self.rollout == "immediate":
+                self.active, self.candidate = entry, None
+                print(f"Model version {entry.version} is now active")
+            else:
+                self.candidate = entry
+                print(f"Model version {entry.version} loaded as {self.rollout} candidate")
+            evicted = self._evict()
+        self._remove_snapshots(evicted)
+
+    def _evict(self):
+        # Keep the newest warm_versions loaded; the active version and candidate are never evicted
+        evicted = []
+        for version in list(self._versions):
+            if len(self._versions) <= self.warm_versions:
+                break
+            entry = self._versions[version]
+            if entry is not self.active and entry is not self.candidate:
+                evicted.append(self._versions.pop(version))
+        return evicted
+
+    def _remove_snapshots(self, entries):
+        for entry in entries:
+            if self.snapshot_dir and entry.path != self.path:
+                shutil.rmtree(os.path.dirname(entry.path), ignore_errors=True)
+
+    def activate(self, version: str) -> ModelVersion:
+        # Promote a canary/shadow candidate, or roll back to any warm version
+        with self._lock:
+            entry = self._versions[version]
+            self.active = entry
+            if self.candidate is entry:
+                self.candidate = None
+            self._versions.move_to_end(version)
+        print(f"Model version {version} is now active")
+        return entry
+
+    def resolve(self, requested: Optional[str] = None) -> Optional[ModelVersion]:
+        # Picks the version for one request: an explicitly requested warm version (KeyError
+        # if it isn't loaded), the canary for its share of traffic, otherwise the active one
+        with self._lock:
+            if requested:
+                entry = self._versions[requested]
+            elif self.rollout == "canary" and self.candidate is not None and random.random() * 100 < self.canary_percent:
+                entry = self.candidate
+            else:
+                entry = self.active
+            if entry is not None:
+                entry.requests += 1
+            return entry
+
+    def shadow_for(self, entry: Optional[ModelVersion]) -> Optional[ModelVersion]:
+        # The version to shadow-score this request with, if it is sampled
+        candidate = self.candidate
+        if self.rollout != "shadow" or candidate is None or entry is not self.active:
+            return None
+        return candidate if random.random() * 100 < self.canary_percent else None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "active": self.active.version if self.active else None,
+                "candidate": self.candidate.version if self.candidate else None,
+                "rollout": self.rollout,
+                "canary_percent": self.canary_percent,
+                "warm": [v.to_dict() for v in self._versions.values()],
+                "loads": self.loads,
+                "load_errors": self.load_errors,
+                "last_error": self.last_error,
+            }
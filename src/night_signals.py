@@ -0,0 +1,268 @@
+import math
+import os
+import tempfile
+from array import array
+import numpy as np
+
+# Online summaries of heart rate and the sparse vitals (respiratory rate, HRV). While the
+# export is scanned, samples are folded into per-minute aggregates (SignalBuckets), so parse
+# memory grows with the minutes that have samples, not with the samples. Each night's minutes
+# are then folded into a SignalSketch: a fixed-size histogram plus a few scalars, and nothing
+# is kept once the night's features are taken.
+
+# Width of one aggregate bucket (seconds); resting windows are whole multiples of it
+BUCKET_SECONDS = 60
+# Samples held before they are folded into the buckets
+BUCKET_BUFFER = 1 << 16
+
+# Resting heart rate: the lowest mean over a window of this many seconds that holds at
+# least RESTING_MIN_SAMPLES samples (a single low reading is not a resting rate)
+RESTING_WINDOW = 30 * 60
+RESTING_MIN_SAMPLES = 3
+
+class SignalBuckets:
+    # Count, sum, min and max of the samples in each BUCKET_SECONDS bucket, as NumPy columns
+    # sorted by bucket start. Samples are appended to a buffer that is folded in once it holds
+    # BUCKET_BUFFER samples or as many as there are buckets, so folding stays cheap per sample.
+    # Night windows rarely start or end on a whole minute, so the raw samples are kept too,
+    # off the heap: each folded buffer is sorted by time and appended to an anonymous temp
+    # file, and only the pages around a window's two edge minutes are ever read back.
+    COLUMNS = ('bucket', 'count', 'sum', 'min', 'max')
+
+    def __init__(self):
+        self.bucket = np.empty(0, dtype=np.float64)
+        self.count = np.empty(0, dtype=np.int64)
+        self.sum = np.empty(0, dtype=np.float64)
+        self.min = np.empty(0, dtype=np.float64)
+        self.max = np.empty(0, dtype=np.float64)
+        self._times = array('d')
+        self._values = array('d')
+        # Raw samples as (times, values) runs, each sorted by time; large runs are memory-mapped
+        self._runs = []
+        self._spill = None
+
+    @classmethod
+    def from_columns(cls, bucket, count, total, low, high, times=None, values=None):
+        # Buckets from stored columns (any order, buckets may repeat), with the raw samples
+        # they were folded from, if stored (sorted by time; kept as they are, e.g. memory-mapped)
+        buckets = cls()
+        buckets._merge(np.asarray(bucket, dtype=np.float64), np.asarray(count, dtype=np.int64),
+                       np.asarray(total, dtype=np.float64), np.asarray(low, dtype=np.float64),
+                       np.asarray(high, dtype=np.float64))
+        if times is not None and len(times):
+            buckets._runs.append((times, values))
+        return buckets
+
+    def add(self, time, value):
+        self._times.append(time)
+        self._values.append(value)
+        if len(self._times) >= max(BUCKET_BUFFER, len(self.bucket)):
+            self._fold()
+
+    def extend(self, other):
+        other._fold()
+        self._merge(other.bucket, other.count, other.sum, other.min, other.max)
+        # Runs are read-only, so they can be shared
+        self._runs.extend(other._runs)
+
+    def columns(self):
+        # (bucket, count, sum, min, max) with every buffered sample folded in
+        self._fold()
+        return self.bucket, self.count, self.sum, self.min, self.max
+
+    def samples(self):
+        # Every raw sample as (times, values), sorted by time
+        self._fold()
+        if not self._runs:
+            return np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64)
+        times = np.concatenate([t for t, _ in self._runs])
+        values = np.concatenate([v for _, v in self._runs])
+        order = np.argsort(times, kind='stable')
+        return times[order], values[order]
+
+    def window(self, start, end):
+        # Bucket columns of the samples in [start, end]: whole minutes inside the window come
+        # from the buckets, and the samples of the partial minutes at either edge are read
+        # from the raw runs as buckets of one (at their own time), so the totals are exact
+        self._fold()
+        inner_lo = math.ceil(start / BUCKET_SECONDS) * BUCKET_SECONDS
+        inner_hi = math.floor(end / BUCKET_SECONDS) * BUCKET_SECONDS
+        if inner_hi <= inner_lo:
+            return self._raw_window(start, end, True)
+        lo = np.searchsorted(self.bucket, inner_lo, side='left')
+        hi = np.searchsorted(self.bucket, inner_hi, side='left')
+        head = self._raw_window(start, inner_lo, False)
+        tail = self._raw_window(inner_hi, end, True)
+        inner = (self.bucket[lo:hi], self.count[lo:hi], self.sum[lo:hi], self.min[lo:hi], self.max[lo:hi])
+        return tuple(np.concatenate(parts) for parts in zip(head, inner, tail))
+
+    def _raw_window(self, start, end, closed):
+        # Raw samples in [start, end] (or [start, end) when not closed) as buckets of one
+        side = 'right' if closed else 'left'
+        times, values = [np.empty(0, dtype=np.float64)], [np.empty(0, dtype=np.float64)]
+        for run_times, run_values in self._runs:
+            lo = np.searchsorted(run_times, start, side='left')
+            hi = np.searchsorted(run_times, end, side=side)
+            times.append(run_times[lo:hi])
+            values.append(run_values[lo:hi])
+        times, values = np.concatenate(times), np.concatenate(values)
+        order = np.argsort(times, kind='stable')
+        times, values = times[order], values[order]
+        return times, np.ones(len(times), dtype=np.int64), values, values, values
+
+    def __len__(self):
+        self._fold()
+        return len(self.bucket)
+
+    def _fold(self):
+        if not self._times:
+            return
+        times = np.frombuffer(self._times, dtype=np.float64)
+        values = np.frombuffer(self._values, dtype=np.float64)
+        self._merge(np.floor(times / BUCKET_SECONDS) * BUCKET_SECONDS, np.ones(len(values), dtype=np.int64),
+                    values, values, values)
+        order = np.argsort(times, kind='stable')
+        self._add_run(times[order], values[order])
+        self._times = array('d')
+        self._values = array('d')
+
+    def _add_run(self, times, values):
+        # Runs of a full buffer or more go to the spill file; the short one left at the end
+        # of a scan stays in memory
+        if len(times) < BUCKET_BUFFER:
+            self._runs.append((times, values))
+            return
+        if self._spill is None:
+            self._spill = tempfile.TemporaryFile(prefix='signals-')
+        offset = self._spill.seek(0, os.SEEK_END)
+        self._spill.write(np.ascontiguousarray(times).tobytes())
+        self._spill.write(np.ascontiguousarray(values).tobytes())
+        self._spill.flush()
+        self._runs.append((np.memmap(self._spill, dtype=np.float64, mode='r', offset=offset, shape=(len(times),)),
+                           np.memmap(self._spill, dtype=np.float64, mode='r', offset=offset + times.nbytes, shape=(len(values),))))
+
+    def _merge(self, bucket, count, total, low, high):
+        if not len(bucket):
+            return
+        bucket = np.concatenate([self.bucket, bucket])
+        order = np.argsort(bucket, kind='stable')
+        bucket = bucket[order]
+        starts = np.flatnonzero(np.diff(bucket, prepend=-np.inf))
+        self.bucket = bucket[starts]
+        self.count = np.add.reduceat(np.concatenate([self.count, count])[order], starts)
+        self.sum = np.add.reduceat(np.concatenate([self.sum, total])[order], starts)
+        self.min = np.minimum.reduceat(np.concatenate([self.min, low])[order], starts)
+        self.max = np.maximum.reduceat(np.concatenate([self.max, high])[order], starts)
+
+    def __getstate__(self):
+        # Shard workers return their buckets to the parent; the raw samples travel as one
+        # run, which the parent spills to its own file
+        times, values = self.samples()
+        state = {name: getattr(self, name) for name in self.COLUMNS}
+        state.update(times=times, values=values)
+        return state
+
+    def __setstate__(self, state):
+        times, values = state.pop('times'), state.pop('values')
+        self.__dict__.update(state)
+        self._times = array('d')
+        self._values = array('d')
+        self._runs = []
+        self._spill = None
+        if len(times):
+            self._add_run(times, values)
+
+class SignalSketch:
+    # Count, sum, min and max, plus (with a bin width) a histogram over [lo, hi) with
+    # fixed-width bins for quantiles. Quantiles are bin midpoints, so they are within half a
+    # bin of the exact value (exact for integer bpm with bins centered on integers). Values
+    # outside the range are clamped into the edge bins. Folded from buckets, each bucket's
+    # samples are binned at the bucket mean, so quantiles are exact only for buckets of one
+    # sample (or of equal values); count, sum, min, max and resting windows stay exact.
+    def __init__(self, lo: float = 0.0, hi: float = 0.0, bin_width: float = None, window: float = None):
+        self.lo = lo
+        self.bin_width = bin_width
+        self.bins = np.zeros(int(math.ceil((hi - lo) / bin_width)) if bin_width else 0, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.window = window
+        # Window still being filled: (window index, sum, count)
+        self._open = None
+        self.lowest_window_mean = math.inf
+
+    def add(self, times: np.ndarray, values: np.ndarray):
+        # Individual samples: buckets of one
+        self.add_buckets(times, np.ones(len(values), dtype=np.int64), values, values, values)
+
+    def add_buckets(self, times, counts, sums, mins, maxs):
+        # Bucket columns as SignalBuckets.window returns them, in time order
+        if not len(counts):
+            return
+        self.count += int(counts.sum())
+        self.total += float(sums.sum())
+        self.min = min(self.min, float(mins.min()))
+        self.max = max(self.max, float(maxs.max()))
+        if self.bin_width:
+            idx = np.clip(((sums / counts - self.lo) / self.bin_width).astype(np.int64), 0, len(self.bins) - 1)
+            self.bins += np.bincount(idx, weights=counts, minlength=len(self.bins)).astype(np.int64)
+        if self.window:
+            self._add_windows(times, sums, counts)
+
+    def _add_windows(self, times, sums, counts):
+        # Times arrive sorted, so every window but the last one seen is complete
+        windows = np.floor(times / self.window).astype(np.int64)
+        starts = np.flatnonzero(np.diff(windows, prepend=windows[0] - 1))
+        keys = windows[starts]
+        sums = np.add.reduceat(sums, starts)
+        counts = np.add.reduceat(counts, starts)
+        if self._open is not None and self._open[0] == keys[0]:
+            sums[0] += self._open[1]
+            counts[0] += self._open[2]
+        elif self._open is not None:
+            self._close(self._open[1], self._open[2])
+        for total, count in zip(sums[:-1].tolist(), counts[:-1].tolist()):
+            self._close(total, count)
+        self._open = (int(keys[-1]), float(sums[-1]), int(counts[-1]))
+
+    def _close(self, total, count):
+        if count >= RESTING_MIN_SAMPLES:
+            self.lowest_window_mean = min(self.lowest_window_mean, total / count)
+
+    def quantile(self, q: float):
+        if not self.count or not self.bin_width:
+            return None
+        i = int(np.searchsorted(np.cumsum(self.bins), q * self.count, side='left'))
+        return self.lo + (i + 0.5) * self.bin_width
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def resting(self):
+        if self._open is not None:
+            self._close(self._open[1], self._open[2])
+            self._open = None
+        return self.lowest_window_mean if self.lowest_window_mean < math.inf else None
+
+def _rounded(value, digits=1):
+    return round(value, digits) if value is not None else None
+
+def night_features(hr, resp, hrv) -> dict:
+    # Optional SleepInput features of one night from the SignalBuckets.window columns of each
+    # signal. Missing signals give None, which the model and the rules treat as not measured.
+    hr_sketch = SignalSketch(19.5, 250.5, 1.0, window=RESTING_WINDOW)
+    hr_sketch.add_buckets(*hr)
+    # Only the means of the vitals are used, so they skip the histogram
+    resp_sketch = SignalSketch()
+    resp_sketch.add_buckets(*resp)
+    hrv_sketch = SignalSketch()
+    hrv_sketch.add_buckets(*hrv)
+    return {
+        "heart_rate_min": _rounded(hr_sketch.min if hr_sketch.count else None),
+        "heart_rate_p50": _rounded(hr_sketch.quantile(0.5)),
+        "heart_rate_p90": _rounded(hr_sketch.quantile(0.9)),
+        "resting_heart_rate": _rounded(hr_sketch.resting()),
+        "respiratory_rate": _rounded(resp_sketch.mean()),
+        "hrv_sdnn": _rounded(hrv_sketch.mean()),
+    }
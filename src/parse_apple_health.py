@@ -1,69 +1,116 @@
 import xml.etree.ElementTree as ET
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
+import math
 import os
+from src.fast_health_parser import (
+    HealthSamples, parse_export_fast, parse_export_sharded, format_timestamp,
+    SLEEP_TYPE, HEART_RATE_TYPE, VITAL_KINDS, SIGNAL_KINDS
+)
+from src.night_signals import BUCKET_SECONDS, night_features
 
-def parse_health_data(file_path):
-    # Features to extract
-    user_info = {'age': 30, 'gender': 'Male'} # Defaults
-    sleep_records = []
-    heart_rates = []
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S %z'
+
+# Parser engines: 'fast' (regex scan of the raw bytes; unused records never become Python
+# objects) or 'etree' (original ElementTree path)
+PARSER_ENGINE = os.getenv("SLEEPINSIGHT_PARSER_ENGINE", "fast")
+# Processes scanning one export on disk in parallel shards (fast engine, path sources only)
+PARSE_SHARD_WORKERS = int(os.getenv("SLEEPINSIGHT_PARSE_SHARD_WORKERS", "1"))
+
+# Sleep records separated by more than this gap (seconds) belong to different nights
+NIGHT_GAP = 4 * 3600
+# Window before the last sleep record that counts as the latest night (seconds)
+LATEST_NIGHT_WINDOW = 14 * 3600
+
+def _parse_date(value):
+    dt = datetime.strptime(value, DATE_FORMAT)
+    return dt.timestamp(), int(dt.utcoffset().total_seconds() // 60)
+
+# How often (in Records) the etree engine reports progress
+PROGRESS_INTERVAL = 10000
+
+def _collect_records_etree(source, samples=None, progress=None, since=None):
+    samples = samples or HealthSamples()
+    records_seen = 0
     
     # Use iterparse for memory efficiency
-    context = ET.iterparse(file_path, events=('start', 'end'))
-    
-    current_night = None
+    context = ET.iterparse(source, events=('start', 'end'))
     
     for event, elem in context:
         if event == 'start':
             if elem.tag == 'Me':
                 # Extract DOB and Gender
-                dob = elem.get('HKCharacteristicTypeIdentifierDateOfBirth')
-                if dob:
-                    birth_year = int(dob[:4])
-                    user_info['age'] = datetime.now().year - birth_year
-                gender = elem.get('HKCharacteristicTypeIdentifierBiologicalSex')
-                if gender == 'HKBiologicalSexMale': user_info['gender'] = 'Male'
-                elif gender == 'HKBiologicalSexFemale': user_info['gender'] = 'Female'
+                samples.set_user(elem.get('HKCharacteristicTypeIdentifierDateOfBirth'),
+                                 elem.get('HKCharacteristicTypeIdentifierBiologicalSex'))
             
             if elem.tag == 'Record':
                 record_type = elem.get('type')
+                records_seen += 1
+                if progress is not None and records_seen % PROGRESS_INTERVAL == 0:
+                    progress(records_seen)
                 
                 # Sleep Analysis
-                if record_type == 'HKCategoryTypeIdentifierSleepAnalysis':
-                    value = elem.get('value')
+                if record_type == SLEEP_TYPE:
                     # HKCategoryValueSleepAnalysisAsleepCore, AsleepDeep, AsleepREM, AsleepUnspecified
-                    start = datetime.strptime(elem.get('startDate'), '%Y-%m-%d %H:%M:%S %z')
-                    end = datetime.strptime(elem.get('endDate'), '%Y-%m-%d %H:%M:%S %z')
-                    sleep_records.append({
-                        'type': value,
-                        'start': start,
-                        'end': end,
-                        'duration': (end - start).total_seconds() / 3600
-                    })
+                    start, start_offset = _parse_date(elem.get('startDate'))
+                    if since is None or start >= since:
+                        end, end_offset = _parse_date(elem.get('endDate'))
+                        samples.add_sleep(elem.get('value'), start, start_offset, end, end_offset)
                 
                 # Heart Rate
-                if record_type == 'HKQuantityTypeIdentifierHeartRate':
-                    start = datetime.strptime(elem.get('startDate'), '%Y-%m-%d %H:%M:%S %z')
-                    value = float(elem.get('value'))
-                    heart_rates.append({'time': start, 'value': value})
+                if record_type == HEART_RATE_TYPE:
+                    start, _ = _parse_date(elem.get('startDate'))
+                    if since is None or start >= since:
+                        samples.add_heart_rate(start, float(elem.get('value')))
+
+                # Respiratory rate, HRV
+                if record_type in VITAL_KINDS:
+                    start, _ = _parse_date(elem.get('startDate'))
+                    if since is None or start >= since:
+                        samples.add_vital(VITAL_KINDS[record_type], start, float(elem.get('value')))
         
         if event == 'end':
             elem.clear() # Clear element from memory
 
-    if not sleep_records:
-        return None
+    if progress is not None:
+        progress(records_seen)
+    return samples
 
-    # Sort sleep records by start time
-    sleep_records.sort(key=lambda x: x['start'])
-    
-    # Group by night (e.g., records within 12 hours of each other)
-    # For simplicity, let's take the most recent group
-    latest_end = sleep_records[-1]['end']
-    target_night_start = latest_end - timedelta(hours=14)
-    
-    night_records = [r for r in sleep_records if r['start'] > target_night_start]
-    
+def collect_samples(source, engine=None, progress=None, since=None, workers=None):
+    # progress, if given, is called with the number of Records scanned so far.
+    # since (epoch seconds), if given, drops records starting before it.
+    # workers > 1 splits an export file on disk into shards scanned in parallel; streams
+    # (uploads, zip members) can't be seeked into and are always scanned sequentially.
+    engine = engine or PARSER_ENGINE
+    workers = workers or PARSE_SHARD_WORKERS
+    if engine == 'fast':
+        if workers > 1 and isinstance(source, (str, os.PathLike)):
+            return parse_export_sharded(source, workers, progress=progress, since=since)
+        return parse_export_fast(source, progress=progress, since=since)
+    if engine == 'etree':
+        return _collect_records_etree(source, progress=progress, since=since)
+    raise ValueError(f"Unknown parser engine: {engine}")
+
+def _sleep_records(samples):
+    # Sleep records are few (a handful per night), so they are materialized and sorted by start
+    records = [{
+        'type': samples.stage_names[code],
+        'start': start,
+        'end': end,
+        'end_offset': end_offset,
+        'start_offset': start_offset,
+        'duration': (end - start) / 3600
+    } for start, end, start_offset, end_offset, code in zip(
+        samples.sleep_start, samples.sleep_end,
+        samples.sleep_start_offset, samples.sleep_end_offset, samples.sleep_stage)]
+    records.sort(key=lambda x: x['start'])
+    return records
+
+def _window(samples, start, end):
+    # Per-minute aggregates of every signal over [start, end], in night_features' argument order
+    return [samples.signals[kind].window(start, end) for kind in SIGNAL_KINDS]
+
+def _summarize_night(night_records, user_info, signals):
     # Aggregate Metrics
     total_duration = sum(r['duration'] for r in night_records if 'Asleep' in r['type'])
     rem_duration = sum(r['duration'] for r in night_records if 'REM' in r['type'])
@@ -75,15 +122,14 @@ def parse_health_data(file_path):
     awakenings = len([r for r in night_records if 'Asleep' in r['type']]) - 1
     if awakenings < 0: awakenings = 0
 
-    # Heart Rate for that night
-    night_hrs = [hr['value'] for hr in heart_rates if target_night_start <= hr['time'] <= latest_end]
-    avg_hr = sum(night_hrs) / len(night_hrs) if night_hrs else 65.0
+    _, hr_counts, hr_sums, _, _ = signals[0]
+    avg_hr = float(hr_sums.sum()) / int(hr_counts.sum()) if len(hr_counts) else 65.0
     
     # Calculate percentages
     rem_pct = (rem_duration / total_duration * 100) if total_duration > 0 else 0
     deep_pct = (deep_duration / total_duration * 100) if total_duration > 0 else 0
     
-    result = {
+    return {
         "age": user_info['age'],
         "gender": user_info['gender'],
         "sleep_duration_hr": round(total_duration, 2),
@@ -92,10 +138,126 @@ def parse_health_data(file_path):
         "rem_percent": round(rem_pct, 1),
         "deep_percent": round(deep_pct, 1),
         "awakenings": float(awakenings),
-        "breathing_disturbances_elevated": False
+        "breathing_disturbances_elevated": False,
+        **night_features(*signals)
     }
+
+def _group_nights(sleep_records):
+    # Single pass over time-sorted records: a new night starts after a long gap
+    night = []
+    night_end = None
+    for r in sleep_records:
+        if night and r['start'] - night_end > NIGHT_GAP:
+            yield night
+            night = []
+        if not night or r['end'] > night_end:
+            night_end = r['end']
+        night.append(r)
+    if night:
+        yield night
+
+class ParseCheckpoint:
+    # Incremental ingestion state of one user: the end of the newest sleep record seen
+    # and every night aggregated so far as (night_start epoch, metrics), oldest first.
+    # Exports are cumulative, so a later export only needs the records from `since` on.
+    def __init__(self, latest_end=None, nights=None):
+        self.latest_end = latest_end
+        self.nights = nights or []
+        # Start of the first night replaced by the last update (None: everything)
+        self.updated_from = None
+
+    @property
+    def since(self):
+        if self.latest_end is None:
+            return None
+        # The last stored night may still grow, and the latest-night window may reach
+        # back past it, so both are re-aggregated from their raw records
+        bounds = [self.latest_end - LATEST_NIGHT_WINDOW]
+        if self.nights:
+            bounds.append(self.nights[-1][0])
+        # Whole minutes, so the per-minute signal aggregates never straddle `since`
+        return math.floor(min(bounds) / BUCKET_SECONDS) * BUCKET_SECONDS
+
+    def update(self, nights, latest_end):
+        # nights: aggregated from records starting at `since`. The first of them may be a
+        # partial copy of an older, finished night; stored nights before the last one win.
+        boundary = self.nights[-1][0] if self.nights else None
+        if boundary is not None:
+            self.nights = [n for n in self.nights if n[0] < boundary] + [n for n in nights if n[0] >= boundary]
+        else:
+            self.nights = list(nights)
+        self.updated_from = boundary
+        if latest_end is not None and (self.latest_end is None or latest_end > self.latest_end):
+            self.latest_end = latest_end
+
+def _latest_night(samples, sleep_records):
+    # Group by night (e.g., records within 12 hours of each other)
+    # For simplicity, let's take the most recent group
+    latest_end = sleep_records[-1]['end']
+    target_night_start = latest_end - LATEST_NIGHT_WINDOW
     
-    return result
+    night_records = [r for r in sleep_records if r['start'] > target_night_start]
+
+    # Heart Rate (and vitals) for that night
+    signals = _window(samples, target_night_start, latest_end)
+    
+    return _summarize_night(night_records, samples.user_info, signals)
+
+def _nights(samples, sleep_records):
+    # Yields (night_start epoch, metrics) for every night, oldest first
+    for night_records in _group_nights(sleep_records):
+        night_start = night_records[0]
+        night_end = max(night_records, key=lambda r: r['end'])
+
+        # Nights are disjoint and ordered, so the signal windows form a sorted sweep
+        signals = _window(samples, night_start['start'], night_end['end'])
+
+        metrics = _summarize_night(night_records, samples.user_info, signals)
+        metrics['night_start'] = format_timestamp(night_start['start'], night_start['start_offset'])
+        metrics['night_end'] = format_timestamp(night_end['end'], night_end['end_offset'])
+        yield night_start['start'], metrics
+
+def _ingest(file_path, engine, progress, checkpoint, workers=None, on_samples=None):
+    # Parses only what the checkpoint hasn't seen and folds the new nights into it
+    samples = collect_samples(file_path, engine, progress, since=checkpoint.since, workers=workers)
+    if on_samples is not None:
+        on_samples(samples, checkpoint.since)
+    sleep_records = _sleep_records(samples)
+    if sleep_records:
+        checkpoint.update(_nights(samples, sleep_records), max(r['end'] for r in sleep_records))
+    return samples, sleep_records
+
+def parse_health_data(file_path, engine=None, progress=None, checkpoint=None, workers=None, on_samples=None):
+    # With a ParseCheckpoint, records already covered by it are skipped while scanning
+    # and the checkpoint is advanced in place (the caller persists it).
+    # on_samples, if given, receives the collected samples and the `since` they start at
+    # (e.g. RecordStore.write) before they are aggregated.
+    if checkpoint is not None:
+        samples, sleep_records = _ingest(file_path, engine, progress, checkpoint, workers, on_samples)
+    else:
+        samples = collect_samples(file_path, engine, progress, workers=workers)
+        if on_samples is not None:
+            on_samples(samples, None)
+        sleep_records = _sleep_records(samples)
+
+    if not sleep_records:
+        return None
+    return _latest_night(samples, sleep_records)
+
+def iter_nightly_metrics(file_path, engine=None, progress=None, checkpoint=None, workers=None, on_samples=None):
+    # Per-night mode: yields the metrics of every night in the export, oldest first.
+    # With a checkpoint, nights stored in it are returned as-is and only new ones are aggregated.
+    if checkpoint is not None:
+        _ingest(file_path, engine, progress, checkpoint, workers, on_samples)
+        for _, metrics in checkpoint.nights:
+            yield metrics
+        return
+
+    samples = collect_samples(file_path, engine, progress, workers=workers)
+    if on_samples is not None:
+        on_samples(samples, None)
+    for _, metrics in _nights(samples, _sleep_records(samples)):
+        yield metrics
 
 if __name__ == "__main__":
     xml_path = 'data/personal_data/apple_health_export/export.xml'
@@ -0,0 +1,201 @@
+import json
+import math
+import os
+import re
+import shutil
+from datetime import datetime, timezone
+import numpy as np
+from src.fast_health_parser import SIGNAL_KINDS, HealthSamples
+from src.night_signals import BUCKET_SECONDS, SignalBuckets
+from src.parse_apple_health import _nights, _sleep_records
+
+# Columnar store of the raw sleep-stage records and the per-minute heart-rate and vital
+# aggregates behind the nightly metrics, so a different night window or aggregation doesn't
+# need another pass over export.xml. The raw signal samples are stored as well; queries only
+# read the ones in the partial minutes at a night's edges.
+# Layout: <root>/<user_key>/<YYYY-MM>/<column>.npy, partitioned by the UTC month of each
+# record's start (or minute's) and sorted by it, plus a meta.json per month with the stage
+# names and the min/max time of each record type, and <root>/<user_key>/user.json.
+# Empty disables writing records on upload.
+RECORD_STORE_DIR = os.getenv("SLEEPINSIGHT_RECORD_STORE_DIR", "")
+
+SLEEP_COLUMNS = ('sleep_start', 'sleep_end', 'sleep_start_offset', 'sleep_end_offset', 'sleep_stage')
+# '<kind>_bucket', '<kind>_count', ... per signal, as SignalBuckets.columns() returns them
+SIGNAL_COLUMNS = {kind: tuple(f'{kind}_{name}' for name in SignalBuckets.COLUMNS) for kind in SIGNAL_KINDS}
+# '<kind>_time', '<kind>_value': the raw samples, as SignalBuckets.samples() returns them
+SAMPLE_COLUMNS = {kind: (f'{kind}_time', f'{kind}_value') for kind in SIGNAL_KINDS}
+# (record type, columns, column the partition is sorted by)
+KINDS = (('sleep', SLEEP_COLUMNS, 'sleep_start'),
+         *((kind, names, names[0]) for kind, names in SIGNAL_COLUMNS.items()),
+         *((f'{kind}_samples', names, names[0]) for kind, names in SAMPLE_COLUMNS.items()))
+ALL_COLUMNS = tuple(name for _, names, _ in KINDS for name in names)
+
+_MONTH_RE = re.compile(r'^\d{4}-\d{2}$')
+
+def _columns(samples) -> dict:
+    # Zero-copy NumPy views of the sleep arrays, plus the signal aggregates
+    columns = {name: np.frombuffer(getattr(samples, name), dtype=getattr(samples, name).typecode)
+               for name in SLEEP_COLUMNS}
+    for kind, names in SIGNAL_COLUMNS.items():
+        columns.update(zip(names, samples.signals[kind].columns()))
+        columns.update(zip(SAMPLE_COLUMNS[kind], samples.signals[kind].samples()))
+    return columns
+
+def _samples(columns: dict, stage_names, user_info=None) -> HealthSamples:
+    samples = HealthSamples()
+    if user_info:
+        samples.user_info = dict(user_info)
+    samples.stage_names = list(stage_names)
+    samples._stage_codes = {name: code for code, name in enumerate(samples.stage_names)}
+    for name in SLEEP_COLUMNS:
+        if name in columns:
+            getattr(samples, name).frombytes(np.ascontiguousarray(columns[name]).tobytes())
+    for kind, names in SIGNAL_COLUMNS.items():
+        if names[0] in columns:
+            samples.signals[kind] = SignalBuckets.from_columns(
+                *(columns[name] for name in names), *(columns.get(name) for name in SAMPLE_COLUMNS[kind]))
+    return samples
+
+def _month_keys(times: np.ndarray) -> np.ndarray:
+    return np.floor(times).astype('int64').astype('datetime64[s]').astype('datetime64[M]').astype(str)
+
+def _month_bounds(month: str):
+    # Epoch seconds of the month's first instant and of the next month's
+    start = np.datetime64(month, 'M')
+    return float(start.astype('datetime64[s]').astype('int64')), float((start + 1).astype('datetime64[s]').astype('int64'))
+
+def _minute_ceil(time: float) -> float:
+    return math.ceil(time / BUCKET_SECONDS) * BUCKET_SECONDS if math.isfinite(time) else time
+
+class RecordStore:
+    # Partitions are rewritten as a whole and swapped in by rename; queries memory-map the
+    # columns and binary-search the sort column, so only the requested range is read
+    def __init__(self, root: str = RECORD_STORE_DIR):
+        self.root = root
+
+    def _user_dir(self, user_key: str) -> str:
+        return os.path.join(self.root, user_key)
+
+    def _months(self, user_key: str):
+        user_dir = self._user_dir(user_key)
+        if not os.path.isdir(user_dir):
+            return []
+        return sorted(m for m in os.listdir(user_dir) if _MONTH_RE.match(m))
+
+    def _load(self, user_key: str, month: str, mmap_mode='r'):
+        path = os.path.join(self._user_dir(user_key), month)
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        columns = {}
+        for name in ALL_COLUMNS:
+            file = os.path.join(path, f'{name}.npy')
+            # Months written before a column existed read as empty
+            columns[name] = np.load(file, mmap_mode=mmap_mode) if os.path.exists(file) else np.empty(0, dtype=np.float64)
+        meta.update((kind, {'count': 0, 'min': None, 'max': None}) for kind, _, _ in KINDS if kind not in meta)
+        return meta, columns
+
+    def _save(self, user_key: str, month: str, samples: HealthSamples):
+        columns = _columns(samples)
+        meta = {'stage_names': samples.stage_names}
+        for kind, names, key in KINDS:
+            order = np.argsort(columns[key], kind='stable')
+            for name in names:
+                columns[name] = columns[name][order]
+            times = columns[key]
+            meta[kind] = {'count': len(times), 'min': float(times[0]) if len(times) else None,
+                          'max': float(times[-1]) if len(times) else None}
+
+        final = os.path.join(self._user_dir(user_key), month)
+        tmp = f"{final}.tmp-{os.getpid()}"
+        os.makedirs(tmp, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(tmp, f'{name}.npy'), values)
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        old = f"{final}.old-{os.getpid()}"
+        if os.path.exists(final):
+            os.rename(final, old)
+        os.rename(tmp, final)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def write(self, user_key: str, samples: HealthSamples, since=None):
+        # samples holds every record of the export starting at `since` (epoch seconds), or
+        # all of them when since is None. Stored records from `since` on are replaced by the
+        # new ones; months that end before it are left untouched.
+        user_dir = self._user_dir(user_key)
+        if since is None:
+            shutil.rmtree(user_dir, ignore_errors=True)
+        os.makedirs(user_dir, exist_ok=True)
+        with open(os.path.join(user_dir, 'user.json'), 'w') as f:
+            json.dump(samples.user_info, f)
+
+        columns = _columns(samples)
+        month_keys = {kind: _month_keys(columns[key]) for kind, _, key in KINDS}
+        months = set().union(*(np.unique(keys).tolist() for keys in month_keys.values()))
+        if since is not None:
+            months.update(m for m in self._months(user_key) if _month_bounds(m)[1] > since)
+
+        for month in sorted(months):
+            part = self._kept(user_key, month, since)
+            new = {}
+            for kind, names, key in KINDS:
+                mask = month_keys[kind] == month
+                new.update((name, columns[name][mask]) for name in names)
+            part.extend(_samples(new, samples.stage_names))
+            self._save(user_key, month, part)
+
+    def _kept(self, user_key: str, month: str, since) -> HealthSamples:
+        # Stored records of the month that start before `since`
+        if since is None or not os.path.isdir(os.path.join(self._user_dir(user_key), month)):
+            return HealthSamples()
+        meta, columns = self._load(user_key, month)
+        kept = {}
+        for kind, names, key in KINDS:
+            hi = np.searchsorted(columns[key], since, side='left')
+            kept.update((name, columns[name][:hi]) for name in names)
+        return _samples(kept, meta['stage_names'])
+
+    def query(self, user_key: str, start=None, end=None) -> HealthSamples:
+        # Samples of the records starting in [start, end) (epoch seconds, either open), in
+        # the order a full parse would sort them. Months outside the range are never opened,
+        # and within a month only the matching slice of each column is read.
+        lo_time = -np.inf if start is None else start
+        hi_time = np.inf if end is None else end
+        user_path = os.path.join(self._user_dir(user_key), 'user.json')
+        user_info = None
+        if os.path.exists(user_path):
+            with open(user_path) as f:
+                user_info = json.load(f)
+        samples = _samples({}, [], user_info)
+        for month in self._months(user_key):
+            month_start, month_end = _month_bounds(month)
+            if month_end <= lo_time or month_start >= hi_time:
+                continue
+            meta, columns = self._load(user_key, month)
+            part = {}
+            for kind, names, key in KINDS:
+                bounds = meta[kind]
+                # Raw samples are cut where the buckets are: at the minutes starting in the range
+                lo_key, hi_key = (_minute_ceil(lo_time), _minute_ceil(hi_time)) if kind.endswith('_samples') else (lo_time, hi_time)
+                if not bounds['count'] or bounds['max'] < lo_key or bounds['min'] >= hi_key:
+                    part.update((name, columns[name][:0]) for name in names)
+                    continue
+                lo = np.searchsorted(columns[key], lo_key, side='left')
+                hi = np.searchsorted(columns[key], hi_key, side='left')
+                part.update((name, columns[name][lo:hi]) for name in names)
+            samples.extend(_samples(part, meta['stage_names']))
+        return samples
+
+    def query_nights(self, user_key: str, start=None, end=None) -> list:
+        # Nightly metrics of the stored records in [start, end), as iter_nightly_metrics returns them
+        samples = self.query(user_key, start, end)
+        return [metrics for _, metrics in _nights(samples, _sleep_records(samples))]
+
+    def delete(self, user_key: str):
+        shutil.rmtree(self._user_dir(user_key), ignore_errors=True)
+
+def to_epoch(value: datetime) -> float:
+    # Naive datetimes are taken as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
@@ -0,0 +1,269 @@
+import hashlib
+import json
+import os
+import sys
+import weakref
+import numpy as np
+
+# Serving artifact: a directory of raw .npy arrays plus a small JSON manifest.
+# Arrays are opened with mmap, so loading costs no sklearn import, pages are only
+# read when touched, and every uvicorn worker on the host shares the same page cache.
+SERVING_FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+ARRAYS = [
+    "num_impute", "num_mean", "num_scale",
+    "tree_roots", "node_feature", "node_threshold", "node_left", "node_right", "node_value",
+]
+
+# Rows per traversal block in ServingModel.apply
+APPLY_BLOCK_ROWS = 512
+
+class ServingModel:
+    # NumPy re-implementation of the fitted pipeline:
+    # mean imputation -> standard scaling -> gender one-hot -> random forest mean
+    def __init__(self, manifest: dict, arrays: dict):
+        self.manifest = manifest
+        self.numeric_features = manifest["numeric_features"]
+        self.categorical_feature = manifest["categorical_feature"]
+        self.categories = np.array(manifest["categories"], dtype=object)
+        # What the categorical imputer fills missing values with (manifests written before
+        # it was recorded leave missing values unencoded)
+        self.categorical_fill = manifest.get("categorical_fill")
+        self.max_depth = manifest["max_depth"]
+        self.feature_names_in_ = np.array(manifest["feature_names_in"], dtype=object)
+        for name in ARRAYS:
+            setattr(self, name, arrays[name])
+        # Traversal tables derived at load time (kept out of the artifact):
+        # interleaved [left, right] children so one gather picks the next node, and
+        # thresholds rounded down to float32 so comparing float32 inputs against them
+        # gives exactly the same split as sklearn's float32-vs-float64 comparison
+        self.node_children = np.column_stack([self.node_left, self.node_right]).ravel().astype(np.intp)
+        threshold32 = np.asarray(self.node_threshold, dtype=np.float32)
+        too_high = threshold32.astype(np.float64) > self.node_threshold
+        threshold32[too_high] = np.nextafter(threshold32[too_high], np.float32(-np.inf))
+        self.node_threshold32 = threshold32
+        self.node_feature_idx = np.asarray(self.node_feature, dtype=np.intp)
+        self.root_nodes = np.asarray(self.tree_roots, dtype=np.intp)
+        # Model inputs that explanations are reported against: the numeric features, then
+        # the categorical one (all of its one-hot columns credit it)
+        self.input_features = list(self.numeric_features) + [self.categorical_feature]
+        self._node_contributions = None
+
+    @property
+    def node_contributions(self) -> np.ndarray:
+        # (n_nodes, n_inputs) Saabas decomposition, built on first use: every split moves the
+        # prediction from the parent's value to the child's, and that change is credited to
+        # the split's input feature. Accumulated from the roots down, a leaf's row is the sum
+        # over its whole decision path, so explaining a row is one gather per tree.
+        if self._node_contributions is None:
+            n_numeric = len(self.numeric_features)
+            column_input = np.append(np.arange(n_numeric), np.full(len(self.categories), n_numeric))
+            left = np.asarray(self.node_left, dtype=np.intp)
+            right = np.asarray(self.node_right, dtype=np.intp)
+            contributions = np.zeros((len(self.node_value), len(self.input_features)))
+            frontier = self.root_nodes
+            for _ in range(self.max_depth):
+                # Leaves point to themselves
+                frontier = frontier[left[frontier] != frontier]
+                if not len(frontier):
+                    break
+                feature = column_input[self.node_feature_idx[frontier]]
+                children = (left[frontier], right[frontier])
+                for child in children:
+                    contributions[child] = contributions[frontier]
+                    contributions[child, feature] += self.node_value[child] - self.node_value[frontier]
+                frontier = np.concatenate(children)
+            self._node_contributions = contributions
+        return self._node_contributions
+
+    @property
+    def base_value(self) -> float:
+        # Prediction before any split: the mean of the root values (the training target mean)
+        return float(np.asarray(self.node_value)[self.root_nodes].mean())
+
+    def transform(self, numeric: np.ndarray, categories) -> np.ndarray:
+        # numeric: (n, 7) float64 with NaN for missing values; categories: length-n sequence
+        X = np.where(np.isnan(numeric), self.num_impute, numeric)
+        X = (X - self.num_mean) / self.num_scale
+        # Missing categories (None or NaN) are imputed first; if the fill value was never seen in
+        # training, they encode as all zeros like unknown ones (handle_unknown='ignore')
+        categories = np.asarray(categories, dtype=object)
+        if self.categorical_fill is not None:
+            missing = np.equal(categories, None) | (categories != categories)
+            categories = np.where(missing, self.categorical_fill, categories)
+        onehot = categories[:, None] == self.categories[None, :]
+        return np.hstack([X, onehot.astype(np.float64)])
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        # Walks every tree for every row at once, one depth level per step. Leaves point
+        # to themselves, so rows that finished early simply stay put.
+        # Rows are processed in blocks so the (rows x trees) working set stays in cache.
+        X32 = np.ascontiguousarray(X, dtype=np.float32)
+        leaves = np.empty((X32.shape[0], len(self.root_nodes)), dtype=np.intp)
+        for start in range(0, X32.shape[0], APPLY_BLOCK_ROWS):
+            block = X32[start:start + APPLY_BLOCK_ROWS]
+            leaves[start:start + len(block)] = self._apply_block(block)
+        return leaves
+
+    def _apply_block(self, X32: np.ndarray) -> np.ndarray:
+        n_rows, n_cols = X32.shape
+        flat = X32.ravel()
+        row_base = (np.arange(n_rows, dtype=np.intp) * n_cols)[:, None]
+        node = np.tile(self.root_nodes, (n_rows, 1))
+        # Scratch buffers reused across levels to avoid per-step allocations
+        idx = np.empty_like(node)
+        values = np.empty(node.shape, dtype=np.float32)
+        thresholds = np.empty(node.shape, dtype=np.float32)
+        go_right = np.empty(node.shape, dtype=bool)
+        for _ in range(self.max_depth):
+            np.take(self.node_feature_idx, node, out=idx)
+            idx += row_base
+            np.take(flat, idx, out=values)
+            np.take(self.node_threshold32, node, out=thresholds)
+            # Not '>' so that NaN goes right, like sklearn
+            np.less_equal(values, thresholds, out=go_right)
+            np.logical_not(go_right, out=go_right)
+            node <<= 1
+            node += go_right
+            np.take(self.node_children, node, out=node)
+        return node
+
+    def predict_arrays(self, numeric: np.ndarray, categories) -> np.ndarray:
+        leaves = self.apply(self.transform(numeric, categories))
+        return self.node_value[leaves].mean(axis=1)
+
+    def explain_arrays(self, numeric: np.ndarray, categories) -> np.ndarray:
+        # (n, n_inputs) contribution of each input feature to each row's prediction; with
+        # base_value they add up to predict_arrays (before the API clips it to 0-100)
+        leaves = self.apply(self.transform(numeric, categories))
+        return self.node_contributions[leaves].mean(axis=1)
+
+    def _record_arrays(self, records):
+        # None becomes NaN and is imputed like in the pipeline
+        numeric = np.array([[getattr(r, f) for f in self.numeric_features] for r in records], dtype=np.float64)
+        numeric = numeric.reshape(len(records), len(self.numeric_features))
+        categories = [getattr(r, self.categorical_feature) for r in records]
+        return numeric, categories
+
+    def predict_records(self, records) -> np.ndarray:
+        # Scores objects exposing the feature attributes (e.g. SleepInput) without building
+        # a DataFrame
+        return self.predict_arrays(*self._record_arrays(records))
+
+    def explain_records(self, records) -> np.ndarray:
+        return self.explain_arrays(*self._record_arrays(records))
+
+    def predict(self, frame) -> np.ndarray:
+        # Drop-in for Pipeline.predict on the DataFrame built by the API
+        numeric = frame[self.numeric_features].astype(np.float64).to_numpy()
+        return self.predict_arrays(numeric, frame[self.categorical_feature].tolist())
+
+def _pipeline_arrays(pipeline):
+    pre = pipeline.named_steps["preprocessor"]
+    num = pre.named_transformers_["num"]
+    cat = pre.named_transformers_["cat"]
+    forest = pipeline.named_steps["regressor"]
+    numeric_features = list(pre.transformers_[0][2])
+    categorical_features = list(pre.transformers_[1][2])
+    if len(categorical_features) != 1:
+        raise ValueError("Serving format supports exactly one categorical feature")
+
+    # Flatten all trees into one node table with global indices
+    roots, feature, threshold, left, right, value = [], [], [], [], [], []
+    offset = 0
+    for est in forest.estimators_:
+        tree = est.tree_
+        is_leaf = tree.children_left < 0
+        idx = np.arange(tree.node_count)
+        roots.append(offset)
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        left.append(np.where(is_leaf, idx, tree.children_left) + offset)
+        right.append(np.where(is_leaf, idx, tree.children_right) + offset)
+        value.append(tree.value[:, 0, 0])
+        offset += tree.node_count
+
+    manifest = {
+        "format_version": SERVING_FORMAT_VERSION,
+        "numeric_features": numeric_features,
+        "categorical_feature": categorical_features[0],
+        "categories": [str(c) for c in cat.named_steps["onehot"].categories_[0]],
+        "categorical_fill": str(cat.named_steps["imputer"].statistics_[0]),
+        "feature_names_in": [str(c) for c in pipeline.feature_names_in_],
+        "max_depth": int(max(est.tree_.max_depth for est in forest.estimators_)),
+        "n_trees": len(forest.estimators_),
+        "n_nodes": offset,
+    }
+    arrays = {
+        "num_impute": np.asarray(num.named_steps["imputer"].statistics_, dtype=np.float64),
+        "num_mean": np.asarray(num.named_steps["scaler"].mean_, dtype=np.float64),
+        "num_scale": np.asarray(num.named_steps["scaler"].scale_, dtype=np.float64),
+        "tree_roots": np.asarray(roots, dtype=np.int32),
+        "node_feature": np.concatenate(feature).astype(np.int32),
+        "node_threshold": np.concatenate(threshold).astype(np.float64),
+        "node_left": np.concatenate(left).astype(np.int32),
+        "node_right": np.concatenate(right).astype(np.int32),
+        "node_value": np.concatenate(value).astype(np.float64),
+    }
+    return manifest, arrays
+
+def compile_pipeline(pipeline) -> ServingModel:
+    # In-memory NumPy predictor for an already loaded sklearn pipeline
+    manifest, arrays = _pipeline_arrays(pipeline)
+    return ServingModel(manifest, arrays)
+
+# Compiled copies of sklearn pipelines for explanations, dropped along with the pipeline
+_explainers = weakref.WeakKeyDictionary()
+
+def explainer_for(model) -> ServingModel:
+    # The NumPy predictor that explains a loaded model: the model itself for the NumPy engine
+    # and the serving format, otherwise its pipeline compiled once on first use
+    if isinstance(model, ServingModel):
+        return model
+    explainer = _explainers.get(model)
+    if explainer is None:
+        explainer = _explainers[model] = compile_pipeline(model)
+    return explainer
+
+def explain_model_records(model, records):
+    # (base value, input feature names, (n, n_inputs) contributions) for any loaded model
+    explainer = explainer_for(model)
+    return explainer.base_value, explainer.input_features, explainer.explain_records(records)
+
+def export_serving_model(pipeline, out_dir: str) -> dict:
+    manifest, arrays = _pipeline_arrays(pipeline)
+    os.makedirs(out_dir, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(out_dir, f"{name}.npy"), np.ascontiguousarray(arr))
+    with open(os.path.join(out_dir, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def load_serving_model(model_dir: str, mmap: bool = True) -> ServingModel:
+    with open(os.path.join(model_dir, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SERVING_FORMAT_VERSION:
+        raise ValueError(f"Unsupported serving model format: {manifest.get('format_version')}")
+    mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(model_dir, f"{name}.npy"), mmap_mode=mode) for name in ARRAYS}
+    return ServingModel(manifest, arrays)
+
+def artifact_version(path: str) -> str:
+    # Content hash of a model artifact (pickle file or serving directory); changes on every retrain
+    h = hashlib.sha256()
+    files = [path] if os.path.isfile(path) else [os.path.join(path, n) for n in sorted(os.listdir(path))]
+    for name in files:
+        h.update(os.path.basename(name).encode())
+        with open(name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+    return h.hexdigest()[:12]
+
+if __name__ == "__main__":
+    # Convert an existing pipeline pickle without retraining:
+    #   python -m src.serving_model models/sleep_model_pipeline.pkl models/sleep_model_serving
+    import joblib
+    pkl_path = sys.argv[1] if len(sys.argv) > 1 else "models/sleep_model_pipeline.pkl"
+    out_dir = sys.argv[2] if len(sys.argv) > 2 else "models/sleep_model_serving"
+    manifest = export_serving_model(joblib.load(pkl_path), out_dir)
+    print(f"Serving model with {manifest['n_trees']} trees / {manifest['n_nodes']} nodes written to {out_dir}")
@@ -9,58 +9,67 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
 import os
-
-# Load processed data
-df = pd.read_csv('data/processed_training_data.csv')
-
-# Define features and target
-X = df.drop('sleep_score', axis=1)
-y = df['sleep_score']
+from src.serving_model import export_serving_model
 
 # Separate features by type
 numeric_features = ['age', 'sleep_duration_hr', 'heart_rate', 'stress_level', 'rem_percent', 'deep_percent', 'awakenings']
 categorical_features = ['gender']
 
-# Preprocessing Pipeline
-numeric_transformer = Pipeline(steps=[
-    ('imputer', SimpleImputer(strategy='mean')),
-    ('scaler', StandardScaler())
-])
+def build_pipeline(regressor) -> Pipeline:
+    # Preprocessing Pipeline
+    numeric_transformer = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='mean')),
+        ('scaler', StandardScaler())
+    ])
+
+    categorical_transformer = Pipeline(steps=[
+        ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
+        ('onehot', OneHotEncoder(handle_unknown='ignore'))
+    ])
 
-categorical_transformer = Pipeline(steps=[
-    ('imputer', SimpleImputer(strategy='constant', fill_value='missing')),
-    ('onehot', OneHotEncoder(handle_unknown='ignore'))
-])
+    preprocessor = ColumnTransformer(
+        transformers=[
+            ('num', numeric_transformer, numeric_features),
+            ('cat', categorical_transformer, categorical_features)
+        ])
 
-preprocessor = ColumnTransformer(
-    transformers=[
-        ('num', numeric_transformer, numeric_features),
-        ('cat', categorical_transformer, categorical_features)
+    # Full Pipeline with Model
+    return Pipeline(steps=[
+        ('preprocessor', preprocessor),
+        ('regressor', regressor)
     ])
 
-# Training Split
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+if __name__ == "__main__":
+    # Load processed data
+    df = pd.read_csv('data/processed_training_data.csv')
+
+    # Define features and target
+    X = df.drop('sleep_score', axis=1)
+    y = df['sleep_score']
+
+    # Training Split
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    model_pipeline = build_pipeline(RandomForestRegressor(n_estimators=100, random_state=42))
 
-# Full Pipeline with Model
-model_pipeline = Pipeline(steps=[
-    ('preprocessor', preprocessor),
-    ('regressor', RandomForestRegressor(n_estimators=100, random_state=42))
-])
+    # Fit Model
+    print("Training RandomForestRegressor...")
+    model_pipeline.fit(X_train, y_train)
 
-# Fit Model
-print("Training RandomForestRegressor...")
-model_pipeline.fit(X_train, y_train)
+    # Evaluate
+    y_pred = model_pipeline.predict(X_test)
+    mae = mean_absolute_error(y_test, y_pred)
+    r2 = r2_score(y_test, y_pred)
 
-# Evaluate
-y_pred = model_pipeline.predict(X_test)
-mae = mean_absolute_error(y_test, y_pred)
-r2 = r2_score(y_test, y_pred)
+    print(f"Model Results: MAE={mae:.2f}, R2={r2:.2f}")
 
-print(f"Model Results: MAE={mae:.2f}, R2={r2:.2f}")
+    # Save artifacts
+    if not os.path.exists('models'):
+        os.makedirs('models')
 
-# Save artifacts
-if not os.path.exists('models'):
-    os.makedirs('models')
+    joblib.dump(model_pipeline, 'models/sleep_model_pipeline.pkl')
+    print("Model pipeline saved to models/sleep_model_pipeline.pkl")
 
-joblib.dump(model_pipeline, 'models/sleep_model_pipeline.pkl')
-print("Model pipeline saved to models/sleep_model_pipeline.pkl")
+    # Compact memory-mappable artifact used when serving with SLEEPINSIGHT_MODEL_FORMAT=serving
+    export_serving_model(model_pipeline, 'models/sleep_model_serving')
+    print("Serving model saved to models/sleep_model_serving")
@@ -0,0 +1,303 @@
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import time
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import RandomForestRegressor
+from sklearn.metrics import mean_absolute_error, r2_score
+from sklearn.model_selection import KFold, train_test_split
+from src.preprocess_data import HEALTH_CSV, EFFICIENCY_CSV, load_merged_dataset
+from src.serving_model import compile_pipeline, export_serving_model
+from src.train_model import build_pipeline
+from src.upload_cache import hash_file
+
+# Training CLI: cached preprocessing, parallel cross-validated hyperparameter search and
+# model selection on accuracy and serving cost together.
+#   python -m src.training                     # search, evaluate, write the report
+#   python -m src.training --promote           # ... and install the selected model
+# Every (model, params, fold) fit is checkpointed under --run-dir, so re-running an
+# interrupted search only fits the folds that are missing.
+
+DATA_CACHE_DIR = "data/cache"
+RUN_DIR = "models/training_run"
+PRODUCTION_MODEL_PATH = "models/sleep_model_pipeline.pkl"
+PRODUCTION_SERVING_DIR = "models/sleep_model_serving"
+
+# Bump when merge_datasets changes so cached datasets are rebuilt
+PREPROCESS_VERSION = 1
+
+SEARCH_SPACES = {
+    "random_forest": {"n_estimators": [100, 300], "max_depth": [None, 12], "min_samples_leaf": [1, 4]},
+    "xgboost": {"n_estimators": [200, 500], "max_depth": [3, 6], "learning_rate": [0.05, 0.1]},
+}
+
+def dataset_key(health_path: str, efficiency_path: str) -> str:
+    # Content hashes of the raw sources, so edited CSVs never hit a stale cache
+    h = hashlib.sha256(f"v{PREPROCESS_VERSION}".encode())
+    for path in (health_path, efficiency_path):
+        h.update(hash_file(path).encode())
+    return h.hexdigest()[:16]
+
+def _save_columns(frame: pd.DataFrame, out_dir: str):
+    # One .npy per column, like the serving model artifact; strings are stored as fixed-width
+    # unicode with missing values as "" (restored to NaN on load)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    columns = {}
+    for col in frame.columns:
+        if pd.api.types.is_numeric_dtype(frame[col]):
+            arr = frame[col].to_numpy(dtype=np.float64)
+            columns[col] = "float64"
+        else:
+            arr = frame[col].where(frame[col].notna(), "").astype(str).to_numpy(dtype=str)
+            columns[col] = "str"
+        np.save(os.path.join(tmp_dir, f"{col}.npy"), arr)
+    with open(os.path.join(tmp_dir, "columns.json"), "w") as f:
+        json.dump({"columns": columns, "rows": len(frame)}, f, indent=2)
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+
+def _load_columns(in_dir: str) -> pd.DataFrame:
+    with open(os.path.join(in_dir, "columns.json")) as f:
+        columns = json.load(f)["columns"]
+    data = {}
+    for col, kind in columns.items():
+        arr = np.load(os.path.join(in_dir, f"{col}.npy"))
+        data[col] = pd.Series(arr, dtype=object).replace("", np.nan) if kind == "str" else arr
+    return pd.DataFrame(data, columns=list(columns))
+
+def load_dataset(health_path: str, efficiency_path: str, cache_dir: str = DATA_CACHE_DIR, refresh: bool = False):
+    # Returns (frame, key, from_cache)
+    key = dataset_key(health_path, efficiency_path)
+    path = os.path.join(cache_dir, key)
+    if not refresh and os.path.exists(os.path.join(path, "columns.json")):
+        return _load_columns(path), key, True
+    frame = load_merged_dataset(health_path, efficiency_path)
+    _save_columns(frame, path)
+    return frame, key, False
+
+def make_regressor(name: str, params: dict, n_jobs: int = 1):
+    if name == "random_forest":
+        return RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+    if name == "xgboost":
+        from xgboost import XGBRegressor
+        return XGBRegressor(random_state=42, n_jobs=n_jobs, tree_method="hist", **params)
+    raise ValueError(f"Unknown model: {name}")
+
+def candidate_params(name: str):
+    space = SEARCH_SPACES[name]
+    return [dict(zip(space, values)) for values in itertools.product(*space.values())]
+
+def params_id(params: dict) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:10]
+
+def checkpoint_path(run_dir: str, key: str, name: str, params: dict, folds: int, seed: int, fold: int) -> str:
+    # The dataset and CV split are part of the name: checkpoints of another dataset or
+    # split are ignored rather than mixed in
+    split = hashlib.sha256(f"{key}:{folds}:{seed}".encode()).hexdigest()[:8]
+    return os.path.join(run_dir, "folds", f"{name}-{params_id(params)}-{split}-fold{fold}.json")
+
+def fit_fold(X, y, train_idx, val_idx, name, params, fold, path):
+    # One CV task: fit on the fold's training rows, score its validation rows, checkpoint
+    pipeline = build_pipeline(make_regressor(name, params))
+    t0 = time.perf_counter()
+    pipeline.fit(X.iloc[train_idx], y.iloc[train_idx])
+    fit_seconds = time.perf_counter() - t0
+    pred = pipeline.predict(X.iloc[val_idx])
+    result = {
+        "model": name, "params": params, "fold": fold,
+        "mae": float(mean_absolute_error(y.iloc[val_idx], pred)),
+        "r2": float(r2_score(y.iloc[val_idx], pred)),
+        "fit_seconds": round(fit_seconds, 3),
+    }
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+    return result
+
+def run_search(X, y, key, models, run_dir, folds=5, seed=42, n_jobs=-1):
+    # Parallel over every (model, params, fold) task; each fit is single-threaded so the
+    # pool, not the estimator, spreads work across cores. Finished folds are loaded from
+    # their checkpoints.
+    os.makedirs(os.path.join(run_dir, "folds"), exist_ok=True)
+    splits = list(KFold(n_splits=folds, shuffle=True, random_state=seed).split(X))
+    done, tasks = [], []
+    for name in models:
+        for params in candidate_params(name):
+            for fold, (train_idx, val_idx) in enumerate(splits):
+                path = checkpoint_path(run_dir, key, name, params, folds, seed, fold)
+                if os.path.exists(path):
+                    with open(path) as f:
+                        done.append(json.load(f))
+                else:
+                    tasks.append(delayed(fit_fold)(X, y, train_idx, val_idx, name, params, fold, path))
+    print(f"CV search: {len(done)} fold(s) resumed from checkpoints, {len(tasks)} to fit")
+    fitted = Parallel(n_jobs=n_jobs, verbose=5 if tasks else 0)(tasks) if tasks else []
+    return summarize_search(done + fitted)
+
+def summarize_search(fold_results):
+    # Mean CV metrics per (model, params), best first within each model
+    grouped = {}
+    for r in fold_results:
+        grouped.setdefault((r["model"], params_id(r["params"])), []).append(r)
+    summary = []
+    for (name, _), rows in grouped.items():
+        maes = [r["mae"] for r in rows]
+        summary.append({
+            "model": name,
+            "params": rows[0]["params"],
+            "cv_mae": round(float(np.mean(maes)), 4),
+            "cv_mae_std": round(float(np.std(maes)), 4),
+            "cv_r2": round(float(np.mean([r["r2"] for r in rows])), 4),
+            "fit_seconds": round(float(np.mean([r["fit_seconds"] for r in rows])), 3),
+        })
+    return sorted(summary, key=lambda s: (s["model"], s["cv_mae"]))
+
+def median_ms(fn, repeat=50):
+    fn()  # warm-up
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return round(float(np.median(times)) * 1000, 4)
+
+def evaluate_candidate(name, params, X_train, y_train, X_test, y_test, out_dir, n_jobs=-1):
+    # Refit the best params on the full training split, then measure holdout accuracy
+    # and serving cost: artifact size and single-row / batch-of-100 prediction latency
+    pipeline = build_pipeline(make_regressor(name, params, n_jobs=n_jobs))
+    pipeline.fit(X_train, y_train)
+    # Serving predicts in-process on one thread
+    pipeline.named_steps["regressor"].set_params(n_jobs=1)
+    pred = pipeline.predict(X_test)
+
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, f"{name}.pkl")
+    joblib.dump(pipeline, path)
+    one, batch = X_test.iloc[:1], X_test.iloc[:100]
+    result = {
+        "model": name,
+        "params": params,
+        "path": path,
+        "holdout_mae": round(float(mean_absolute_error(y_test, pred)), 4),
+        "holdout_r2": round(float(r2_score(y_test, pred)), 4),
+        "artifact_bytes": os.path.getsize(path),
+        "latency_b1_ms": median_ms(lambda: pipeline.predict(one)),
+        "latency_b100_ms": median_ms(lambda: pipeline.predict(batch)),
+    }
+    if name == "random_forest":
+        # The serving format and NumPy engine only support the forest
+        serving_dir = os.path.join(out_dir, f"{name}_serving")
+        export_serving_model(pipeline, serving_dir)
+        result["serving_dir"] = serving_dir
+        result["serving_artifact_bytes"] = sum(os.path.getsize(os.path.join(serving_dir, f)) for f in os.listdir(serving_dir))
+        compiled = compile_pipeline(pipeline)
+        result["numpy_latency_b1_ms"] = median_ms(lambda: compiled.predict(one))
+        result["numpy_latency_b100_ms"] = median_ms(lambda: compiled.predict(batch))
+    return result
+
+def choose_production(candidates, mae_tolerance=0.02):
+    # Only candidates with a serving export can be promoted: the serving format, the NumPy
+    # engine, explanations and batch rescoring all compile the forest. Any of those within
+    # mae_tolerance (relative) of the most accurate one is good enough; among those, the
+    # cheapest to serve wins (single-row latency, then artifact size). None if none qualify.
+    servable = [c for c in candidates if "serving_dir" in c]
+    if not servable:
+        return None
+    best_mae = min(c["holdout_mae"] for c in servable)
+    eligible = [c for c in servable if c["holdout_mae"] <= best_mae * (1 + mae_tolerance)]
+    return min(eligible, key=lambda c: (c["latency_b1_ms"], c["artifact_bytes"]))
+
+def promote(candidate):
+    if candidate is None or "serving_dir" not in candidate:
+        name = candidate["model"] if candidate else "no candidate"
+        raise SystemExit(f"Refusing to promote {name}: only RandomForest pipelines have a serving export; "
+                         f"{PRODUCTION_MODEL_PATH} was left unchanged")
+    # Written next to the target and renamed into place: a running server watching the
+    # artifact (src/model_registry.py) never sees a partially copied model
+    shutil.copyfile(candidate["path"], PRODUCTION_MODEL_PATH + ".tmp")
+    os.replace(PRODUCTION_MODEL_PATH + ".tmp", PRODUCTION_MODEL_PATH)
+    print(f"Model pipeline saved to {PRODUCTION_MODEL_PATH}")
+    tmp_dir = PRODUCTION_SERVING_DIR + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    shutil.copytree(candidate["serving_dir"], tmp_dir)
+    shutil.rmtree(PRODUCTION_SERVING_DIR, ignore_errors=True)
+    os.replace(tmp_dir, PRODUCTION_SERVING_DIR)
+    print(f"Serving model saved to {PRODUCTION_SERVING_DIR}")
+
+def print_report(search, candidates, selected):
+    print(f"\n{'model':<14} {'params':<58} {'cv MAE':>8} {'± std':>7} {'cv R2':>7}")
+    for s in search:
+        print(f"{s['model']:<14} {json.dumps(s['params']):<58} {s['cv_mae']:8.3f} {s['cv_mae_std']:7.3f} {s['cv_r2']:7.3f}")
+    print(f"\n{'model':<14} {'MAE':>7} {'R2':>7} {'size KB':>9} {'b1 ms':>8} {'b100 ms':>8}")
+    for c in candidates:
+        flag = "  <- selected" if c is selected else ""
+        print(f"{c['model']:<14} {c['holdout_mae']:7.3f} {c['holdout_r2']:7.3f} {c['artifact_bytes'] / 1024:9.1f} "
+              f"{c['latency_b1_ms']:8.3f} {c['latency_b100_ms']:8.3f}{flag}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train, compare and select the sleep score model")
+    parser.add_argument('--health', default=HEALTH_CSV)
+    parser.add_argument('--efficiency', default=EFFICIENCY_CSV)
+    parser.add_argument('--cache-dir', default=DATA_CACHE_DIR, help="Where merged datasets are cached")
+    parser.add_argument('--refresh-cache', action='store_true', help="Rebuild the merged dataset even if cached")
+    parser.add_argument('--run-dir', default=RUN_DIR, help="Fold checkpoints, candidate artifacts and report")
+    parser.add_argument('--fresh', action='store_true', help="Discard fold checkpoints instead of resuming")
+    parser.add_argument('--models', default=','.join(SEARCH_SPACES), help="Comma-separated: random_forest,xgboost")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Parallel CV tasks (-1: all cores)")
+    parser.add_argument('--mae-tolerance', type=float, default=0.02,
+                        help="Relative MAE slack within which the cheapest model to serve is selected")
+    parser.add_argument('--promote', action='store_true', help=f"Install the selected model as {PRODUCTION_MODEL_PATH}")
+    args = parser.parse_args()
+
+    models = [m for m in args.models.split(',') if m]
+    unknown = set(models) - set(SEARCH_SPACES)
+    if unknown:
+        parser.error(f"unknown model(s): {', '.join(sorted(unknown))}")
+
+    t0 = time.perf_counter()
+    df, key, from_cache = load_dataset(args.health, args.efficiency, args.cache_dir, args.refresh_cache)
+    print(f"Dataset {key}: {len(df)} rows ({'cached' if from_cache else 'built'}) in {time.perf_counter() - t0:.2f}s")
+
+    X = df.drop('sleep_score', axis=1)
+    y = df['sleep_score']
+    # Same holdout as src/train_model.py; the search only sees the training split
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    X_train, y_train = X_train.reset_index(drop=True), y_train.reset_index(drop=True)
+
+    if args.fresh:
+        shutil.rmtree(os.path.join(args.run_dir, "folds"), ignore_errors=True)
+    search = run_search(X_train, y_train, key, models, args.run_dir, args.folds, args.seed, args.n_jobs)
+
+    candidates = []
+    for name in models:
+        best = min((s for s in search if s["model"] == name), key=lambda s: s["cv_mae"])
+        print(f"Evaluating {name} {json.dumps(best['params'])}...")
+        result = evaluate_candidate(name, best["params"], X_train, y_train, X_test, y_test,
+                                    os.path.join(args.run_dir, "candidates"), args.n_jobs)
+        result.update({k: best[k] for k in ("cv_mae", "cv_mae_std", "cv_r2")})
+        candidates.append(result)
+    selected = choose_production(candidates, args.mae_tolerance)
+    print_report(search, candidates, selected)
+
+    report_path = os.path.join(args.run_dir, "report.json")
+    with open(report_path, "w") as f:
+        json.dump({"dataset": key, "rows": len(df), "folds": args.folds, "seed": args.seed,
+                   "mae_tolerance": args.mae_tolerance, "search": search,
+                   "candidates": candidates, "selected": selected["model"] if selected else None}, f, indent=2)
+    if selected:
+        print(f"\nSelected {selected['model']}; report written to {report_path}")
+    else:
+        print(f"\nNo candidate has a serving export (add random_forest to --models); report written to {report_path}")
+    if args.promote:
+        promote(selected)
@@ -0,0 +1,85 @@
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+# Parsed upload results keyed by the upload's content hash, so re-uploading the same
+# export skips parsing entirely. Bounded by the (pickled) size of the stored results;
+# 0 disables the cache.
+UPLOAD_CACHE_MAX_BYTES = int(os.getenv("SLEEPINSIGHT_UPLOAD_CACHE_MAX_BYTES", str(64 * 1024 ** 2)))
+HASH_BLOCK_SIZE = 1 << 20
+
+def hash_upload(fileobj) -> str:
+    # Single sequential pass over the upload in 1 MB blocks; leaves the stream at the start
+    h = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(HASH_BLOCK_SIZE), b""):
+        h.update(block)
+    fileobj.seek(0)
+    return h.hexdigest()
+
+def hash_file(path: str) -> str:
+    with open(path, "rb") as f:
+        return hash_upload(f)
+
+def upload_cache_key(digest: str, suffix: str, all_nights: bool) -> str:
+    # The same bytes parse differently as CSV vs export, and latest-night vs timeline
+    return f"{digest}:{suffix}:{'all_nights' if all_nights else 'latest'}"
+
+class UploadResultCache:
+    # LRU evicting by total stored size rather than entry count: a multi-year timeline
+    # weighs far more than a single night
+    def __init__(self, max_bytes: int = UPLOAD_CACHE_MAX_BYTES):
+        self.max_bytes = max(0, max_bytes)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, result):
+        if not self.enabled or not result:
+            return
+        size = len(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[0]
+            self._entries[key] = (size, result)
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                _, (evicted_size, _) = self._entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+            }
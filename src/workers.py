@@ -0,0 +1,161 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional
+from src.metrics import record_stage as record_metrics_stage
+from src.model_registry import load_model_artifact
+from src.serving_model import explain_model_records
+
+# Parsing is CPU-bound pure Python, so it defaults to a process pool; inference spends
+# most of its time in NumPy/Cython and defaults to threads sharing the loaded model.
+PARSE_EXECUTOR = os.getenv("SLEEPINSIGHT_PARSE_EXECUTOR", "process")
+PARSE_WORKERS = int(os.getenv("SLEEPINSIGHT_PARSE_WORKERS", "2"))
+PARSE_MAX_QUEUE = int(os.getenv("SLEEPINSIGHT_PARSE_MAX_QUEUE", "2"))
+INFERENCE_EXECUTOR = os.getenv("SLEEPINSIGHT_INFERENCE_EXECUTOR", "thread")
+INFERENCE_WORKERS = int(os.getenv("SLEEPINSIGHT_INFERENCE_WORKERS", "4"))
+INFERENCE_MAX_QUEUE = int(os.getenv("SLEEPINSIGHT_INFERENCE_MAX_QUEUE", "64"))
+
+class PoolSaturated(Exception):
+    def __init__(self, pool: str):
+        super().__init__(pool)
+        self.pool = pool
+
+class StageStats:
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_seconds / self.count * 1000, 2) if self.count else 0.0,
+            "max_ms": round(self.max_seconds * 1000, 2),
+        }
+
+def _timed_call(fn, *args):
+    # Runs inside the worker so queue wait and execution time can be told apart
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - t0
+
+class WorkerPool:
+    # Executor wrapper with admission control. Counters are only touched from the
+    # event loop thread, so no locking is needed.
+    def __init__(self, name: str, kind: str, workers: int, max_queue: int, initializer=None, initargs=()):
+        if kind not in ("process", "thread"):
+            raise ValueError(f"Unknown executor kind for {name} pool: {kind}")
+        self.name = name
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.initializer = initializer
+        self.initargs = initargs
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.stages = {}
+        self._executor = None
+
+    def _get_executor(self):
+        # Created lazily so importing the app doesn't spawn workers
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=self.initializer,
+                    initargs=self.initargs
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=self.name)
+        return self._executor
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def record_stage(self, stage: str, seconds: float):
+        self.stages.setdefault(stage, StageStats()).record(seconds)
+        record_metrics_stage(stage, seconds)
+
+    async def run(self, stage: str, fn, *args):
+        # Backpressure: refuse new work once every worker is busy and the queue is full
+        if self.in_flight >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PoolSaturated(self.name)
+
+        self.in_flight += 1
+        t0 = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            result, run_seconds = await loop.run_in_executor(self._get_executor(), _timed_call, fn, *args)
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        total = time.perf_counter() - t0
+        self.completed += 1
+        self.record_stage(stage, run_seconds)
+        self.record_stage(f"{stage}_queue_wait", max(0.0, total - run_seconds))
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "stages": {name: s.to_dict() for name, s in self.stages.items()},
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+# Model copies used by inference workers when they run as separate processes, keyed by
+# artifact path (one immutable snapshot per registry version) and loaded on first use
+_worker_models = OrderedDict()
+_worker_config = {"format": "pickle", "engine": "sklearn", "warm_versions": 2}
+
+def load_worker_model(model_path: Optional[str], model_format: str = "pickle", engine: str = "sklearn", warm_versions: int = 2):
+    # Pool initializer: records how artifacts are loaded and preloads the active version
+    _worker_config.update(format=model_format, engine=engine, warm_versions=max(1, warm_versions))
+    if model_path:
+        _worker_model(model_path)
+
+def _worker_model(model_path: str):
+    model = _worker_models.get(model_path)
+    if model is None:
+        model = load_model_artifact(model_path, _worker_config["format"], _worker_config["engine"])
+        _worker_models[model_path] = model
+        while len(_worker_models) > _worker_config["warm_versions"]:
+            _worker_models.popitem(last=False)
+    else:
+        _worker_models.move_to_end(model_path)
+    return model
+
+def predict_with_worker_model(model_path: str, frame):
+    return _worker_model(model_path).predict(frame)
+
+def predict_records_with_worker_model(model_path: str, records):
+    # NumPy engine: the records are scored as-is, no DataFrame on either side
+    return _worker_model(model_path).predict_records(records)
+
+def explain_records_with_worker_model(model_path: str, records):
+    return explain_model_records(_worker_model(model_path), records)
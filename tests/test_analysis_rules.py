@@ -0,0 +1,139 @@
+from types import SimpleNamespace
+import pytest
+from src.analysis_rules import RECORD_FIELDS, VECTORIZE_MIN_RECORDS, evaluate_rules
+
+# The per-field if-chains the rule table replaced, kept as the reference the table must match
+
+def original_interpretation(metric, value):
+    if metric == "Sleep Duration":
+        if value >= 7 and value <= 9:
+            return "Ideal sleep duration for cognitive function and physical health."
+        elif value < 7:
+            return f"Duration ({value}h) is below the recommended 7-9 hours. This can lead to sleep debt."
+        return "Oversleeping detected. Occasionally normal, but chronic oversleeping may be linked to underlying issues."
+    if metric == "Deep Sleep":
+        if value >= 18:
+            return "Excellent deep sleep percentage. This is crucial for physical recovery and growth hormone release."
+        elif value >= 13:
+            return "Deep sleep is within the normal range for physical restoration."
+        return "Deep sleep is low. You may feel physically unrefreshed or have muscle soreness."
+    if metric == "REM Sleep":
+        if value >= 20:
+            return "Healthy REM sleep. Essential for memory consolidation and emotional processing."
+        return "REM sleep is slightly below average. This might affect your mood or mental clarity."
+    if metric == "Sleeping Heart Rate":
+        if value < 60:
+            return "Heart rate is low (Athletic range). Generally a sign of good cardiovascular fitness."
+        elif value <= 80:
+            return "Heart rate is in the healthy resting range."
+        return "Elevated sleeping heart rate. Could be due to stress, late meals, or lack of recovery."
+    if metric == "Stress Level":
+        if value <= 3:
+            return "Low stress levels detected. Your nervous system is well-regulated."
+        elif value <= 6:
+            return "Moderate stress. Consider relaxation techniques before bed."
+        return "High physiological stress. This significantly impacts sleep quality and recovery."
+    raise KeyError(metric)
+
+def original_recommendations(r):
+    recs = ["Maintain a consistent sleep schedule"]
+    if r.sleep_duration_hr < 7:
+        recs.append("Prioritize an earlier bedtime to meet the 7-hour minimum requirement.")
+    if r.deep_percent is not None and r.deep_percent < 15:
+        recs.append("To boost deep sleep, ensure your bedroom is cool (around 18°C) and completely dark.")
+    if r.rem_percent is not None and r.rem_percent < 20:
+        recs.append("Improve REM sleep by avoiding alcohol and heavy meals 3 hours before bed.")
+    if r.heart_rate is not None and r.heart_rate > 75:
+        recs.append("Your sleeping HR is slightly high; try magnesium or a warm bath before sleep.")
+    if r.stress_level is not None and r.stress_level > 5:
+        recs.append("Incorporate 10 minutes of deep breathing or meditation to lower pre-sleep stress.")
+    if r.awakenings is not None and r.awakenings > 2:
+        recs.append("Multiple awakenings detected; check for environmental noise or try white noise.")
+    if r.breathing_disturbances_elevated or r.apnea_notification_received:
+        recs.append("URGENT: Based on breathing signals, we strongly recommend a formal clinical sleep study (Polysomnography).")
+    return recs
+
+def original_tier(score):
+    if score >= 85: return "Excellent"
+    if score >= 70: return "Good"
+    if score >= 50: return "Fair"
+    return "Poor"
+
+# (field, metric, values on and around every edge of its rule)
+BOUNDARY_CASES = [
+    ("sleep_duration_hr", "Sleep Duration", [0.0, 6.99, 7.0, 7.01, 8.99, 9.0, 9.01, 14.0]),
+    ("deep_percent", "Deep Sleep", [0.0, 12.99, 13.0, 13.01, 14.99, 15.0, 17.99, 18.0, 18.01]),
+    ("rem_percent", "REM Sleep", [0.0, 19.99, 20.0, 20.01]),
+    ("heart_rate", "Sleeping Heart Rate", [40.0, 59.99, 60.0, 60.01, 75.0, 75.01, 79.99, 80.0, 80.01]),
+    ("stress_level", "Stress Level", [0.0, 2.99, 3.0, 3.01, 5.0, 5.01, 5.99, 6.0, 6.01, 10.0]),
+    ("awakenings", None, [0.0, 1.99, 2.0, 2.01]),
+]
+
+# Rules added with the per-night vitals have no if-chain; their declared bands instead
+VITAL_CASES = [
+    ("resting_heart_rate", "Resting Heart Rate", 39.9, "very low"),
+    ("resting_heart_rate", "Resting Heart Rate", 40.0, "typical range"),
+    ("resting_heart_rate", "Resting Heart Rate", 60.0, "typical range"),
+    ("resting_heart_rate", "Resting Heart Rate", 60.1, "elevated"),
+    ("respiratory_rate", "Respiratory Rate", 11.9, "below the typical range"),
+    ("respiratory_rate", "Respiratory Rate", 12.0, "normal range"),
+    ("respiratory_rate", "Respiratory Rate", 20.0, "normal range"),
+    ("respiratory_rate", "Respiratory Rate", 20.1, "elevated"),
+    ("hrv_sdnn", "Heart Rate Variability", 40.0, "HRV is low"),
+    ("hrv_sdnn", "Heart Rate Variability", 40.1, "HRV is healthy"),
+]
+
+SCORES = [0.0, 49.99, 50.0, 69.99, 70.0, 84.99, 85.0, 100.0]
+
+def make_record(**values):
+    fields = dict.fromkeys(RECORD_FIELDS)
+    fields.update(sleep_duration_hr=7.5, breathing_disturbances_elevated=False, apnea_notification_received=False)
+    fields.update(values)
+    return SimpleNamespace(**fields)
+
+def records_and_scores():
+    cases = [(make_record(**{field: value}), metric, value)
+             for field, metric, values in BOUNDARY_CASES for value in values]
+    cases += [(make_record(breathing_disturbances_elevated=True), None, None),
+              (make_record(apnea_notification_received=True), None, None)]
+    records = [record for record, _, _ in cases]
+    scores = [SCORES[i % len(SCORES)] for i in range(len(records))]
+    return cases, records, scores
+
+def rows_by_metric(metrics):
+    return {row["metric"]: row for row in metrics}
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_rules_match_original_if_chains_at_boundaries(vectorized):
+    cases, records, scores = records_and_scores()
+    assert len(records) >= VECTORIZE_MIN_RECORDS
+    if vectorized:
+        results = list(evaluate_rules(records, scores))
+    else:
+        # One record per call takes the bisect path
+        results = [next(evaluate_rules([record], [score])) for record, score in zip(records, scores)]
+
+    for (record, metric, value), score, (tier, metrics, summary, recs) in zip(cases, scores, results):
+        rows = rows_by_metric(metrics)
+        if metric is not None:
+            assert rows[metric]["interpretation"] == original_interpretation(metric, value), (metric, value)
+        # Every metric present on the record is interpreted as the if-chain did
+        assert rows["Sleep Duration"]["interpretation"] == original_interpretation("Sleep Duration", record.sleep_duration_hr)
+        assert recs == original_recommendations(record), (metric, value)
+        assert tier == original_tier(score)
+        assert summary.startswith(f"Your SleepInsight Score is {score:.1f} ({original_tier(score)}).")
+        assert ("WARNING" in summary) == bool(record.breathing_disturbances_elevated or record.apnea_notification_received)
+
+@pytest.mark.parametrize("vectorized", [False, True])
+def test_vital_rules_at_boundaries(vectorized):
+    records = [make_record(**{field: value}) for field, _, value, _ in VITAL_CASES]
+    records *= -(-VECTORIZE_MIN_RECORDS // len(records)) if vectorized else 1
+    if vectorized:
+        results = list(evaluate_rules(records, [80.0] * len(records)))
+    else:
+        results = [next(evaluate_rules([record], [80.0])) for record in records]
+    for (field, metric, value, expected), (_, metrics, _, _) in zip(VITAL_CASES, results):
+        rows = rows_by_metric(metrics)
+        assert expected in rows[metric]["interpretation"], (field, value)
+        # Missing vitals get no row at all
+        assert set(rows) == {"Sleep Duration", metric, "Overall Performance"}
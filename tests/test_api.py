@@ -0,0 +1,334 @@
+import csv
+import io
+import time
+import joblib
+import pytest
+from fastapi.testclient import TestClient
+import src.main as main
+from benchmarks.synthetic_export import write_synthetic_export
+from src.jobs import JobManager
+from src.model_registry import ModelRegistry
+from src.parse_apple_health import iter_nightly_metrics
+from src.response_cache import ResponseCache
+from src.upload_cache import UploadResultCache
+from src.workers import WorkerPool
+from tests.test_numpy_predictor import fit_small_pipeline
+
+HEADERS = {"X-API-KEY": main.API_KEY}
+PAYLOAD = {
+    "age": 30, "gender": "Male", "sleep_duration_hr": 7.5, "heart_rate": 65.0, "stress_level": 3.0,
+    "rem_percent": 22.0, "deep_percent": 18.0, "awakenings": 1.0, "breathing_disturbances_elevated": False,
+}
+
+@pytest.fixture(scope="module")
+def client():
+    # In-process app with the repo's model, loaded and warmed by the lifespan
+    with TestClient(main.app) as client:
+        client.portal.call(main.wait_until_ready)
+        assert client.get("/readyz").status_code == 200
+        yield client
+
+@pytest.fixture(scope="module")
+def export_bytes(tmp_path_factory):
+    path = tmp_path_factory.mktemp("export") / "export.xml"
+    write_synthetic_export(str(path), nights=5, other_per_night=20)
+    return path.read_bytes()
+
+def wait_for_job(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while True:
+        job = client.get(f"/jobs/{job_id}", headers=HEADERS).json()
+        if job["status"] in ("succeeded", "failed", "cancelled") or time.monotonic() > deadline:
+            return job
+        time.sleep(0.05)
+
+def test_bulk_errors_land_on_their_own_rows(client, monkeypatch):
+    predict = main.predict_scores_async
+
+    async def failing_predict(records, mv):
+        # Rows with this heart rate can't be scored, alone or as part of a chunk
+        if any(r.heart_rate == 99.0 for r in records):
+            raise ValueError("unscorable row")
+        return await predict(records, mv)
+
+    monkeypatch.setattr(main, "predict_scores_async", failing_predict)
+    rows = ["age,gender,sleep_duration_hr,heart_rate", "30,Male,7.5,60", "abc,Male,7.5,60",
+            "40,Female,6.5,70", "50,Male,8.0,99", "35,Female,7.0,55"]
+    r = client.post("/analyze_sleep/bulk?output=csv", headers=HEADERS,
+                    files={"file": ("rows.csv", "\n".join(rows) + "\n", "text/csv")})
+    assert r.status_code == 200
+    results = list(csv.DictReader(io.StringIO(r.text)))
+    assert [int(row["index"]) for row in results] == [0, 1, 2, 3, 4]
+    # The bad row before the failing one shifts chunk positions against scored positions
+    assert results[1]["error"].startswith("Invalid CSV row")
+    assert results[3]["error"] == "Prediction failed: unscorable row"
+    for row in (results[0], results[2], results[4]):
+        assert row["error"] == "" and row["sleep_score"] and row["quality_tier"]
+
+def test_upload_jobs_parse_on_the_parse_pool(client, export_bytes, monkeypatch):
+    monkeypatch.setattr(main, "upload_cache", UploadResultCache())
+    completed = main.parse_pool.completed
+    parse_count = 'sleepinsight_stage_duration_seconds_count{stage="parse"}'
+    parses = metric_samples(client).get(parse_count, 0.0)
+    files = {"file": ("export.xml", export_bytes, "application/xml")}
+    r = client.post("/upload_health/jobs", headers=HEADERS, files=files)
+    assert r.status_code == 202
+    job = wait_for_job(client, r.json()["job_id"])
+    assert job["status"] == "succeeded", job["error"]
+    # Timed once, by the pool
+    assert metric_samples(client)[parse_count] == parses + 1
+    assert job["progress"]["bytes_parsed"] == job["progress"]["total_bytes"] == len(export_bytes)
+    assert job["progress"]["records_seen"] > 0
+    assert main.parse_pool.completed == completed + 1
+
+    # The same export again is answered from the upload cache, and still reports completion
+    cached = wait_for_job(client, client.post("/upload_health/jobs", headers=HEADERS, files=files).json()["job_id"])
+    assert cached["status"] == "succeeded"
+    assert cached["progress"]["bytes_parsed"] == cached["progress"]["total_bytes"]
+    assert cached["result"] == job["result"]
+    assert main.parse_pool.completed == completed + 1
+
+    monkeypatch.setattr(main.model_registry, "active", None)
+    r = client.post("/upload_health/jobs", headers=HEADERS, files=files)
+    assert r.status_code == 503 and r.headers["Retry-After"]
+
+def test_spooled_uploads_are_parsed_in_place(client, tmp_path, monkeypatch):
+    # Big enough for Starlette to roll the upload over to disk
+    path = tmp_path / "large.xml"
+    write_synthetic_export(str(path), nights=40)
+    data = path.read_bytes()
+    assert len(data) > 1 << 20
+
+    def no_copy(*args):
+        raise AssertionError("spooled upload copied again")
+
+    monkeypatch.setattr(main, "spool_to_named_file", no_copy)
+    monkeypatch.setattr(main, "upload_cache", UploadResultCache())
+    r = client.post("/upload_health", headers=HEADERS, files={"file": ("export.xml", data, "application/xml")})
+    assert r.status_code == 200
+    assert int(r.headers["X-Disk-Bytes"]) == int(r.headers["X-Upload-Bytes"]) == len(data)
+    assert int(r.headers["X-Export-Bytes"]) == len(data)
+    assert float(r.headers["X-Peak-Rss-Mb"]) > 0
+
+def test_batch_scores_each_item_on_its_own(client, monkeypatch):
+    items = [PAYLOAD, {**PAYLOAD, "age": "old"}, "not an object", {**PAYLOAD, "heart_rate": 72.0}]
+    r = client.post("/analyze_sleep/batch", headers=HEADERS, json=items)
+    assert r.status_code == 200
+    batch = r.json()
+    assert [item["index"] for item in batch["results"]] == [0, 1, 2, 3]
+    assert (batch["succeeded"], batch["failed"]) == (2, 2)
+    assert batch["results"][1]["error"] and batch["results"][1]["result"] is None
+    assert batch["results"][2]["error"] == "Expected a JSON object"
+    # Scored items match the single-record endpoint
+    for i in (0, 3):
+        single = client.post("/analyze_sleep?use_cache=false", headers=HEADERS, json=items[i]).json()
+        assert batch["results"][i]["error"] is None
+        assert batch["results"][i]["result"]["sleep_score"] == single["sleep_score"]
+
+    assert client.post("/analyze_sleep/batch", headers=HEADERS, json=[]).status_code == 400
+    monkeypatch.setattr(main, "MAX_BATCH_SIZE", 2)
+    assert client.post("/analyze_sleep/batch", headers=HEADERS, json=[PAYLOAD] * 3).status_code == 413
+
+def test_upload_timeline_has_every_night(client, export_bytes, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "upload_cache", UploadResultCache())
+    path = tmp_path / "export.xml"
+    path.write_bytes(export_bytes)
+    expected = list(iter_nightly_metrics(str(path)))
+    r = client.post("/upload_health?all_nights=true", headers=HEADERS,
+                    files={"file": ("export.xml", export_bytes, "application/xml")})
+    assert r.status_code == 200
+    nights = r.json()["nights"]
+    assert len(nights) == len(expected) == 5
+    assert [n["night_start"] for n in nights] == [m["night_start"] for m in expected]
+    assert all(0 <= n["analysis"]["sleep_score"] <= 100 for n in nights)
+
+    r = client.post("/upload_health?all_nights=true", headers=HEADERS,
+                    files={"file": ("rows.csv", "age,gender\n30,Male\n", "text/csv")})
+    assert r.status_code == 400
+
+def test_saturated_inference_pool_sheds_load(client, monkeypatch):
+    pool = WorkerPool("inference", "thread", 1, 0)
+    monkeypatch.setattr(main, "inference_pool", pool)
+    # One request already running and no queue: every new one is turned away
+    pool.in_flight = 1
+    for path, body in (("/analyze_sleep?use_cache=false", PAYLOAD), ("/analyze_sleep/batch", [PAYLOAD])):
+        r = client.post(path, headers=HEADERS, json=body)
+        assert r.status_code == 503, path
+        assert r.headers["Retry-After"] == "5"
+        assert "inference pool is saturated" in r.json()["detail"]
+    assert pool.rejected == 2
+    assert client.get("/stats/workers", headers=HEADERS).json()["inference"]["rejected"] == 2
+
+    pool.in_flight = 0
+    assert client.post("/analyze_sleep?use_cache=false", headers=HEADERS, json=PAYLOAD).status_code == 200
+    pool.shutdown()
+
+def test_response_cache_miss_hit_and_bypass(client, monkeypatch):
+    cache = ResponseCache()
+    monkeypatch.setattr(main, "response_cache", cache)
+    first = client.post("/analyze_sleep", headers=HEADERS, json=PAYLOAD)
+    assert first.status_code == 200 and first.headers["X-Cache"] == "MISS"
+    # Reordered keys and 7 vs 7.0 are the same payload once validated
+    reordered = {**dict(reversed(list(PAYLOAD.items()))), "age": 30.0}
+    second = client.post("/analyze_sleep", headers=HEADERS, json=reordered)
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json() == first.json()
+
+    bypass = client.post("/analyze_sleep?use_cache=false", headers=HEADERS, json=PAYLOAD)
+    assert bypass.headers["X-Cache"] == "BYPASS"
+    assert bypass.json()["sleep_score"] == first.json()["sleep_score"]
+    stats = client.get("/stats/cache").json()["analyze_sleep"]
+    assert (stats["hits"], stats["misses"], stats["bypassed"], stats["size"]) == (1, 1, 1, 1)
+
+    cache.clear()
+    assert client.post("/analyze_sleep", headers=HEADERS, json=PAYLOAD).headers["X-Cache"] == "MISS"
+
+def test_upload_cache_skips_reparsing(client, export_bytes, monkeypatch):
+    monkeypatch.setattr(main, "upload_cache", UploadResultCache())
+    completed = main.parse_pool.completed
+    files = {"file": ("export.xml", export_bytes, "application/xml")}
+    first = client.post("/upload_health", headers=HEADERS, files=files)
+    assert first.status_code == 200 and first.headers["X-Upload-Cache"] == "MISS"
+    second = client.post("/upload_health", headers=HEADERS, files=files)
+    assert second.headers["X-Upload-Cache"] == "HIT"
+    assert second.json() == first.json()
+    assert main.parse_pool.completed == completed + 1
+
+    # The timeline of the same bytes is a different entry
+    timeline = client.post("/upload_health?all_nights=true", headers=HEADERS, files=files)
+    assert timeline.headers["X-Upload-Cache"] == "MISS"
+    stats = client.get("/stats/cache").json()["upload_health"]
+    assert (stats["hits"], stats["misses"]) == (1, 2)
+
+    monkeypatch.setattr(main, "upload_cache", UploadResultCache(max_bytes=0))
+    assert client.post("/upload_health", headers=HEADERS, files=files).headers["X-Upload-Cache"] == "BYPASS"
+
+def test_user_uploads_are_ingested_incrementally(client, export_bytes, tmp_path, monkeypatch):
+    # Fresh process workers, spawned after the ingest database points at tmp_path
+    monkeypatch.setenv("SLEEPINSIGHT_INGEST_DB", str(tmp_path / "ingest.sqlite3"))
+    pool = WorkerPool("parse", "process", 1, 4)
+    monkeypatch.setattr(main, "parse_pool", pool)
+    monkeypatch.setattr(main, "upload_cache", UploadResultCache())
+    files = {"file": ("export.xml", export_bytes, "application/xml")}
+    try:
+        first = client.post("/upload_health?all_nights=true&user_id=alice", headers=HEADERS, files=files)
+        assert first.status_code == 200 and first.headers["X-Upload-Cache"] == "BYPASS"
+        assert (tmp_path / "ingest.sqlite3").exists()
+        # Nothing new the second time: the nights come back from alice's checkpoint
+        second = client.post("/upload_health?all_nights=true&user_id=alice", headers=HEADERS, files=files)
+        assert second.headers["X-Upload-Cache"] == "BYPASS"
+        assert second.json() == first.json()
+        assert len(second.json()["nights"]) == 5
+        assert main.upload_cache.stats()["misses"] == 0
+    finally:
+        pool.shutdown()
+
+def metric_samples(client):
+    r = client.get("/metrics")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for line in r.text.splitlines():
+        if line and not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+def test_metrics_count_requests_and_stages(client):
+    before = metric_samples(client)
+    assert client.post("/analyze_sleep?use_cache=false", headers=HEADERS, json=PAYLOAD).status_code == 200
+    assert client.post("/analyze_sleep", json=PAYLOAD).status_code == 422
+    after = metric_samples(client)
+
+    def added(name):
+        return after.get(name, 0.0) - before.get(name, 0.0)
+
+    route = 'method="POST",route="/analyze_sleep"'
+    assert added(f'sleepinsight_requests_total{{{route},status="200"}}') == 1
+    assert added(f'sleepinsight_requests_total{{{route},status="422"}}') == 1
+    assert added(f'sleepinsight_request_errors_total{{{route},status="422"}}') == 1
+    assert added(f'sleepinsight_request_duration_seconds_count{{{route}}}') == 2
+    for stage in ("validate", "predict", "predict_queue_wait", "analysis"):
+        assert added(f'sleepinsight_stage_duration_seconds_count{{stage="{stage}"}}') >= 1, stage
+    assert after[f'sleepinsight_stage_duration_seconds_bucket{{stage="predict",le="+Inf"}}'] == after['sleepinsight_stage_duration_seconds_count{stage="predict"}']
+
+def test_model_versions_hot_swap(client, tmp_path, monkeypatch):
+    model_path = tmp_path / "model.pkl"
+    joblib.dump(fit_small_pipeline(seed=1), model_path)
+    registry = ModelRegistry(str(model_path), snapshot_dir=str(tmp_path / "snapshots"))
+    monkeypatch.setattr(main, "model_registry", registry)
+    v1 = registry.check_for_update().version
+
+    def score(query=""):
+        r = client.post(f"/analyze_sleep?use_cache=false{query}", headers=HEADERS, json=PAYLOAD)
+        assert r.status_code == 200, r.text
+        return r.headers["X-Model-Version"], r.json()["sleep_score"]
+
+    served, first = score()
+    assert served == v1
+    # A new artifact at the same path replaces the active version on reload
+    joblib.dump(fit_small_pipeline(seed=2), model_path)
+    models = client.post("/models/reload", headers=HEADERS).json()
+    v2 = models["active"]
+    assert v2 != v1 and [v["version"] for v in models["warm"]] == [v1, v2]
+    assert score()[0] == v2
+    # The previous version stays addressable, and answers as it did before the swap
+    assert score(f"&model_version={v1}") == (v1, first)
+
+    assert client.post(f"/models/{v1}/activate", headers=HEADERS).json()["active"] == v1
+    assert score() == (v1, first)
+    assert client.get("/models", headers=HEADERS).json()["active"] == v1
+    assert client.post("/analyze_sleep?model_version=missing", headers=HEADERS, json=PAYLOAD).status_code == 404
+    assert client.post("/models/missing/activate", headers=HEADERS).status_code == 404
+
+def test_pre_encoded_responses_are_byte_identical(client, monkeypatch):
+    requests = [
+        ("/analyze_sleep?use_cache=false", PAYLOAD),
+        ("/analyze_sleep", PAYLOAD),  # MISS
+        ("/analyze_sleep", PAYLOAD),  # HIT, from the encoded body when pre-encoding
+        ("/analyze_sleep?use_cache=false&explain=true", PAYLOAD),
+        ("/analyze_sleep/batch", [PAYLOAD, {**PAYLOAD, "age": "old"}, {**PAYLOAD, "stress_level": 8.0}]),
+        ("/analyze_sleep/batch?explain=true", [PAYLOAD]),
+    ]
+    responses = {}
+    for fast in (False, True):
+        monkeypatch.setattr(main, "FAST_RESPONSES", fast)
+        monkeypatch.setattr(main, "response_cache", ResponseCache())
+        responses[fast] = [client.post(path, headers=HEADERS, json=body) for path, body in requests]
+
+    for (path, _), plain, fast in zip(requests, responses[False], responses[True]):
+        assert plain.status_code == fast.status_code == 200, path
+        assert fast.content == plain.content, path
+        for header in ("content-type", "X-Model-Version", "X-Cache"):
+            assert fast.headers.get(header) == plain.headers.get(header), (path, header)
+    assert [r.headers.get("X-Cache") for r in responses[True][:3]] == ["BYPASS", "MISS", "HIT"]
+
+def test_readyz_waits_for_the_model(tmp_path, monkeypatch):
+    # A lifespan of its own, starting with no model artifact; pools and jobs are fresh so
+    # its shutdown doesn't touch the module's client
+    model_path = tmp_path / "model.pkl"
+    monkeypatch.setattr(main, "model_registry", ModelRegistry(str(model_path)))
+    monkeypatch.setattr(main, "startup", main.StartupState())
+    monkeypatch.setattr(main, "STARTUP_RETRY_SECONDS", 0.05)
+    monkeypatch.setattr(main, "parse_pool", WorkerPool("parse", "thread", 1, 0))
+    monkeypatch.setattr(main, "inference_pool", WorkerPool("inference", "thread", 1, 4))
+    monkeypatch.setattr(main, "upload_jobs", JobManager(main.run_upload_job))
+    with TestClient(main.app) as client:
+        assert client.get("/livez").status_code == 200
+        deadline = time.monotonic() + 10
+        while main.startup.phase != "failed" and time.monotonic() < deadline:
+            time.sleep(0.01)
+        r = client.get("/readyz")
+        assert r.status_code == 503
+        assert r.json()["phase"] == "failed" and "No model found" in r.json()["error"]
+        r = client.post("/analyze_sleep", headers=HEADERS, json=PAYLOAD)
+        assert r.status_code == 503 and r.headers["Retry-After"] == "5"
+        assert client.get("/livez").status_code == 200
+
+        # The artifact shows up: the retry loop loads it, warms up and reports ready
+        joblib.dump(fit_small_pipeline(), model_path)
+        assert client.portal.call(main.wait_until_ready, 30)
+        r = client.get("/readyz")
+        assert r.status_code == 200
+        assert r.json()["phase"] == "ready" and r.json()["error"] is None
+        assert {"loading", "failed", "warming", "ready"} <= set(r.json()["timings"])
+        assert client.post("/analyze_sleep", headers=HEADERS, json=PAYLOAD).status_code == 200
@@ -0,0 +1,41 @@
+import shutil
+import joblib
+import numpy as np
+import pandas as pd
+from benchmarks.synthetic_export import write_synthetic_export
+from src.batch_rescore import rescore
+from src.parse_apple_health import iter_nightly_metrics
+from src.serving_model import compile_pipeline
+from tests.test_numpy_predictor import fit_small_pipeline
+
+def test_rescore_matches_parse_and_resumes(tmp_path):
+    # A freshly fitted pipeline, so the test never depends on the trained artifact
+    pipeline = fit_small_pipeline()
+    model_path = str(tmp_path / "model.pkl")
+    joblib.dump(pipeline, model_path)
+
+    archive = tmp_path / "archive"
+    archive.mkdir()
+    write_synthetic_export(str(archive / "a.xml"), nights=20, seed=1)
+    write_synthetic_export(str(archive / "b.xml"), nights=15, seed=2)
+    shutil.copyfile(archive / "a.xml", archive / "copy_of_a.xml")
+    output = str(tmp_path / "scores.npz")
+
+    summary = rescore(str(archive), output, model_path, workers=1, batch_rows=10)
+    assert (summary["parsed"], summary["duplicates"], summary["rows"]) == (2, 1, 35)
+    with np.load(output) as out:
+        mask = out["path"] == "a.xml"
+        expected = list(iter_nightly_metrics(str(archive / "a.xml")))
+        assert list(out["night_start"][mask]) == [m["night_start"] for m in expected]
+        model = compile_pipeline(joblib.load(model_path))
+        numeric = np.array([[m[f] for f in model.numeric_features] for m in expected], dtype=np.float64)
+        scores = np.clip(model.predict_arrays(numeric, [m["gender"] for m in expected]), 0, 100)
+        np.testing.assert_allclose(out["sleep_score"][mask], scores, rtol=0, atol=1e-9)
+        # and the same scores as the sklearn pipeline itself
+        frame = pd.DataFrame(expected)[list(pipeline.feature_names_in_)]
+        np.testing.assert_allclose(out["sleep_score"][mask], np.clip(pipeline.predict(frame), 0, 100), rtol=0, atol=1e-9)
+
+    # A second run only parses what's new
+    write_synthetic_export(str(archive / "c.xml"), nights=5, seed=3)
+    summary = rescore(str(archive), output, model_path, workers=1, batch_rows=10)
+    assert (summary["skipped"], summary["parsed"], summary["rows"]) == (3, 1, 40)
@@ -0,0 +1,54 @@
+import numpy as np
+from src.night_signals import RESTING_WINDOW, SignalSketch
+
+def test_sketch_matches_exact_summaries():
+    rng = np.random.default_rng(0)
+    times = np.sort(rng.uniform(0, 8 * 3600, 500))
+    values = rng.integers(45, 110, 500).astype(np.float64)
+
+    whole = SignalSketch(19.5, 250.5, 1.0, window=RESTING_WINDOW)
+    whole.add(times, values)
+    # Folding the same samples in as several chunks gives the same state
+    chunked = SignalSketch(19.5, 250.5, 1.0, window=RESTING_WINDOW)
+    for part in np.array_split(np.arange(500), 7):
+        chunked.add(times[part], values[part])
+
+    windows = np.floor(times / RESTING_WINDOW)
+    resting = min(values[windows == w].mean() for w in np.unique(windows))
+    for sketch in (whole, chunked):
+        assert sketch.min == values.min() and sketch.max == values.max()
+        assert sketch.quantile(0.5) == np.percentile(values, 50, method='inverted_cdf')
+        assert sketch.quantile(0.9) == np.percentile(values, 90, method='inverted_cdf')
+        assert np.isclose(sketch.resting(), resting)
+
+def test_buckets_keep_exact_night_summaries(monkeypatch):
+    import src.night_signals as night_signals
+    from src.night_signals import BUCKET_SECONDS, SignalBuckets
+
+    rng = np.random.default_rng(1)
+    times = np.sort(rng.uniform(0, 8 * 3600, 5000))
+    values = rng.integers(45, 110, 5000).astype(np.float64)
+    # A small buffer, so samples are folded in many steps, and out of order like a real export
+    monkeypatch.setattr(night_signals, "BUCKET_BUFFER", 64)
+    buckets = SignalBuckets()
+    for i in rng.permutation(5000):
+        buckets.add(times[i], values[i])
+    assert len(buckets) == len(np.unique(np.floor(times / BUCKET_SECONDS)))
+
+    # Edges inside a minute: the partial minutes come from the raw samples
+    start, end = 3617.0, 7 * 3600.0 - 23
+    bucket, count, total, low, high = buckets.window(start, end)
+    inside = (times >= start) & (times <= end)
+    assert np.all(np.diff(bucket) >= 0)
+    assert count.sum() == inside.sum()
+    assert np.isclose(total.sum(), values[inside].sum())
+    assert low.min() == values[inside].min() and high.max() == values[inside].max()
+    # A window within one minute is read from the raw samples only
+    assert buckets.window(times[10], times[10])[2].tolist() == values[times == times[10]].tolist()
+
+    sketch = SignalSketch(19.5, 250.5, 1.0, window=RESTING_WINDOW)
+    sketch.add_buckets(bucket, count, total, low, high)
+    windows = np.floor(times[inside] / RESTING_WINDOW)
+    resting = min(values[inside][windows == w].mean() for w in np.unique(windows))
+    assert np.isclose(sketch.resting(), resting)
+    assert np.isclose(sketch.mean(), values[inside].mean())
@@ -0,0 +1,85 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+from types import SimpleNamespace
+from sklearn.ensemble import RandomForestRegressor
+from src.serving_model import compile_pipeline, explainer_for
+from src.train_model import build_pipeline
+
+MODEL_PATH = "models/sleep_model_pipeline.pkl"
+
+def make_inputs(n: int, seed: int = 0) -> pd.DataFrame:
+    # Random payloads including missing values and genders the encoder never saw
+    rng = np.random.default_rng(seed)
+
+    def with_missing(values):
+        values[rng.random(n) < 0.2] = np.nan
+        return values
+
+    return pd.DataFrame({
+        "age": rng.integers(18, 80, n),
+        "gender": rng.choice(["Male", "Female", "Other", None], n),
+        "sleep_duration_hr": rng.uniform(3, 11, n),
+        "heart_rate": with_missing(rng.uniform(45, 100, n)),
+        "stress_level": with_missing(rng.uniform(0, 10, n)),
+        "rem_percent": with_missing(rng.uniform(5, 40, n)),
+        "deep_percent": with_missing(rng.uniform(5, 40, n)),
+        "awakenings": with_missing(rng.uniform(0, 6, n)),
+    })
+
+def fit_small_pipeline(seed: int = 0):
+    # Same preprocessing as the production model, with a small forest on random inputs, so
+    # the tests don't depend on the trained artifact being present
+    frame = make_inputs(400, seed=seed)
+    target = (50 + 4 * frame["sleep_duration_hr"] - 0.2 * frame["heart_rate"].fillna(65)
+              - 1.5 * frame["stress_level"].fillna(3) + (frame["gender"] == "Female") * 2)
+    pipeline = build_pipeline(RandomForestRegressor(n_estimators=12, max_depth=6, random_state=seed))
+    return pipeline.fit(frame, target)
+
+@pytest.fixture(scope="module", params=["fitted", "trained"])
+def pipeline(request):
+    if request.param == "fitted":
+        return fit_small_pipeline()
+    if not os.path.exists(MODEL_PATH):
+        pytest.skip(f"{MODEL_PATH} not found")
+    return joblib.load(MODEL_PATH)
+
+def test_numpy_predictor_matches_sklearn(pipeline):
+    compiled = compile_pipeline(pipeline)
+    frame = make_inputs(2000)
+    expected = pipeline.predict(frame)
+
+    # DataFrame entry point
+    np.testing.assert_allclose(compiled.predict(frame), expected, rtol=0, atol=1e-9)
+
+    # Record entry point used by the API (attribute access, None for missing values)
+    records = [
+        SimpleNamespace(**{k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()})
+        for row in frame.to_dict("records")
+    ]
+    np.testing.assert_allclose(compiled.predict_records(records), expected, rtol=0, atol=1e-9)
+    np.testing.assert_allclose(compiled.predict_records(records[:1]), expected[:1], rtol=0, atol=1e-9)
+
+def test_explanations_add_up_to_predictions(pipeline):
+    compiled = compile_pipeline(pipeline)
+    frame = make_inputs(500, seed=1)
+    numeric = frame[compiled.numeric_features].astype(np.float64).to_numpy()
+    contributions = compiled.explain_arrays(numeric, frame[compiled.categorical_feature].tolist())
+
+    assert contributions.shape == (len(frame), len(compiled.input_features))
+    np.testing.assert_allclose(compiled.base_value + contributions.sum(axis=1), pipeline.predict(frame), rtol=0, atol=1e-9)
+
+    # Record entry point, through the pipeline's cached compiled copy
+    records = [
+        SimpleNamespace(**{k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in row.items()})
+        for row in frame.to_dict("records")
+    ]
+    assert explainer_for(pipeline) is explainer_for(pipeline)
+    np.testing.assert_allclose(explainer_for(pipeline).explain_records(records), contributions, rtol=0, atol=1e-9)
+
+if __name__ == "__main__":
+    for model in (fit_small_pipeline(), joblib.load(MODEL_PATH)):
+        test_numpy_predictor_matches_sklearn(model)
+        test_explanations_add_up_to_predictions(model)
@@ -0,0 +1,97 @@
+import random
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+import pytest
+import src.night_signals as night_signals
+from benchmarks.synthetic_export import HEADER, HEART_RATE, SLEEP, _fmt, write_synthetic_export
+from src.parse_apple_health import collect_samples, iter_nightly_metrics, parse_health_data
+
+def columns(samples):
+    return (samples.user_info, samples.stage_names, list(samples.sleep_stage), list(samples.sleep_start),
+            list(samples.sleep_end), list(samples.sleep_start_offset), list(samples.sleep_end_offset),
+            {kind: [column.tolist() for column in buckets.columns()] for kind, buckets in samples.signals.items()})
+
+def test_fast_engine_matches_etree(tmp_path):
+    # Same synthetic export through both engines: sleep stages, heart-rate and vital
+    # aggregates must match exactly, and the activity records (steps, energy, distance, ...)
+    # that surround them must be skipped by both
+    path = str(tmp_path / "export.xml")
+    write_synthetic_export(path, nights=25, other_per_night=60)
+
+    seen = {"fast": [], "etree": []}
+    fast = collect_samples(path, "fast", progress=seen["fast"].append)
+    etree = collect_samples(path, "etree", progress=seen["etree"].append)
+    assert columns(fast) == columns(etree)
+    assert len(fast.sleep_start) > 0 and all(len(buckets) for buckets in fast.signals.values())
+    # Every Record, activity included, is counted as scanned by both
+    with open(path, "rb") as f:
+        assert seen["fast"][-1] == seen["etree"][-1] == f.read().count(b"<Record ")
+
+    nights = list(iter_nightly_metrics(path, engine="fast"))
+    assert len(nights) == 25
+    assert nights == list(iter_nightly_metrics(path, engine="etree"))
+    assert all(n["heart_rate_p50"] is not None and n["respiratory_rate"] is not None for n in nights)
+    assert parse_health_data(path, engine="fast") == parse_health_data(path, engine="etree")
+
+    # Records before `since` are dropped the same way
+    since = fast.sleep_start[len(fast.sleep_start) // 2]
+    assert columns(collect_samples(path, "fast", since=since)) == columns(collect_samples(path, "etree", since=since))
+
+def write_edge_export(path, nights=4):
+    # Sleep records that start and end off the minute, with heart-rate samples seconds
+    # either side of every edge. Heart rate comes first, as in a real export, where records
+    # are grouped by type.
+    rng = random.Random(7)
+    heart_rate, sleep = [], []
+    for night in range(nights):
+        start = datetime(2022, 1, 1, 23, 0, 17) + timedelta(days=night, seconds=night * 7)
+        t = start
+        for stage, seconds in (("AsleepCore", 3613), ("AsleepDeep", 2729), ("AsleepREM", 1841)):
+            end = t + timedelta(seconds=seconds)
+            sleep.append(SLEEP.format(s=_fmt(t), e=_fmt(end), stage=stage))
+            t = end
+        times = [start + timedelta(seconds=s) for s in range(-600, int((t - start).total_seconds()) + 600, 37)]
+        times += [edge + timedelta(seconds=s) for edge in (start, t) for s in (-2, -1, 0, 1, 2)]
+        heart_rate += [HEART_RATE.format(t=_fmt(time), v=rng.randint(45, 110)) for time in sorted(times)]
+    with open(path, "w") as f:
+        f.write(HEADER.format(export_date=_fmt(datetime(2022, 2, 1))))
+        f.write("".join(heart_rate) + "".join(sleep) + "</HealthData>\n")
+
+def baseline_heart_rates(path):
+    # The original parser's selection: the samples with window start <= time <= window end,
+    # for the latest night (the 14 hours before the last sleep record ends) and for each night
+    parse = lambda value: datetime.strptime(value, "%Y-%m-%d %H:%M:%S %z")
+    records, rates = [], []
+    for _, elem in ET.iterparse(path):
+        if elem.tag == "Record" and elem.get("type") == "HKCategoryTypeIdentifierSleepAnalysis":
+            records.append((parse(elem.get("startDate")), parse(elem.get("endDate"))))
+        elif elem.tag == "Record" and elem.get("type") == "HKQuantityTypeIdentifierHeartRate":
+            rates.append((parse(elem.get("startDate")), float(elem.get("value"))))
+    records.sort()
+    latest_end = records[-1][1]
+    windows = [(latest_end - timedelta(hours=14), latest_end)]
+    night = [records[0]]
+    for record in records[1:] + [None]:
+        if record is None or (record[0] - max(end for _, end in night)).total_seconds() > 4 * 3600:
+            windows.append((night[0][0], max(end for _, end in night)))
+            night = [record]
+        else:
+            night.append(record)
+    return [[value for time, value in rates if start <= time <= end] for start, end in windows]
+
+@pytest.mark.parametrize("engine", ["fast", "etree"])
+def test_night_windows_select_samples_exactly(tmp_path, monkeypatch, engine):
+    path = str(tmp_path / "export.xml")
+    write_edge_export(path)
+    # A small buffer, so most samples are read back from spilled runs
+    monkeypatch.setattr(night_signals, "BUCKET_BUFFER", 64)
+    latest, *nights = baseline_heart_rates(path)
+
+    metrics = parse_health_data(path, engine=engine)
+    assert metrics["heart_rate"] == round(sum(latest) / len(latest), 1)
+    assert metrics["heart_rate_min"] == min(latest)
+    timeline = list(iter_nightly_metrics(path, engine=engine))
+    assert len(timeline) == len(nights) == 4
+    for night, rates in zip(timeline, nights):
+        assert night["heart_rate"] == round(sum(rates) / len(rates), 1)
+        assert night["heart_rate_min"] == min(rates)
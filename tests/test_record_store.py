@@ -0,0 +1,34 @@
+from benchmarks.synthetic_export import write_synthetic_export
+from src.parse_apple_health import ParseCheckpoint, _nights, _sleep_records, iter_nightly_metrics
+from src.record_store import RecordStore
+from tests.test_parser_engines import write_edge_export
+
+def test_record_store_matches_parse(tmp_path):
+    path = str(tmp_path / "export.xml")
+    write_synthetic_export(path, nights=70)
+    store = RecordStore(str(tmp_path / "records"))
+
+    expected = list(iter_nightly_metrics(path, on_samples=lambda samples, since: store.write("user", samples, since)))
+    assert len(store._months("user")) > 1
+    assert store.query_nights("user") == expected
+
+    # A range query over whole nights returns exactly those nights
+    samples = store.query("user")
+    starts = [start for start, _ in _nights(samples, _sleep_records(samples))]
+    start, end = starts[20], starts[40]
+    assert store.query_nights("user", start, end) == expected[20:40]
+
+    # An incremental write replaces only the records from `since` on
+    incremental = RecordStore(str(tmp_path / "incremental"))
+    incremental.write("user", store.query("user", None, start))
+    checkpoint = ParseCheckpoint(latest_end=start)
+    list(iter_nightly_metrics(path, checkpoint=checkpoint, on_samples=lambda samples, since: incremental.write("user", samples, since)))
+    assert incremental.query_nights("user") == expected
+
+def test_stored_nights_keep_exact_edges(tmp_path):
+    # Nights that start and end off the minute re-analyze from the store as parsed
+    path = str(tmp_path / "export.xml")
+    write_edge_export(path)
+    store = RecordStore(str(tmp_path / "records"))
+    expected = list(iter_nightly_metrics(path, on_samples=lambda samples, since: store.write("user", samples, since)))
+    assert store.query_nights("user") == expected
@@ -0,0 +1,32 @@
+from benchmarks.synthetic_export import write_synthetic_export
+import src.fast_health_parser as fast_health_parser
+from src.fast_health_parser import parse_export_fast, parse_export_sharded, shard_ranges
+from src.parse_apple_health import iter_nightly_metrics, parse_health_data
+
+def columns(samples):
+    return (samples.user_info, samples.stage_names, list(samples.sleep_stage), list(samples.sleep_start),
+            list(samples.sleep_end), list(samples.sleep_start_offset), list(samples.sleep_end_offset),
+            *(column.tolist() for buckets in samples.signals.values() for column in buckets.columns()))
+
+def test_sharded_parse_matches_sequential(tmp_path, monkeypatch):
+    path = str(tmp_path / "export.xml")
+    write_synthetic_export(path, nights=40)
+    # Small shards so the test export splits into several
+    monkeypatch.setattr(fast_health_parser, "MIN_SHARD_BYTES", 64 << 10)
+
+    ranges = shard_ranges(path, 4)
+    assert len(ranges) == 4
+    with open(path, "rb") as f:
+        data = f.read()
+    assert all(data[start:start + 8] == b"<Record " for start, _ in ranges[1:])
+
+    sequential, sharded = [], []
+    expected = parse_export_fast(path, progress=sequential.append)
+    assert columns(parse_export_sharded(path, 4, progress=sharded.append)) == columns(expected)
+    assert sharded[-1] == sequential[-1]
+
+    since = expected.sleep_start[len(expected.sleep_start) // 2]
+    assert columns(parse_export_sharded(path, 3, since=since)) == columns(parse_export_fast(path, since=since))
+
+    assert parse_health_data(path, workers=4) == parse_health_data(path, workers=1)
+    assert list(iter_nightly_metrics(path, workers=4)) == list(iter_nightly_metrics(path, workers=1))
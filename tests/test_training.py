@@ -0,0 +1,26 @@
+import os
+import pytest
+import src.training as training
+from src.training import choose_production, promote
+
+def candidate(name, mae, latency):
+    c = {"model": name, "holdout_mae": mae, "latency_b1_ms": latency, "artifact_bytes": 1000, "path": f"{name}.pkl"}
+    if name == "random_forest":
+        c["serving_dir"] = f"{name}_serving"
+    return c
+
+def test_only_exportable_candidates_are_selected():
+    forest = candidate("random_forest", 5.0, 2.0)
+    # More accurate and faster, but it has no serving export
+    xgb = candidate("xgboost", 4.0, 0.5)
+    assert choose_production([forest, xgb]) is forest
+    assert choose_production([xgb]) is None
+
+def test_promote_refuses_models_without_serving_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(training, "PRODUCTION_MODEL_PATH", str(tmp_path / "model.pkl"))
+    monkeypatch.setattr(training, "PRODUCTION_SERVING_DIR", str(tmp_path / "serving"))
+    for selected in (candidate("xgboost", 4.0, 0.5), None):
+        with pytest.raises(SystemExit) as exc:
+            promote(selected)
+        assert exc.value.code != 0
+    assert not os.listdir(tmp_path)